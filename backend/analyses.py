@@ -0,0 +1,665 @@
+"""Analyses of a month: upload analysis, its caches and locks, charts payloads and recompute"""
+from __future__ import annotations
+from fastapi import HTTPException
+import bson
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+import os
+import logging
+from typing import Optional, Dict, Any
+import uuid
+from datetime import datetime, timedelta, timezone
+import asyncio
+import json
+import gzip
+import hashlib
+import collections
+import contextlib
+import email.utils
+import time
+import database
+from database import MONGO_CURSOR_BATCH_SIZE
+from models import ReportAnalysis
+from parsing import (COLUMNAR_CACHE, PARSER_VERSION, aggregate_columnar_report, aggregate_report_data, apply_meta,
+                     charts_or_mock, columnar_cache_path, columnar_job, columnar_target, discard_spooled_rows,
+                     no_bad_rows, performance_vs_meta, prepare_for_mongo, run_parser_job)
+from rollups import (apply_history, build_month_rollup, load_month_rollups, month_key, parse_month_year,
+                     save_month_rollup, shift_month, store_facts)
+from storage import INLINE_REPORT_MAX_BYTES, load_report_data, store_raw_report, store_report_rows, store_spooled_rows
+from tracing import count, stage
+# Meta config cache
+# The latest MetaConfig is served from memory for META_CACHE_TTL seconds. Writes bump a version
+# stamp in cache_versions; every META_CACHE_CHECK_INTERVAL seconds a cached value is checked
+# against it so other uvicorn workers pick up a new meta without waiting for the TTL.
+META_CACHE_TTL = float(os.environ.get('META_CACHE_TTL', '300'))
+META_CACHE_CHECK_INTERVAL = float(os.environ.get('META_CACHE_CHECK_INTERVAL', '5'))
+_meta_cache = {"value": None, "version": None, "expires_at": 0.0, "checked_at": 0.0}
+meta_cache_stats = {"hits": 0, "misses": 0, "version_checks": 0, "invalidations": 0}
+async def _meta_version() -> int:
+    stamp = await database.db.cache_versions.find_one({"_id": "meta_configs"})
+    return stamp["version"] if stamp else 0
+async def _bump_meta_version() -> int:
+    stamp = await database.db.cache_versions.find_one_and_update(
+        {"_id": "meta_configs"}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return stamp["version"]
+def _cache_meta(meta_doc: Dict[str, Any], version: int):
+    now = time.monotonic()
+    _meta_cache.update(value=meta_doc, version=version, expires_at=now + META_CACHE_TTL, checked_at=now)
+async def publish_meta(meta_doc: Dict[str, Any]):
+    """Write-through of a new MetaConfig: this worker serves it at once, the others see the new version stamp"""
+    invalidate_meta_cache()
+    version = await _bump_meta_version()
+    _cache_meta({k: v for k, v in meta_doc.items() if k != '_id'}, version)
+def invalidate_meta_cache():
+    _meta_cache.update(value=None, version=None, expires_at=0.0, checked_at=0.0)
+async def load_current_meta() -> Dict[str, Any]:
+    """Current meta configuration, served from the in-process cache when it is still valid"""
+    now = time.monotonic()
+    if _meta_cache["value"] is not None and now < _meta_cache["expires_at"]:
+        if now - _meta_cache["checked_at"] < META_CACHE_CHECK_INTERVAL:
+            meta_cache_stats["hits"] += 1
+            return dict(_meta_cache["value"])
+        meta_cache_stats["version_checks"] += 1
+        _meta_cache["checked_at"] = now
+        if await _meta_version() == _meta_cache["version"]:
+            meta_cache_stats["hits"] += 1
+            return dict(_meta_cache["value"])
+        meta_cache_stats["invalidations"] += 1
+    meta_cache_stats["misses"] += 1
+    # Read the stamp before the query: a concurrent write then shows up at the next check
+    version = await _meta_version()
+    meta = await database.db.meta_configs.find().sort("created_at", -1).limit(1).to_list(1)
+    if meta:
+        # Remove _id field from MongoDB document to avoid serialization issues
+        meta_doc = meta[0]
+        if '_id' in meta_doc:
+            del meta_doc['_id']
+    else:
+        meta_doc = {"meta_value": 2200000.0}  # Default meta
+    _cache_meta(meta_doc, version)
+    return dict(meta_doc)
+async def current_meta_value() -> float:
+    return (await load_current_meta()).get("meta_value", 2200000.0)
+# Month locks
+# One upload (or import) of a month_year is analyzed at a time; a concurrent upload of the same month waits
+# and then finds the finished analysis through the upload result cache when its files are identical.
+# Locks are keyed by the normalized month, so "01/2025" and "2025-01" exclude each other.
+# "mongo" also takes a lease in month_locks so uvicorn workers and hosts exclude each other; it is
+# renewed while held, and a lease left by a dead worker expires after MONTH_LOCK_LEASE_SECONDS.
+# "local" locks within this process only, "off" disables the lock.
+MONTH_LOCK = os.environ.get('MONTH_LOCK', 'mongo')
+MONTH_LOCK_LEASE_SECONDS = int(os.environ.get('MONTH_LOCK_LEASE_SECONDS', '60'))
+MONTH_LOCK_TIMEOUT_SECONDS = int(os.environ.get('MONTH_LOCK_TIMEOUT_SECONDS', '600'))
+MONTH_LOCK_POLL_SECONDS = float(os.environ.get('MONTH_LOCK_POLL_SECONDS', '0.5'))
+# Retry-After of an upload turned away, here by a month still locked and by upload admission in server.py
+UPLOAD_RETRY_AFTER_SECONDS = int(os.environ.get('UPLOAD_RETRY_AFTER_SECONDS', '10'))
+# month_year -> [lock, holders and waiters]; an entry is dropped when nobody uses it
+_month_locks = {}
+def month_lock_timeout(month_year: str) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=f"Outro envio de {month_year} ainda está em processamento; tente novamente",
+        headers={"Retry-After": str(UPLOAD_RETRY_AFTER_SECONDS)}
+    )
+async def acquire_month_lease(month_year: str, deadline: float) -> str:
+    """Take the month_locks lease of a month, polling while another worker holds it; returns the owner token"""
+    owner = uuid.uuid4().hex
+    while True:
+        now = datetime.now(timezone.utc)
+        lease = {"owner": owner, "acquired_at": now, "expires_at": now + timedelta(seconds=MONTH_LOCK_LEASE_SECONDS)}
+        try:
+            await database.db.month_locks.insert_one({"_id": month_year, **lease})
+            return owner
+        except DuplicateKeyError:
+            # Held, unless the lease ran out (its worker died mid-upload)
+            if await database.db.month_locks.find_one_and_update({"_id": month_year, "expires_at": {"$lt": now}}, {"$set": lease}):
+                return owner
+        if time.monotonic() >= deadline:
+            raise month_lock_timeout(month_year)
+        await asyncio.sleep(MONTH_LOCK_POLL_SECONDS)
+async def _renew_month_lease(month_year: str, owner: str):
+    while True:
+        await asyncio.sleep(MONTH_LOCK_LEASE_SECONDS / 3)
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=MONTH_LOCK_LEASE_SECONDS)
+        try:
+            await database.db.month_locks.update_one({"_id": month_year, "owner": owner}, {"$set": {"expires_at": expires_at}})
+        except Exception as e:
+            logging.warning(f"Could not renew the lock of {month_year}: {str(e)}")
+@contextlib.asynccontextmanager
+async def month_lock(month_year: str):
+    """Hold the processing lock of a month (see MONTH_LOCK); 429 after waiting MONTH_LOCK_TIMEOUT_SECONDS"""
+    if MONTH_LOCK == 'off':
+        yield
+        return
+    month_year = month_key(month_year)
+    deadline = time.monotonic() + MONTH_LOCK_TIMEOUT_SECONDS
+    entry = _month_locks.setdefault(month_year, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        try:
+            await asyncio.wait_for(entry[0].acquire(), MONTH_LOCK_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise month_lock_timeout(month_year)
+        try:
+            if MONTH_LOCK != 'mongo':
+                yield
+                return
+            owner = await acquire_month_lease(month_year, deadline)
+            renew = asyncio.get_running_loop().create_task(_renew_month_lease(month_year, owner))
+            try:
+                yield
+            finally:
+                renew.cancel()
+                await database.db.month_locks.delete_one({"_id": month_year, "owner": owner})
+        finally:
+            entry[0].release()
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _month_locks[month_year]
+# Charts payload
+# The dashboard fields of an analysis are serialized and compressed once, when the analysis is
+# created, and served as-is with a strong ETag derived from the body. Analyses only change through
+# recompute, which rebuilds the payload and bumps the "analysis_charts" stamp in cache_versions;
+# every META_CACHE_CHECK_INTERVAL seconds the LRU is checked against it, so other workers drop theirs.
+try:
+    import orjson
+except ImportError:  # Optional: stdlib json is used instead
+    orjson = None
+try:
+    import brotli
+except ImportError:  # Optional: only gzip is offered
+    brotli = None
+CHARTS_PAYLOAD_FIELDS = ["id", "month_year", "created_at", "charts_data", "ai_analysis"]
+CHARTS_GZIP_LEVEL = int(os.environ.get('CHARTS_GZIP_LEVEL', '9'))
+CHARTS_BROTLI_QUALITY = int(os.environ.get('CHARTS_BROTLI_QUALITY', '11'))
+# Hot analyses kept in process memory, least recently used evicted first
+CHARTS_CACHE_SIZE = int(os.environ.get('CHARTS_CACHE_SIZE', '128'))
+_charts_cache = collections.OrderedDict()
+_charts_cache_version = {"version": None, "checked_at": 0.0}
+charts_cache_stats = {"hits": 0, "misses": 0, "builds": 0, "meta_rebuilds": 0, "evictions": 0, "not_modified": 0, "invalidations": 0}
+def dumps_json(data: Any) -> bytes:
+    """Compact UTF-8 JSON, through orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=str, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+def build_charts_payload(analysis: Dict[str, Any], meta_value: Optional[float] = None) -> Dict[str, Any]:
+    """Serialize the dashboard fields of a stored analysis and compress them with every available coding.
+
+    With meta_value the meta-dependent fields are derived for it first (see apply_meta)
+    and the payload remembers it, so load_charts_payload can tell when the meta changed.
+    """
+    fields = {field: analysis.get(field) for field in CHARTS_PAYLOAD_FIELDS}
+    if meta_value is not None and fields["charts_data"] is not None:
+        fields["charts_data"] = apply_meta(dict(fields["charts_data"]), meta_value)
+    body = dumps_json(fields)
+    payload = {
+        "_id": analysis["id"],
+        "meta_value": meta_value,
+        "etag": hashlib.sha256(body).hexdigest()[:32],
+        "size": len(body),
+        "gzip": gzip.compress(body, compresslevel=CHARTS_GZIP_LEVEL, mtime=0),
+        "generated_at": datetime.now(timezone.utc).replace(microsecond=0)
+    }
+    if brotli is not None:
+        payload["br"] = brotli.compress(body, quality=CHARTS_BROTLI_QUALITY)
+    return payload
+def cache_charts_payload(payload: Dict[str, Any]):
+    _charts_cache[payload["_id"]] = payload
+    _charts_cache.move_to_end(payload["_id"])
+    while len(_charts_cache) > CHARTS_CACHE_SIZE:
+        _charts_cache.popitem(last=False)
+        charts_cache_stats["evictions"] += 1
+def invalidate_charts_cache():
+    _charts_cache.clear()
+    _charts_cache_version.update(version=None, checked_at=0.0)
+async def store_charts_payload(analysis: Dict[str, Any], meta_value: Optional[float] = None) -> Dict[str, Any]:
+    if meta_value is None:
+        meta_value = await current_meta_value()
+    payload = await run_parser_job(build_charts_payload, analysis, meta_value)
+    await database.db.analysis_charts.replace_one({"_id": payload["_id"]}, payload, upsert=True)
+    cache_charts_payload(payload)
+    return payload
+async def _check_charts_cache():
+    """Drop the charts LRU when the "analysis_charts" stamp moved, at most every META_CACHE_CHECK_INTERVAL seconds"""
+    now = time.monotonic()
+    if now - _charts_cache_version["checked_at"] < META_CACHE_CHECK_INTERVAL:
+        return
+    _charts_cache_version["checked_at"] = now
+    stamp = await database.db.cache_versions.find_one({"_id": "analysis_charts"})
+    version = stamp["version"] if stamp else 0
+    if version != _charts_cache_version["version"]:
+        if _charts_cache_version["version"] is not None:
+            _charts_cache.clear()
+            charts_cache_stats["invalidations"] += 1
+        _charts_cache_version["version"] = version
+async def bump_charts_version():
+    """Tell every worker that a stored charts payload changed"""
+    stamp = await database.db.cache_versions.find_one_and_update(
+        {"_id": "analysis_charts"}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    # This worker already holds the new payload; only skip its next clear if nothing else changed meanwhile
+    if _charts_cache_version["version"] is not None and stamp["version"] == _charts_cache_version["version"] + 1:
+        _charts_cache_version["version"] = stamp["version"]
+async def load_charts_payload(analysis_id: str) -> Optional[Dict[str, Any]]:
+    """Charts payload from the LRU, then analysis_charts, for the current meta.
+
+    Built on first request for older analyses, and again on the first request after a meta change.
+    """
+    await _check_charts_cache()
+    meta_value = await current_meta_value()
+    payload = _charts_cache.get(analysis_id)
+    if payload is not None and payload.get("meta_value") == meta_value:
+        charts_cache_stats["hits"] += 1
+        _charts_cache.move_to_end(analysis_id)
+        return payload
+    charts_cache_stats["misses"] += 1
+    stored = await database.db.analysis_charts.find_one({"_id": analysis_id})
+    if stored is not None and stored.get("meta_value") == meta_value:
+        if stored["generated_at"].tzinfo is None:
+            stored["generated_at"] = stored["generated_at"].replace(tzinfo=timezone.utc)
+        cache_charts_payload(stored)
+        return stored
+    projection = {field: 1 for field in CHARTS_PAYLOAD_FIELDS}
+    projection["_id"] = 0
+    analysis = await database.db.report_analyses.find_one({"id": analysis_id}, projection)
+    if analysis is None:
+        return None
+    charts_cache_stats["builds" if payload is None and stored is None else "meta_rebuilds"] += 1
+    return await store_charts_payload(analysis, meta_value)
+def accepted_encodings(header: Optional[str]) -> Dict[str, float]:
+    """Content codings of an Accept-Encoding header with their q-values"""
+    accepted = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        quality = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+def negotiate_charts_encoding(header: Optional[str], payload: Dict[str, Any]) -> str:
+    """Best stored coding the client accepts: br, then gzip, then identity"""
+    accepted = accepted_encodings(header)
+    for coding in ("br", "gzip"):
+        if payload.get(coding) is not None and accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return "identity"
+def charts_etag(payload: Dict[str, Any], coding: str) -> str:
+    # Each coding is a different representation, so it gets its own strong validator
+    return f'"{payload["etag"]}"' if coding == "identity" else f'"{payload["etag"]}-{coding}"'
+def charts_not_modified(payload: Dict[str, Any], if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    """Conditional GET: If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2)"""
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        # Any coding of the same payload validates; proxies may have recompressed it
+        return "*" in tags or any(tag.strip('"').split("-")[0] == payload["etag"] for tag in tags)
+    if if_modified_since is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return payload["generated_at"] <= since
+    return False
+def memory_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and sizes of the meta config cache and the charts LRU"""
+    return {
+        "meta_config": dict(meta_cache_stats, cached=_meta_cache["value"] is not None),
+        "charts": dict(charts_cache_stats, cached=len(_charts_cache), capacity=CHARTS_CACHE_SIZE)
+    }
+# AI analysis
+# from emergentintegrations.llm.chat import LlmChat, UserMessage
+def format_sellers_for_ai(sellers):
+    """Format sellers data for AI analysis"""
+    result = ""
+    for i, seller in enumerate(sellers, 1):
+        result += f"{i}. {seller['name']}: R$ {seller['sales']:,.2f}\n"
+    return result
+def format_clients_for_ai(clients):
+    """Format clients data for AI analysis"""
+    result = ""
+    for i, client in enumerate(clients, 1):
+        result += f"{i}. {client['client']}: R$ {client['value']:,.2f} ({client['percentage']}%)\n"
+    return result
+def format_geography_for_ai(geo):
+    """Format geographic data for AI analysis"""
+    result = ""
+    for i, state in enumerate(geo, 1):
+        result += f"{i}. {state['state']}: R$ {state['value']:,.2f} ({state['percentage']}%)\n"
+    return result
+def format_products_for_ai(products):
+    """Format products data for AI analysis"""
+    result = ""
+    for i, product in enumerate(products, 1):
+        result += f"{i}. {product['product']}: R$ {product['revenue']:,.2f} (Qtd: {product['quantity']})\n"
+    return result
+async def analyze_with_ai(report_530_data: Dict, report_549_data: Dict, charts_data: Dict) -> Dict[str, Any]:
+    return {
+        "ai_insights": "Análise automática não disponível no momento.",
+        "success": False
+    }
+async def build_analysis_document(month_year: str, report_530_data: Dict, report_549_data: Dict, charts_data: Dict,
+                                  content_key: Optional[str] = None, source_sha256: Optional[Dict[str, str]] = None):
+    """Run the AI analysis and build a new ReportAnalysis from packed report data (see pack_report_data).
+
+    Raw reports are stored already, or here when an inline one is too big for the document
+    (see store_report_rows); returns (analysis, Mongo document) for the caller to insert.
+    """
+    # AI Analysis
+    with stage("ai"):
+        ai_analysis = await analyze_with_ai(report_530_data, report_549_data, charts_data)
+    
+    # Save analysis to database
+    analysis = ReportAnalysis(
+        month_year=month_year,
+        ai_analysis=ai_analysis,
+        charts_data=charts_data,
+        content_key=content_key,
+        source_sha256=source_sha256
+    )
+    
+    # Prepare data for MongoDB (convert datetime objects to strings);
+    # the report data was already prepared by the parser jobs
+    with stage("serialize"):
+        analysis_dict = prepare_for_mongo(analysis.dict(exclude={"report_530_data", "report_549_data", "report_530_ref", "report_549_ref"}))
+    for report_type, report_data in (("530", report_530_data), ("549", report_549_data)):
+        if "_blob" in report_data:
+            with stage("raw_storage", report_type):
+                report_ref = await store_raw_report(analysis.id, report_type, report_data)
+        elif "_spool" in report_data:
+            with stage("raw_storage", report_type):
+                report_ref = await store_spooled_rows(analysis.id, report_type, report_data)
+        elif "file_id" in report_data or "rows_key" in report_data:
+            report_ref = report_data  # Already stored, reused from the parsed-report cache
+        elif len(bson.encode(report_data)) > INLINE_REPORT_MAX_BYTES:
+            with stage("raw_storage", report_type):
+                report_ref = await store_report_rows(analysis.id, report_type, report_data)
+        else:
+            analysis_dict[f"report_{report_type}_data"] = report_data
+            continue
+        setattr(analysis, f"report_{report_type}_ref", report_ref)
+        analysis_dict[f"report_{report_type}_ref"] = report_ref
+    return analysis, analysis_dict
+async def save_analysis(month_year: str, report_530_data: Dict, report_549_data: Dict, charts_data: Dict,
+                        content_key: Optional[str] = None, source_sha256: Optional[Dict[str, str]] = None):
+    """Run the AI analysis and store a new ReportAnalysis from packed report data (see pack_report_data)"""
+    analysis, analysis_dict = await build_analysis_document(
+        month_year, report_530_data, report_549_data, charts_data, content_key, source_sha256
+    )
+    with stage("insert"):
+        count("bytes_out", len(bson.encode(analysis_dict)))
+        await database.db.report_analyses.insert_one(analysis_dict)
+    with stage("charts_payload"):
+        await store_charts_payload(analysis_dict)
+    return analysis
+# Upload result cache
+UPLOAD_CACHE_MAX_AGE = int(os.environ.get('UPLOAD_CACHE_MAX_AGE', str(30 * 24 * 3600)))
+PARSE_CACHE_MAX_BYTES = int(os.environ.get('PARSE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Stay clear of Mongo's 16 MB document limit
+PARSE_CACHE_MAX_ENTRY_BYTES = 15 * 1024 * 1024
+def analysis_content_key(month_year: str, sha256_530: str, sha256_549: str) -> str:
+    """Key of an analysis result: same month, same file contents and parser version.
+
+    The month is normalized first, so "2025-01" and "01/2025" share a key. The meta is not
+    part of it: the fields that depend on it are derived when an analysis is read (see apply_meta).
+    """
+    raw = json.dumps([PARSER_VERSION, month_key(month_year), sha256_530, sha256_549])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+def _parsed_report_key(report_type: str, sha256: str) -> str:
+    return f"{PARSER_VERSION}:{report_type}:{sha256}"
+async def find_cached_analysis(content_key: str) -> Optional[Dict[str, Any]]:
+    """Most recent analysis of identical uploads, if younger than UPLOAD_CACHE_MAX_AGE"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_CACHE_MAX_AGE)).isoformat()
+    return await database.db.report_analyses.find_one(
+        {"content_key": content_key, "created_at": {"$gte": cutoff}},
+        {
+            "_id": 0, "id": 1, "charts_data": 1, "ai_analysis": 1,
+            "report_530_data.bad_rows": 1, "report_549_data.bad_rows": 1,
+            "report_530_ref.bad_rows": 1, "report_549_ref.bad_rows": 1
+        }
+    )
+async def find_current_analysis(content_key: str, month: Optional[str]) -> Optional[Dict[str, Any]]:
+    """find_cached_analysis, unless a newer upload of the month has since replaced its rollup and facts"""
+    cached = await find_cached_analysis(content_key)
+    if cached and month:
+        # The month must then be stored again (its parsed files are still cached)
+        current = await load_month_rollups(month, month, ())
+        if current and current[0]["analysis_id"] != cached["id"]:
+            return None
+    return cached
+async def load_parsed_report(report_type: str, sha256: str):
+    """(report ref, aggregates) of an already parsed file, or None"""
+    now = datetime.now(timezone.utc)
+    entry = await database.db.parsed_reports.find_one_and_update(
+        {"_id": _parsed_report_key(report_type, sha256), "created_at": {"$gte": now - timedelta(seconds=UPLOAD_CACHE_MAX_AGE)}},
+        {"$set": {"last_used_at": now}}
+    )
+    if not entry:
+        return None
+    # Aggregate groups are stored as [key, value] pairs: client names may contain "." or "$";
+    # fact keys are tuples, which come back from BSON as lists
+    aggregates = {
+        key: {tuple(group) if isinstance(group, list) else group: amount for group, amount in value}
+        if isinstance(value, list) else value
+        for key, value in entry["aggregates"].items()
+    }
+    return entry["report"], aggregates
+async def cache_parsed_report(report_type: str, sha256: str, report_ref: Dict[str, Any], aggregates: Dict[str, Any]):
+    """Remember the stored raw report and aggregates of a parsed file, then evict beyond PARSE_CACHE_MAX_BYTES"""
+    now = datetime.now(timezone.utc)
+    entry = {
+        "report_type": report_type,
+        "sha256": sha256,
+        "parser_version": PARSER_VERSION,
+        "report": report_ref,
+        "aggregates": {key: list(value.items()) if isinstance(value, dict) else value for key, value in aggregates.items()},
+        # Real datetimes (not ISO strings) so the TTL index can expire entries
+        "created_at": now,
+        "last_used_at": now
+    }
+    entry["size_bytes"] = len(bson.encode(entry))
+    if entry["size_bytes"] > PARSE_CACHE_MAX_ENTRY_BYTES:
+        return
+    await database.db.parsed_reports.update_one({"_id": _parsed_report_key(report_type, sha256)}, {"$set": entry}, upsert=True)
+    await evict_parsed_reports()
+async def parse_with_cache(report_type: str, sha256: str, parse_job, args):
+    """(report data, aggregates, cache hit) of one file: from the parsed-report cache or a parser job.
+
+    A parsed file also gets its columnar cache entry (see ColumnarWriter) when COLUMNAR_CACHE is on.
+    """
+    cached_report = await load_parsed_report(report_type, sha256)
+    if cached_report:
+        return cached_report[0], cached_report[1], True
+    cache_path = columnar_cache_path(report_type, sha256) if COLUMNAR_CACHE else None
+    if asyncio.iscoroutinefunction(parse_job):
+        with columnar_target(cache_path):
+            report_data, aggregates = await parse_job(*args)
+    else:
+        report_data, aggregates = await run_parser_job(columnar_job, cache_path, parse_job, *args)
+    return report_data, aggregates, False
+async def evict_parsed_reports():
+    """Drop least recently used parsed-report entries until the cache fits PARSE_CACHE_MAX_BYTES"""
+    total = 0
+    async for entry in database.db.parsed_reports.find({}, {"size_bytes": 1}).sort("last_used_at", -1).batch_size(MONGO_CURSOR_BATCH_SIZE):
+        total += entry.get("size_bytes", 0)
+        if total > PARSE_CACHE_MAX_BYTES:
+            await database.db.parsed_reports.delete_one({"_id": entry["_id"]})
+def report_bad_rows(report_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Bad rows recorded on (packed) report data; reports parsed before typed parsing have none"""
+    return (report_data or {}).get("bad_rows") or no_bad_rows()
+async def analyze_reports(month_year: str, reports: Dict[str, tuple], progress=None) -> Dict[str, Any]:
+    """Parse (or reuse), aggregate and store one 530/549 pair.
+
+    reports maps "530"/"549" to (sha256, parser job, job args). Identical uploads
+    return the existing analysis; a file parsed before is not parsed again.
+    Uploads of the same month run one at a time (month_lock), so identical
+    concurrent uploads share one analysis instead of each storing their own.
+    The result carries the bad rows of each report (cells skipped by typed parsing).
+    progress, if given, is awaited with stage updates.
+    """
+    async with contextlib.AsyncExitStack() as stack:
+        with stage("month_lock"):
+            await stack.enter_async_context(month_lock(month_year))
+        return await _analyze_reports(month_year, reports, progress)
+async def _analyze_reports(month_year: str, reports: Dict[str, tuple], progress=None) -> Dict[str, Any]:
+    meta_value = await current_meta_value()
+    # Looked up under the month lock, with the month normalized as in the lock key: an identical
+    # upload of the same month (in either spelling) that held the lock has stored its analysis by now
+    content_key = analysis_content_key(month_year, reports["530"][0], reports["549"][0])
+    month = parse_month_year(month_year)
+    with stage("cache_lookup"):
+        cached = await find_current_analysis(content_key, month)
+    if cached:
+        logging.info(f"Reusing analysis {cached['id']} for identical uploads")
+        return {
+            "analysis_id": cached["id"],
+            "charts_data": apply_meta(cached["charts_data"], meta_value),
+            "ai_analysis": cached["ai_analysis"],
+            "bad_rows": {
+                report_type: report_bad_rows(cached.get(f"report_{report_type}_ref") or cached.get(f"report_{report_type}_data"))
+                for report_type in ("530", "549")
+            },
+            "cached": True
+        }
+    async def parse(report_type):
+        with stage("parse", report_type):
+            parsed = await parse_with_cache(report_type, *reports[report_type])
+        if parsed[1] is not None:
+            count("rows", parsed[1]["row_count"], report_type)
+        return parsed
+    (report_530_data, aggregates_530, hit_530), (report_549_data, aggregates_549, hit_549) = await asyncio.gather(
+        parse("530"), parse("549")
+    )
+    logging.info(f"Processing real data - 530 success: {report_530_data.get('success')}, 549 success: {report_549_data.get('success')}")
+    try:
+        if progress:
+            rows_parsed = sum(aggregates["row_count"] for aggregates in (aggregates_530, aggregates_549) if aggregates)
+            await progress(stage="aggregating", rows_parsed=rows_parsed)
+        has_rows = aggregates_530 is not None and aggregates_549 is not None and aggregates_530["row_count"] > 0
+        with stage("charts"):
+            charts_data = charts_or_mock(aggregates_530, aggregates_549, meta_value)
+            if has_rows and month:
+                previous = await load_month_rollups(shift_month(month, -1), shift_month(month, -1), ("clients", "sellers"))
+                if previous:
+                    apply_history(charts_data, aggregates_530, previous[0])
+        logging.info(f"Charts data generated: {charts_data.get('performance_vs_meta', {}).get('current_performance', 'N/A')}")
+        if progress:
+            await progress(stage="saving")
+        analysis = await save_analysis(
+            month_year, report_530_data, report_549_data, charts_data, content_key,
+            {report_type: reports[report_type][0] for report_type in ("530", "549")}
+        )
+    finally:
+        # Spooled rows are removed once stored; this only catches a failure before that
+        for report_data in (report_530_data, report_549_data):
+            discard_spooled_rows(report_data.get("_spool"))
+    if has_rows and month:
+        with stage("rollup"):
+            await save_month_rollup(build_month_rollup(month_year, analysis.id, aggregates_530, aggregates_549))
+        with stage("facts"):
+            await store_facts(analysis.id, month, {"530": aggregates_530, "549": aggregates_549})
+    for report_type, aggregates, hit in (("530", aggregates_530, hit_530), ("549", aggregates_549, hit_549)):
+        report_ref = getattr(analysis, f"report_{report_type}_ref")
+        if not hit and report_ref and aggregates is not None:
+            with stage("parse_cache", report_type):
+                await cache_parsed_report(report_type, reports[report_type][0], report_ref, aggregates)
+    return {
+        "analysis_id": analysis.id,
+        "charts_data": charts_data,
+        "ai_analysis": analysis.ai_analysis,
+        "bad_rows": {"530": report_bad_rows(report_530_data), "549": report_bad_rows(report_549_data)},
+        "cached": False
+    }
+# Recompute
+# charts_data of a stored analysis is rebuilt with the current meta from the columnar cache entries
+# of its files, or, when this machine has none, from its raw reports (which then fill the cache).
+# Rollups and facts do not depend on the meta and are left as they are. A new meta alone needs
+# none of that: recompute_meta_fields rewrites performance_vs_meta of every analysis from its stored total.
+async def recompute_meta_fields(meta_value: Optional[float] = None) -> Dict[str, Any]:
+    """Store performance_vs_meta of every analysis for a meta (the current one by default) with one bulk_write.
+
+    Only the stored totals are read, no report. Responses do not wait for this (see
+    apply_meta): it keeps the documents themselves in line for anything reading them directly.
+    """
+    start = time.perf_counter()
+    if meta_value is None:
+        meta_value = await current_meta_value()
+    cursor = database.db.report_analyses.find(
+        {"charts_data.performance_vs_meta.current_performance": {"$exists": True}},
+        {"_id": 1, "charts_data.performance_vs_meta": 1}
+    ).batch_size(MONGO_CURSOR_BATCH_SIZE)
+    scanned = 0
+    operations = []
+    async for analysis in cursor:
+        scanned += 1
+        stored = analysis["charts_data"]["performance_vs_meta"]
+        block = performance_vs_meta(stored["current_performance"], meta_value)
+        if block != stored:
+            operations.append(UpdateOne({"_id": analysis["_id"]}, {"$set": {"charts_data.performance_vs_meta": block}}))
+    updated = 0
+    if operations:
+        result = await database.db.report_analyses.bulk_write(operations, ordered=False)
+        updated = result.modified_count
+    logging.info(f"Meta {meta_value}: {updated} of {scanned} analyses updated")
+    return {"meta_value": meta_value, "analyses": scanned, "updated": updated, "seconds": round(time.perf_counter() - start, 4)}
+async def recompute_report_aggregates(analysis: Dict[str, Any], report_type: str):
+    """(aggregates, source) of one report of an analysis; aggregates is None when its rows were not kept"""
+    sha256 = (analysis.get("source_sha256") or {}).get(report_type)
+    path = columnar_cache_path(report_type, sha256 or f"analysis-{analysis['id']}")
+    aggregates = await run_parser_job(aggregate_columnar_report, path, report_type)
+    if aggregates is not None:
+        return aggregates, "columnar_cache"
+    if not analysis.get(f"report_{report_type}_ref"):
+        # Inline reports are left out of the analysis projection
+        analysis = await database.db.report_analyses.find_one({"id": analysis["id"]}, {f"report_{report_type}_data": 1}) or {}
+    report_data = await load_report_data(analysis, report_type)
+    # Streamed reports stored without their rows keep counts only
+    if not report_data or not report_data.get("success") or (report_data.get("streamed") and not report_data.get("sheets")):
+        return None, "unavailable"
+    aggregates = await run_parser_job(columnar_job, path if COLUMNAR_CACHE else None, aggregate_report_data, report_data, report_type)
+    return aggregates, "raw_report"
+async def recompute_analysis(analysis_id: str) -> Optional[Dict[str, Any]]:
+    """Rebuild and store charts_data (and its charts payload) of an analysis; None if there is no such analysis"""
+    start = time.perf_counter()
+    analysis = await database.db.report_analyses.find_one({"id": analysis_id}, {
+        "_id": 0, "id": 1, "month_year": 1, "created_at": 1, "ai_analysis": 1, "source_sha256": 1,
+        "report_530_ref": 1, "report_549_ref": 1
+    })
+    if analysis is None:
+        return None
+    meta_value = await current_meta_value()
+    (aggregates_530, source_530), (aggregates_549, source_549) = await asyncio.gather(
+        recompute_report_aggregates(analysis, "530"), recompute_report_aggregates(analysis, "549")
+    )
+    missing = [report_type for report_type, aggregates in (("530", aggregates_530), ("549", aggregates_549)) if aggregates is None]
+    if missing:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Dados do relatório {', '.join(missing)} não disponíveis para recálculo; envie os arquivos novamente"
+        )
+    charts_data = charts_or_mock(aggregates_530, aggregates_549, meta_value)
+    month = parse_month_year(analysis["month_year"])
+    if aggregates_530["row_count"] > 0 and month:
+        previous = await load_month_rollups(shift_month(month, -1), shift_month(month, -1), ("clients", "sellers"))
+        if previous:
+            apply_history(charts_data, aggregates_530, previous[0])
+    update = {"charts_data": charts_data, "recomputed_at": datetime.now(timezone.utc).isoformat()}
+    await database.db.report_analyses.update_one({"id": analysis_id}, {"$set": update})
+    analysis["charts_data"] = charts_data
+    await store_charts_payload(analysis)
+    await bump_charts_version()
+    return {
+        "analysis_id": analysis_id,
+        "charts_data": charts_data,
+        "meta_value": meta_value,
+        "sources": {"530": source_530, "549": source_549},
+        "seconds": round(time.perf_counter() - start, 4)
+    }
@@ -0,0 +1,57 @@
+"""
+Build monthly_rollups for analyses uploaded before the rollup store existed.
+
+Raw reports are read once (storage.load_report_data: inline data, a GridFS
+blob or report_rows chunks) and aggregated; the rollup takes the analysis
+created_at as its updated_at, so newer uploads of the same month stay current.
+Streamed uploads stored without their rows are skipped.
+
+Usage (from backend/): python backfill_rollups.py [--dry-run] [--limit N]
+"""
+
+import argparse
+import asyncio
+
+import database
+import parsing
+import rollups
+import storage
+
+
+async def backfill(dry_run=False, limit=0):
+    existing = [doc["_id"] async for doc in database.db.monthly_rollups.find({}, {"_id": 1})]
+    projection = {"id": 1, "month_year": 1, "created_at": 1}
+    # Excluded in the query, so --limit counts analyses that still need a rollup
+    cursor = database.db.report_analyses.find({"id": {"$nin": existing}}, projection).sort("created_at", 1).limit(limit)
+    analyses = [doc async for doc in cursor]
+    print(f"{len(analyses)} analyses without a rollup{' (dry run)' if dry_run else ''}")
+    for summary in analyses:
+        label = f"{summary['id']} {summary.get('month_year')}"
+        if rollups.parse_month_year(summary.get("month_year")) is None:
+            print(f"{label}: skipped, month not recognized")
+            continue
+        analysis = await database.db.report_analyses.find_one({"id": summary["id"]})
+        aggregates = {}
+        for report_type in ("530", "549"):
+            report_data = await storage.load_report_data(analysis, report_type)
+            aggregates[report_type] = parsing.aggregate_report_data(report_data, report_type)
+        if not aggregates["530"] or not aggregates["549"] or aggregates["530"]["row_count"] == 0:
+            print(f"{label}: skipped, no stored rows")
+            continue
+        rollup = rollups.build_month_rollup(summary["month_year"], summary["id"], aggregates["530"], aggregates["549"])
+        rollup["updated_at"] = summary["created_at"]
+        if not dry_run:
+            await rollups.save_month_rollup(rollup)
+        print(f"{label}: {rollup['total_sales']:.2f} total, {len(rollup['dimensions']['clients'])} clients")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="aggregate without writing rollups")
+    parser.add_argument("--limit", type=int, default=0, help="backfill at most N analyses")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.dry_run, args.limit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Dashboard load benchmark: GET /api/analyses/{id} vs GET /api/analyses/{id}/charts.
+
+Stores one analysis built from synthetic 530/549 aggregates (rows kept inline,
+the RAW_REPORT_STORAGE=inline layout, so the full document carries them), then
+replays each request and reports p50 latency and bytes on the wire: the full
+document, the precompressed charts payload per coding, and a conditional
+repeat load answered with 304. --fake runs it on the in-memory database.
+
+Usage: python backend/benchmarks/bench_charts.py [rows] [--repeat 50] [--fake]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import statistics
+import time
+
+import fake_mongo
+from synthetic import load_backend, report_payloads
+
+analyses = load_backend("analyses")
+database = load_backend("database")
+parsing = load_backend("parsing")
+server = load_backend()
+
+
+async def seed(rows):
+    report_530, report_549 = report_payloads(rows, rows)
+    aggregates_530 = parsing.aggregate_report_data(report_530, "530")
+    aggregates_549 = parsing.aggregate_report_data(report_549, "549")
+    charts = parsing.charts_or_mock(aggregates_530, aggregates_549, 2_000_000)
+    analysis = await analyses.save_analysis("2025-01", parsing.prepare_for_mongo(report_530), parsing.prepare_for_mongo(report_549), charts)
+    return analysis.id
+
+
+async def measure(api, path, headers, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await api.get(path, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code not in (200, 304):
+            response.raise_for_status()
+    return statistics.median(latencies), response
+
+
+async def run(args):
+    import httpx
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.fake:
+        fake_mongo.install()
+    else:
+        await database.client.drop_database(database.db.name)
+        await server.ensure_indexes()
+    with contextlib.redirect_stdout(io.StringIO()):
+        analysis_id = await seed(args.rows)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as api:
+        first = await api.get(f"/api/analyses/{analysis_id}/charts", headers={"Accept-Encoding": "gzip"})
+        etag = first.headers["etag"]
+        cases = [
+            ("full document", f"/api/analyses/{analysis_id}", {"Accept-Encoding": "identity"}),
+            ("charts identity", f"/api/analyses/{analysis_id}/charts", {"Accept-Encoding": "identity"}),
+            ("charts gzip", f"/api/analyses/{analysis_id}/charts", {"Accept-Encoding": "gzip"}),
+            ("charts br", f"/api/analyses/{analysis_id}/charts", {"Accept-Encoding": "br, gzip"}),
+            ("charts 304", f"/api/analyses/{analysis_id}/charts", {"Accept-Encoding": "gzip", "If-None-Match": etag})
+        ]
+        print(f"{args.rows} rows per report, brotli {'on' if analyses.brotli else 'off'}, orjson {'on' if analyses.orjson else 'off'}")
+        print(f"{'request':>16} {'p50 (ms)':>9} {'bytes':>10}  coding")
+        for name, path, headers in cases:
+            p50, response = await measure(api, path, headers, args.repeat)
+            size = int(response.headers.get("content-length", len(response.content)))
+            print(f"{name:>16} {p50:>9.2f} {size:>10}  {response.headers.get('content-encoding', '-')}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rows", nargs="?", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--fake", action="store_true", help="use the in-memory database")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Latency benchmark: GET /api/meta-config while a large upload is being parsed.
+
+Runs the FastAPI app in-process against an in-memory database for each
+PARSER_EXECUTOR mode ("inline" is the old on-the-loop behaviour) and reports
+read-endpoint latency percentiles during the upload.
+
+Usage: python backend/benchmarks/bench_event_loop.py [rows] [--modes inline,thread,process]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import fake_mongo
+from synthetic import load_backend, workbook_pair
+
+parsing = load_backend("parsing")
+server = load_backend()
+
+WORKDIR = Path(tempfile.gettempdir()) / "helibombas_bench"
+
+
+async def measure(mode, path_530, path_549):
+    import httpx
+
+    parsing.PARSER_EXECUTOR = mode
+    parsing.shutdown_parser_executor()
+    fake_mongo.install()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as api:
+        files = {
+            "report_530": (path_530.name, path_530.read_bytes()),
+            "report_549": (path_549.name, path_549.read_bytes()),
+        }
+        if mode == "process":
+            # Warm the pool so worker start-up is not counted against the upload
+            await parsing.run_parser_job(len, b"")
+        upload = asyncio.create_task(api.post("/api/upload-reports", data={"month_year": "01/2025"}, files=files))
+        latencies = []
+        while not upload.done():
+            # Time from when the next poll is due, so event-loop stalls are counted too
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            await api.get("/api/meta-config")
+            latencies.append((time.perf_counter() - start - 0.01) * 1000)
+        response = await upload
+        response.raise_for_status()
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "p50": statistics.median(latencies),
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "max": latencies[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rows", nargs="?", type=int, default=100_000)
+    parser.add_argument("--modes", default="inline,thread,process")
+    args = parser.parse_args()
+    path_530, path_549 = workbook_pair(WORKDIR, args.rows)
+    print(f"GET /api/meta-config latency (ms) during a {args.rows}-row upload")
+    print(f"{'executor':>10} {'requests':>9} {'p50':>8} {'p99':>8} {'max':>8}")
+    for mode in args.modes.split(","):
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = asyncio.run(measure(mode, path_530, path_549))
+        print(f"{mode:>10} {result['requests']:>9} {result['p50']:>8.1f} {result['p99']:>8.1f} {result['max']:>8.1f}")
+    parsing.shutdown_parser_executor()
+
+
+if __name__ == "__main__":
+    main()
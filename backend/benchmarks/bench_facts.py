@@ -0,0 +1,92 @@
+"""
+Latency benchmark: GET /api/facts drill-down queries over a year of facts.
+
+Seeds 12 months of synthetic 530/549 uploads (facts plus the month rollups
+that mark them current) into MONGO_URL/DB_NAME (default helibombas_bench,
+dropped first), creates the indexes, then replays a query mix through the
+FastAPI app and reports p50/p95 per query against a p95 target.
+--fake runs the same flow on the in-memory database (a smoke test; its
+latencies say nothing about Mongo).
+
+Usage: python backend/benchmarks/bench_facts.py [rows_per_month] [--repeat 30] [--p95-ms 200] [--fake]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import statistics
+import time
+
+import fake_mongo
+from synthetic import load_backend, records_530, records_549
+
+database = load_backend("database")
+parsing = load_backend("parsing")
+rollups = load_backend("rollups")
+server = load_backend()
+
+QUERIES = {
+    "top clients": "report=530&group_by=client&limit=20",
+    "client by month": "report=530&group_by=month&client=CLIENTE%2000042%20LTDA",
+    "products of a client": "report=530&group_by=product&client=CLIENTE%2000042%20LTDA&metric=qty",
+    "sellers in SP": "report=549&group_by=seller&uf=SP",
+    "UF x status": "report=549&group_by=uf,status&limit=100",
+    "Q2 products page 3": "report=530&group_by=product&month_from=2025-04&month_to=2025-06&offset=100&limit=50",
+    "fact listing": "report=530&limit=50&offset=500",
+}
+
+
+async def seed(rows):
+    for month in range(1, 13):
+        month_year = f"2025-{month:02d}"
+        frame_530 = parsing.pd.DataFrame.from_records(records_530(rows, seed=month))
+        frame_549 = parsing.pd.DataFrame.from_records(records_549(rows, seed=100 + month))
+        aggregates_530 = parsing.REPORT_AGGREGATORS["530"](frame_530)
+        aggregates_549 = parsing.REPORT_AGGREGATORS["549"](frame_549)
+        analysis_id = f"bench-{month_year}"
+        await rollups.save_month_rollup(rollups.build_month_rollup(month_year, analysis_id, aggregates_530, aggregates_549))
+        await rollups.store_facts(analysis_id, month_year, {"530": aggregates_530, "549": aggregates_549})
+    return await database.db.report_facts.count_documents({})
+
+
+async def run(args):
+    import httpx
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.fake:
+        fake_mongo.install()
+    else:
+        await database.client.drop_database(database.db.name)
+        await server.ensure_indexes()
+    with contextlib.redirect_stdout(io.StringIO()):
+        facts = await seed(args.rows)
+    print(f"{facts} facts from 12 months x {args.rows} rows per report")
+    print(f"{'query':>22} {'p50 (ms)':>9} {'p95 (ms)':>9} {'max (ms)':>9}  target")
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as api:
+        for name, params in QUERIES.items():
+            latencies = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                response = await api.get(f"/api/facts?{params}")
+                latencies.append((time.perf_counter() - start) * 1000)
+                response.raise_for_status()
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            verdict = "ok" if p95 <= args.p95_ms else "SLOW"
+            print(f"{name:>22} {statistics.median(latencies):>9.1f} {p95:>9.1f} {latencies[-1]:>9.1f}  {verdict}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rows", nargs="?", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--p95-ms", type=float, default=200.0)
+    parser.add_argument("--fake", action="store_true", help="use the in-memory database")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
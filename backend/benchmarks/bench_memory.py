@@ -0,0 +1,89 @@
+"""
+Memory benchmark: a parsed report held as a list of row dicts vs a CompactTable.
+
+A synthetic 530 of --rows rows (real exports run to about 100k) is built in
+the list-of-dicts shape the full ingestion path used to return, then converted
+to a CompactTable (dictionary-encoded text columns, typed number columns).
+Memory is what tracemalloc counts as still allocated once each form is built;
+--xlsx also parses a generated workbook with extract_excel_data.
+
+process_real_data runs on both forms (with a 549 of rows / 10), and the
+row-by-row reference version (reference_loop.py) reads the table through
+its row views; all three charts must be equal.
+
+Usage: python backend/benchmarks/bench_memory.py [--rows 100000] [--xlsx]
+"""
+
+import argparse
+import gc
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from reference_loop import process_real_data_loop
+from synthetic import load_backend, records_530, records_549, workbook_pair
+
+parsing = load_backend("parsing")
+
+WORKDIR = Path(tempfile.gettempdir()) / "helibombas_bench"
+
+
+def allocated(build):
+    """(result, bytes still allocated by build())"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--xlsx", action="store_true", help="also measure extract_excel_data on a generated workbook")
+    args = parser.parse_args()
+    # Load pandas/numpy outside the measurements
+    parsing.CompactTable.from_records(records_530(10))
+
+    records, records_bytes = allocated(lambda: records_530(args.rows))
+    table, table_bytes = allocated(lambda: parsing.CompactTable.from_records(records))
+    cells = args.rows * len(table.columns)
+    print(f"530, {args.rows} rows x {len(table.columns)} columns")
+    print(f"{'form':>14} {'MB':>8} {'bytes/cell':>11}")
+    print(f"{'row dicts':>14} {records_bytes / 1024 / 1024:>8.1f} {records_bytes / cells:>11.1f}")
+    print(f"{'CompactTable':>14} {table_bytes / 1024 / 1024:>8.1f} {table_bytes / cells:>11.1f}   (nbytes {table.nbytes / 1024 / 1024:.1f} MB)")
+    if args.xlsx:
+        path, _ = workbook_pair(WORKDIR, args.rows)
+        content = path.read_bytes()
+        parsing.extract_excel_data(content)  # Warm-up: openpyxl and pandas keep caches from the first parse
+        extracted, extracted_bytes = allocated(lambda: parsing.extract_excel_data(content))
+        print(f"{'extract_excel':>14} {extracted_bytes / 1024 / 1024:>8.1f} {extracted_bytes / cells:>11.1f}   ({path.name})")
+        del extracted
+
+    meta = 2_200_000.0
+    legacy = {"sheets": {"sheet1": records}, "success": True}
+    compact = {"sheets": {"sheet1": table}, "success": True}
+    report_549 = {"sheets": {"Planilha1": parsing.CompactTable.from_records(records_549(args.rows // 10))}, "success": True}
+    parsing.process_real_data(compact, report_549, meta)  # Warm-up
+    charts_records, records_s = timed(parsing.process_real_data, legacy, report_549, meta)
+    charts_table, table_s = timed(parsing.process_real_data, compact, report_549, meta)
+    charts_rows, rows_s = timed(process_real_data_loop, compact, report_549, meta)
+    print(f"\n{'process_real_data':>30} {'seconds':>8}")
+    print(f"{'row dicts':>30} {records_s:>8.3f}")
+    print(f"{'CompactTable':>30} {table_s:>8.3f}")
+    print(f"{'CompactTable row views (loop)':>30} {rows_s:>8.3f}")
+    assert charts_records == charts_table == charts_rows, "charts differ between the two forms"
+    print("charts identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Throughput benchmark: PDF report extraction in pages per second.
+
+Compares one sequential extract_pdf_pages pass with parse_pdf_report fanning
+page ranges out over the parser process pool, with and without keeping the
+rows for the raw report. Each mode runs in a fresh subprocess and reports its
+peak RSS above the baseline of the imported parsing module. Parallel timings
+include spawning the pool, so the gain only shows with several cores and
+reports long enough to amortize worker startup.
+
+Usage: python backend/benchmarks/bench_pdf.py [pages] [--workers N] [--modes sequential,parallel,streaming]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic import load_backend, pdf_pair
+
+parsing = load_backend("parsing")
+
+WORKDIR = Path(tempfile.gettempdir()) / "helibombas_bench"
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode, path):
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == "sequential":
+            result = parsing.extract_pdf_pages(path, "530")
+            pages, total = result["pages"], result["aggregates"]["total_sales"]
+        else:
+            report_data, aggregates = asyncio.run(parsing.parse_pdf_report(path, path.name, "530", mode == "parallel"))
+            pages, total = report_data["page_count"], aggregates["total_sales"]
+            parsing.shutdown_parser_executor()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "mode": mode,
+        "seconds": round(elapsed, 2),
+        "pages_per_second": round(pages / elapsed, 1),
+        "peak_rss_mb": round(peak_rss_mb() - baseline, 1),
+        "total": total
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pages", nargs="?", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--modes", default="sequential,parallel,streaming")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run_mode(args.run, Path(args.path))
+        return
+    path_530, _ = pdf_pair(WORKDIR, args.pages)
+    print(f"{args.pages} pages, {path_530.stat().st_size / 1024 / 1024:.1f} MB, {args.workers} workers")
+    print(f"{'mode':>10} {'seconds':>8} {'pages/s':>8} {'peak RSS over baseline (MB)':>28}")
+    env = dict(os.environ, PARSER_EXECUTOR="process", PARSER_WORKERS=str(args.workers))
+    for mode in args.modes.split(","):
+        output = subprocess.run(
+            [sys.executable, __file__, "--run", mode, "--path", str(path_530)],
+            check=True, capture_output=True, text=True, env=env
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>10} {result['seconds']:>8} {result['pages_per_second']:>8} {result['peak_rss_mb']:>28}")
+
+
+if __name__ == "__main__":
+    main()
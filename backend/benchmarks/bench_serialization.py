@@ -0,0 +1,103 @@
+"""
+Microbenchmark: prepare_for_mongo vs the original recursive implementation.
+
+Payloads:
+  records   - an analysis document embedding both reports as legacy row dicts
+              (the EXCEL_INGESTION=full / RAW_REPORT_STORAGE=inline layout)
+  frames    - the same reports as columnar DataFrames, with NaN and datetimes
+  charts    - a charts_data/ai_analysis document (small, deeply nested)
+
+Usage: python backend/benchmarks/bench_serialization.py [rows ...]
+"""
+
+import math
+import sys
+import time
+from datetime import datetime, timezone
+
+from synthetic import load_backend, report_payloads
+
+parsing = load_backend("parsing")
+pd = parsing.pd
+np = parsing.np
+
+
+def prepare_for_mongo_recursive(data):
+    """The original recursive prepare_for_mongo, kept as the baseline"""
+    if isinstance(data, pd.DataFrame):
+        return data.astype(object).where(data.notna(), "").to_dict('records')
+    elif isinstance(data, dict):
+        return {str(k): prepare_for_mongo_recursive(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [prepare_for_mongo_recursive(item) for item in data]
+    elif isinstance(data, datetime):
+        return data.isoformat()
+    elif isinstance(data, pd.Timestamp):
+        return data.isoformat()
+    elif isinstance(data, np.datetime64):
+        return pd.Timestamp(data).isoformat()
+    elif pd.isna(data) or (hasattr(data, '__class__') and 'NaT' in str(data.__class__)):
+        return None
+    elif isinstance(data, (np.integer, np.floating)):
+        return data.item()
+    else:
+        return data
+
+
+def best_of(func, payload, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(payload)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def same(a, b):
+    """Equality that treats NaN == NaN"""
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return a == b and type(a) is type(b)
+
+
+def payloads(rows):
+    report_530, report_549 = report_payloads(rows, rows)
+    charts = parsing.generate_mock_chart_data()
+    created_at = datetime.now(timezone.utc)
+    records = {
+        "id": "bench", "month_year": "2025-01", "created_at": created_at,
+        "report_530_data": report_530, "report_549_data": report_549,
+        "charts_data": charts, "ai_analysis": {"insights": ["a"] * 10, "confidence": np.float64(0.9)}
+    }
+    frame_530 = pd.DataFrame.from_records(report_530["sheets"]["sheet1"])
+    frame_530["Vlr.Total"] = pd.to_numeric(frame_530["Vlr.Total"].where(frame_530["Vlr.Total"] != "", np.nan))
+    frame_530["Emissão"] = pd.Timestamp("2025-01-01") + pd.to_timedelta(np.arange(rows) % 31, unit="D")
+    frames = dict(records, report_530_data={"sheets": {"sheet1": frame_530}, "success": True},
+                  report_549_data={"sheets": {"Planilha1": pd.DataFrame.from_records(report_549["sheets"]["Planilha1"])}, "success": True})
+    return {
+        "records": records,
+        "frames": frames,
+        "charts": {"charts_data": charts, "created_at": created_at, "values": [np.int64(i) for i in range(1000)]}
+    }
+
+
+def main(sizes):
+    print(f"{'rows':>8} {'payload':>8} {'recursive (s)':>14} {'prepare (s)':>12} {'speedup':>8}  identical")
+    for rows in sizes:
+        for name, payload in payloads(rows).items():
+            old_time, old_result = best_of(prepare_for_mongo_recursive, payload)
+            new_time, new_result = best_of(parsing.prepare_for_mongo, payload)
+            if name == "frames":
+                # The original kept DataFrame datetimes as Timestamps; the new path writes ISO strings
+                for row in old_result["report_530_data"]["sheets"]["sheet1"]:
+                    row["Emissão"] = row["Emissão"].isoformat()
+            print(f"{rows:>8} {name:>8} {old_time:>14.4f} {new_time:>12.4f} {old_time / new_time:>7.1f}x  {same(old_result, new_result)}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000])
@@ -0,0 +1,125 @@
+"""
+Cold-start benchmark: import time of server.py and time to the first response.
+
+  import          a fresh interpreter runs `import server`; also lists which heavy
+                  parsing modules (pandas, numpy, fitz, openpyxl) that loaded
+  first_response  uvicorn is started on a free port and GET --path is polled
+                  until it answers; the time from spawn to the first response
+
+Each run is a new process, so nothing is warm apart from the OS file cache.
+Startup work (indexes, job resume, parser pool warm-up) runs in the background
+and does not need a reachable Mongo for the first response of GET /api/.
+--importtime also prints the slowest imports of one run (python -X importtime).
+
+Usage: python backend/benchmarks/bench_startup.py [--repeat 5] [--path /api/] [--importtime]
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from synthetic import BACKEND_DIR
+
+HEAVY_MODULES = ["pandas", "numpy", "fitz", "openpyxl"]
+IMPORT_SCRIPT = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import server\n"
+    "print(json.dumps({'seconds': time.perf_counter() - start, 'loaded': [m for m in %r if m in sys.modules]}))\n"
+) % HEAVY_MODULES
+
+
+def child_env():
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "helibombas_bench")
+    return env
+
+
+def import_run():
+    """(seconds, heavy modules loaded) of `import server` in a new interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=BACKEND_DIR, env=child_env(), capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result["seconds"], result["loaded"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_response_run(path, timeout=60):
+    """Seconds from spawning uvicorn until GET path answers with a non-5xx status"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=timeout) as response:
+                    if response.status < 500:
+                        return time.perf_counter() - start
+            except urllib.error.HTTPError as e:
+                if e.code < 500:
+                    return time.perf_counter() - start
+            except OSError:
+                pass  # Not listening yet
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+            time.sleep(0.01)
+        raise TimeoutError(f"no response from {path} within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def print_importtime(top=15):
+    """Slowest imports (cumulative) of one `import server`"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"], cwd=BACKEND_DIR, env=child_env(), capture_output=True, text=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                rows.append((int(cumulative), name.rstrip()))
+    print(f"\n{'cumulative (ms)':>15}  module")
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:>15.1f}  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--path", default="/api/", help="request timed for the first response")
+    parser.add_argument("--importtime", action="store_true", help="also print the slowest imports")
+    args = parser.parse_args()
+
+    imports = [import_run() for _ in range(args.repeat)]
+    responses = [first_response_run(args.path) for _ in range(args.repeat)]
+    import_seconds = [seconds for seconds, _ in imports]
+    print(f"python {sys.version.split()[0]}, {os.cpu_count()} CPUs, PARSER_EXECUTOR={os.environ.get('PARSER_EXECUTOR', 'process')}")
+    print(f"{'case':>15} {'best (s)':>9} {'median (s)':>11}")
+    print(f"{'import':>15} {min(import_seconds):>9.3f} {statistics.median(import_seconds):>11.3f}")
+    print(f"{'first_response':>15} {min(responses):>9.3f} {statistics.median(responses):>11.3f}")
+    print(f"heavy modules loaded by the import: {', '.join(imports[0][1]) or 'none'}")
+    if args.importtime:
+        print_importtime()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Storage benchmark: analysis document size and encode/decode cost with raw
+reports embedded inline vs stored as compressed columnar blobs (GridFS layout).
+
+Usage: python backend/benchmarks/bench_storage.py [rows ...]
+"""
+
+import sys
+import time
+
+import bson
+
+from synthetic import load_backend, report_payloads
+
+parsing = load_backend("parsing")
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main(sizes):
+    # Warm-up: one-off import and first-call costs are not decode cost
+    warm_530, _ = report_payloads(10, 10)
+    parsing.decode_report_blob(parsing.encode_report_blob(warm_530))
+    print(f"{'rows':>8} {'inline doc (MB)':>16} {'ref doc (KB)':>13} {'blobs (MB)':>11} {'encode (ms)':>12} {'decode (ms)':>12} {'BSON decode inline (ms)':>24}")
+    for rows in sizes:
+        report_530, report_549 = report_payloads(rows, rows)
+        charts = parsing.generate_mock_chart_data()
+        base = {"id": "bench", "month_year": "01/2025", "ai_analysis": {}, "charts_data": charts, "created_at": "2025-01-01T00:00:00+00:00"}
+        inline = dict(base, report_530_data=report_530, report_549_data=report_549)
+        inline_bson = bson.encode(inline)
+        _, inline_decode = timed(bson.decode, inline_bson)
+        blobs, encode_ms, decode_ms, refs = 0, 0.0, 0.0, dict(base)
+        for report_type, report_data in (("530", report_530), ("549", report_549)):
+            blob, elapsed = timed(parsing.encode_report_blob, report_data)
+            encode_ms += elapsed
+            decoded, elapsed = timed(parsing.decode_report_blob, blob)
+            decode_ms += elapsed
+            assert {name: table.records() for name, table in decoded["sheets"].items()} == report_data["sheets"]
+            blobs += len(blob)
+            refs[f"report_{report_type}_ref"] = dict(parsing.report_summary(report_data), file_id="0" * 24, compressed_size=len(blob))
+        print(
+            f"{rows:>8} {len(inline_bson) / 1024 / 1024:>16.2f} {len(bson.encode(refs)) / 1024:>13.1f} "
+            f"{blobs / 1024 / 1024:>11.2f} {encode_ms:>12.0f} {decode_ms:>12.0f} {inline_decode:>24.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 50_000, 100_000])
@@ -0,0 +1,81 @@
+"""
+Memory benchmark: buffered vs streaming ingestion of large 530/549 workbooks.
+
+Each mode runs in a fresh subprocess and reports its peak RSS above the
+baseline of the imported parsing module, plus wall time. The streaming figure
+stays far below the buffered ones; what growth remains comes from openpyxl's
+read-only parser keeping one cleared XML element per row (~80 B/row).
+
+Usage: python backend/benchmarks/bench_streaming.py [rows] [--modes columnar,streaming,full]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic import load_backend, workbook_pair
+
+parsing = load_backend("parsing")
+
+WORKDIR = Path(tempfile.gettempdir()) / "helibombas_bench"
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode, path_530, path_549):
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == "streaming":
+            _, aggregates_530 = parsing.stream_report_file(path_530, path_530.name, "530")
+            _, aggregates_549 = parsing.stream_report_file(path_549, path_549.name, "549")
+            charts = parsing.charts_from_aggregates(aggregates_530, aggregates_549, 2200000.0)
+        else:
+            extract = parsing.extract_excel_columns if mode == "columnar" else (lambda content, _: parsing.extract_excel_data(content))
+            report_530 = extract(path_530.read_bytes(), "530")
+            report_549 = extract(path_549.read_bytes(), "549")
+            charts = parsing.process_real_data(report_530, report_549, 2200000.0)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "mode": mode,
+        "seconds": round(elapsed, 2),
+        "peak_rss_mb": round(peak_rss_mb() - baseline, 1),
+        "total": charts["performance_vs_meta"]["current_performance"]
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rows", nargs="?", type=int, default=500_000)
+    parser.add_argument("--modes", default="columnar,streaming")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--paths", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run_mode(args.run, Path(args.paths[0]), Path(args.paths[1]))
+        return
+    path_530, path_549 = workbook_pair(WORKDIR, args.rows)
+    size_mb = (path_530.stat().st_size + path_549.stat().st_size) / 1024 / 1024
+    print(f"{args.rows} rows per report, {size_mb:.1f} MB of .xlsx")
+    print(f"{'mode':>10} {'seconds':>8} {'peak RSS over baseline (MB)':>28}")
+    for mode in args.modes.split(","):
+        output = subprocess.run(
+            [sys.executable, __file__, "--run", mode, "--paths", str(path_530), str(path_549)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>10} {result['seconds']:>8} {result['peak_rss_mb']:>28}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+In-memory stand-in for the Motor database used by the API benchmarks.
+
+Implements just the collection/cursor calls the backend makes, with Mongo's
+query semantics for plain equality filters, the comparison operators in use and
+the $match/$group/$sort/$skip/$limit aggregation stages.
+"""
+
+import copy
+from types import SimpleNamespace
+
+from pymongo.errors import DuplicateKeyError
+
+OPERATORS = {
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$ne": lambda value, arg: value != arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+    "$exists": lambda value, arg: (value is not None) == arg,
+}
+
+
+def _get(doc, dotted):
+    for part in dotted.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def _sort_key(value):
+    if isinstance(value, dict):
+        return (True, tuple(_sort_key(item) for item in value.values()))
+    return (value is not None, value)
+
+
+def _set(doc, dotted, value):
+    *parents, leaf = dotted.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[leaf] = value
+
+
+def matches(doc, query):
+    for key, expected in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, clause) for clause in expected):
+                return False
+            continue
+        value = _get(doc, key)
+        if isinstance(expected, dict) and expected and all(op.startswith("$") for op in expected):
+            if not all(OPERATORS[op](value, arg) for op, arg in expected.items()):
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+def project(doc, projection):
+    if not projection:
+        return doc
+    included = [key for key, flag in projection.items() if flag and key != "_id"]
+    if included or all(projection.values()):
+        result = {}
+        for key in included:
+            source, target = doc, result
+            *parents, leaf = key.split(".")
+            for part in parents:
+                source = source.get(part) if isinstance(source, dict) else None
+                target = target.setdefault(part, {})
+            if isinstance(source, dict) and leaf in source:
+                target[leaf] = source[leaf]
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    return {key: value for key, value in doc.items() if key not in projection}
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self._docs.sort(key=lambda doc: _sort_key(_get(doc, field)), reverse=order < 0)
+        return self
+
+    def skip(self, count):
+        self._docs = self._docs[count:]
+        return self
+
+    def limit(self, count):
+        if count:
+            self._docs = self._docs[:count]
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    async def to_list(self, length):
+        docs = self._docs if length is None else self._docs[:length]
+        return [copy.deepcopy(doc) for doc in docs]
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return copy.deepcopy(next(self._iter))
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+        self._next_id = 1
+
+    def find(self, query=None, projection=None, **kwargs):
+        return FakeCursor([project(doc, projection) for doc in self.docs if matches(doc, query)])
+
+    async def find_one(self, query=None, projection=None, sort=None, **kwargs):
+        docs = [doc for doc in self.docs if matches(doc, query)]
+        if sort:
+            docs = FakeCursor(docs).sort(sort)._docs
+        return copy.deepcopy(project(docs[0], projection)) if docs else None
+
+    async def insert_one(self, document, **kwargs):
+        if "_id" in document and any(doc["_id"] == document["_id"] for doc in self.docs):
+            raise DuplicateKeyError(f"duplicate key: {document['_id']!r}")
+        document.setdefault("_id", self._next_id)
+        self._next_id += 1
+        self.docs.append(copy.deepcopy(document))
+
+    async def insert_many(self, documents, **kwargs):
+        for document in documents:
+            await self.insert_one(document)
+
+    def _apply(self, doc, update):
+        for key, value in update.get("$set", {}).items():
+            _set(doc, key, copy.deepcopy(value))
+        for key, value in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + value
+        for key in update.get("$unset", {}):
+            doc.pop(key, None)
+
+    async def update_one(self, query, update, upsert=False, **kwargs):
+        for doc in self.docs:
+            if matches(doc, query):
+                self._apply(doc, update)
+                return
+        if upsert:
+            doc = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            self._apply(doc, {"$set": update.get("$setOnInsert", {})})
+            self._apply(doc, update)
+            await self.insert_one(doc)
+
+    async def replace_one(self, query, replacement, upsert=False, **kwargs):
+        for i, doc in enumerate(self.docs):
+            if matches(doc, query):
+                self.docs[i] = dict(copy.deepcopy(replacement), _id=doc["_id"])
+                return
+        if upsert:
+            await self.insert_one(dict(replacement))
+
+    async def update_many(self, query, update, **kwargs):
+        for doc in self.docs:
+            if matches(doc, query):
+                self._apply(doc, update)
+
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        """UpdateOne requests only (pymongo keeps their filter and update on _filter/_doc)"""
+        matched = 0
+        for request in requests:
+            for doc in self.docs:
+                if matches(doc, request._filter):
+                    self._apply(doc, request._doc)
+                    matched += 1
+                    break
+        return SimpleNamespace(matched_count=matched, modified_count=matched, upserted_count=0)
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=False, **kwargs):
+        for doc in self.docs:
+            if matches(doc, query):
+                before = copy.deepcopy(doc)
+                self._apply(doc, update)
+                return copy.deepcopy(doc) if return_document else before
+        if upsert:
+            await self.update_one(query, update, upsert=True)
+            return copy.deepcopy(self.docs[-1]) if return_document else None
+        return None
+
+    async def delete_one(self, query, **kwargs):
+        for i, doc in enumerate(self.docs):
+            if matches(doc, query):
+                del self.docs[i]
+                return
+
+    async def delete_many(self, query, **kwargs):
+        self.docs = [doc for doc in self.docs if not matches(doc, query)]
+
+    def aggregate(self, pipeline, **kwargs):
+        docs = [copy.deepcopy(doc) for doc in self.docs]
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == "$match":
+                docs = [doc for doc in docs if matches(doc, spec)]
+            elif operator == "$group":
+                groups = {}
+                for doc in docs:
+                    key = {name: _get(doc, path[1:]) for name, path in spec["_id"].items()}
+                    group = groups.setdefault(repr(sorted(key.items())), {"_id": key})
+                    for name, accumulator in spec.items():
+                        if name != "_id":
+                            group[name] = group.get(name, 0) + (_get(doc, accumulator["$sum"][1:]) or 0)
+                docs = list(groups.values())
+            elif operator == "$sort":
+                docs = FakeCursor(docs).sort(list(spec.items()))._docs
+            elif operator == "$skip":
+                docs = docs[spec:]
+            elif operator == "$limit":
+                docs = docs[:spec]
+        return FakeCursor(docs)
+
+    async def count_documents(self, query=None, **kwargs):
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    async def create_index(self, keys, **kwargs):
+        return kwargs.get("name", str(keys))
+
+
+class FakeGridOut:
+    def __init__(self, data):
+        self._data = data
+
+    async def read(self):
+        return self._data
+
+
+class FakeGridFSBucket:
+    def __init__(self):
+        self.files = {}
+
+    async def upload_from_stream(self, filename, source, metadata=None):
+        from bson import ObjectId
+
+        file_id = ObjectId()
+        data = source.read() if hasattr(source, "read") else bytes(source)
+        self.files[file_id] = {"filename": filename, "data": data, "metadata": metadata}
+        return file_id
+
+    async def open_download_stream(self, file_id):
+        return FakeGridOut(self.files[file_id]["data"])
+
+    async def delete(self, file_id):
+        self.files.pop(file_id, None)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections = {}
+        self.gridfs = FakeGridFSBucket()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        return self._collections.setdefault(name, FakeCollection())
+
+
+def install():
+    """Point the backend modules at a fresh in-memory database (and GridFS bucket); returns the database"""
+    import database
+    import storage
+
+    fake = FakeDatabase()
+    database.db = fake
+    storage.get_raw_reports_bucket = lambda: fake.gridfs
+    return fake
@@ -0,0 +1,168 @@
+"""
+Load test: concurrent uploads and dashboard reads against one app instance.
+
+--uploaders clients post synthetic 530/549 pairs to /api/upload-reports in a
+loop, each upload for a new month so none is answered from the upload cache
+(after the first, the parsed-report cache skips parsing, so uploads mostly
+exercise the write path: analysis, charts payload, rollup and facts; uploads
+beyond UPLOAD_MAX_IN_FLIGHT are answered 429, counted as rejected, and the
+client waits for their Retry-After). At the
+same time --readers clients replay dashboard reads: the analyses summary page,
+a charts payload, trends and facts. Everything shares the server's Mongo client,
+so the MONGO_* pool, write concern and compression settings apply.
+
+Prints requests per second and p50/p95/p99 latency per request kind for the
+--duration window. The database named by DB_NAME is dropped first; --fake runs
+on the in-memory database instead (a smoke test of the app alone).
+
+Usage: python backend/benchmarks/load_test.py [--rows 2000] [--uploaders 4] [--readers 16] [--duration 30] [--fake]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import fake_mongo
+from synthetic import load_backend, workbook_pair
+
+analyses = load_backend("analyses")
+database = load_backend("database")
+parsing = load_backend("parsing")
+server = load_backend()
+
+WORKDIR = Path(tempfile.gettempdir()) / "helibombas_bench"
+SETTINGS = {
+    database: ["MONGO_MAX_POOL_SIZE", "MONGO_MIN_POOL_SIZE", "MONGO_WAIT_QUEUE_TIMEOUT_MS", "MONGO_WRITE_CONCERN",
+               "MONGO_WRITE_JOURNAL", "MONGO_CURSOR_BATCH_SIZE"],
+    parsing: ["RAW_REPORT_STORAGE", "PARSER_EXECUTOR", "PARSER_WORKERS"],
+    server: ["UPLOAD_MAX_IN_FLIGHT", "UPLOAD_MAX_IN_FLIGHT_BYTES"],
+    analyses: ["MONTH_LOCK"]
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.rejected = {}
+
+    async def timed(self, kind, request):
+        """The response, or None on an error; a 429 counts as rejected and returns its Retry-After seconds"""
+        start = time.perf_counter()
+        try:
+            response = await request
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        if ok:
+            self.latencies.setdefault(kind, []).append((time.perf_counter() - start) * 1000)
+        elif response is not None and response.status_code == 429:
+            self.rejected[kind] = self.rejected.get(kind, 0) + 1
+            return float(response.headers.get("Retry-After", 1))
+        else:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+        return response if ok else None
+
+
+async def uploader(api, recorder, files, months, deadline):
+    while time.perf_counter() < deadline:
+        month = next(months)
+        result = await recorder.timed("upload", api.post("/api/upload-reports", data={"month_year": month}, files=files))
+        if isinstance(result, float):
+            # Admission control said the server is saturated: wait as told, like a well-behaved client
+            await asyncio.sleep(min(result, max(0.0, deadline - time.perf_counter())))
+
+
+async def reader(api, recorder, seed, deadline):
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        response = await recorder.timed("analyses", api.get("/api/analyses", params={"view": "summary", "limit": 20}))
+        analyses = response.json() if response is not None else []
+        if analyses:
+            analysis_id = rng.choice(analyses)["id"]
+            await recorder.timed("charts", api.get(f"/api/analyses/{analysis_id}/charts", headers={"Accept-Encoding": "gzip"}))
+        await recorder.timed("trends", api.get("/api/trends", params={"start": "2000-01", "end": "2099-12"}))
+        await recorder.timed("facts", api.get("/api/facts", params={"report": "530", "group_by": "client", "limit": 50}))
+
+
+def month_sequence():
+    n = 0
+    while True:
+        yield f"{2000 + n // 12}-{n % 12 + 1:02d}"
+        n += 1
+
+
+async def run(args):
+    import httpx
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.fake:
+        fake_mongo.install()
+    else:
+        await database.client.drop_database(database.db.name)
+        await server.ensure_indexes()
+    path_530, path_549 = workbook_pair(WORKDIR, args.rows)
+    files = {"report_530": (path_530.name, path_530.read_bytes()), "report_549": (path_549.name, path_549.read_bytes())}
+    months = month_sequence()
+    recorder = Recorder()
+    transport = httpx.ASGITransport(app=server.app)
+    limits = httpx.Limits(max_connections=None)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=None, limits=limits) as api:
+            # One upload first so the readers have data, and the parser pool is warm
+            await api.post("/api/upload-reports", data={"month_year": next(months)}, files=files)
+            deadline = time.perf_counter() + args.duration
+            start = time.perf_counter()
+            await asyncio.gather(
+                *(uploader(api, recorder, files, months, deadline) for _ in range(args.uploaders)),
+                *(reader(api, recorder, seed, deadline) for seed in range(args.readers))
+            )
+            elapsed = time.perf_counter() - start
+    finally:
+        parsing.shutdown_parser_executor()
+    return recorder, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000, help="rows per uploaded report")
+    parser.add_argument("--uploaders", type=int, default=4, help="concurrent upload clients")
+    parser.add_argument("--readers", type=int, default=16, help="concurrent dashboard clients")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--fake", action="store_true", help="use the in-memory database")
+    args = parser.parse_args()
+    with contextlib.redirect_stdout(io.StringIO()):
+        recorder, elapsed = asyncio.run(run(args))
+
+    print(f"{args.uploaders} uploaders, {args.readers} readers, {elapsed:.1f}s, {args.rows} rows per report, "
+          f"{'in-memory database' if args.fake else 'mongo'}")
+    settings = (f"{name}={getattr(module, name)}" for module, names in SETTINGS.items() for name in names)
+    print(", ".join(settings) + f", compressors={database.mongo_compressors()}")
+    print(f"{'request':>9} {'count':>7} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'errors':>7} {'429':>5}")
+    for kind in ("upload", "analyses", "charts", "trends", "facts"):
+        latencies = recorder.latencies.get(kind, [])
+        errors = recorder.errors.get(kind, 0)
+        rejected = recorder.rejected.get(kind, 0)
+        if not latencies:
+            print(f"{kind:>9} {0:>7} {0:>8.1f} {'-':>9} {'-':>9} {'-':>9} {errors:>7} {rejected:>5}")
+            continue
+        print(
+            f"{kind:>9} {len(latencies):>7} {len(latencies) / elapsed:>8.1f} {statistics.median(latencies):>9.1f} "
+            f"{percentile(latencies, 0.95):>9.1f} {percentile(latencies, 0.99):>9.1f} {errors:>7} {rejected:>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
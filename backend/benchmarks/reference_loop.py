@@ -0,0 +1,195 @@
+"""
+Row-by-row reference implementation of process_real_data.
+
+This is the original per-record loop that parsing.process_real_data replaced
+with grouped, vectorized sums. The benchmarks keep it to time the two against
+each other and to check that both produce identical charts JSON.
+"""
+
+import logging
+from typing import Any, Dict
+
+from synthetic import load_backend
+
+
+def process_real_data_loop(report_530_data: Dict, report_549_data: Dict, meta_target: float) -> Dict[str, Any]:
+    """Process real Helibombas data from reports 530 and 549 (row-by-row reference version)"""
+    try:
+        logging.debug(f"Processing real data - 530: {report_530_data.keys()}, 549: {report_549_data.keys()}")
+        
+        # Extract data from report 530 (sheet1)
+        data_530 = report_530_data.get('sheets', {}).get('sheet1', [])
+        logging.debug(f"Data 530 records: {len(data_530)}")
+        
+        # Extract data from report 549 (Planilha1) 
+        data_549 = report_549_data.get('sheets', {}).get('Planilha1', [])
+        logging.debug(f"Data 549 records: {len(data_549)}")
+        
+        if not data_530:
+            logging.warning("No data 530 found, using mock data")
+            return load_backend("parsing").generate_mock_chart_data()  # Fallback to mock data
+        
+        if not data_549:
+            logging.warning("No data 549 found, will process with 530 data only")
+        
+        # Calculate real performance vs meta
+        total_vendas_530 = sum(float(row.get('Vlr.Total', 0)) for row in data_530 if row.get('Vlr.Total'))
+        
+        # Get real external sellers from 549 (if available)
+        vendedores_externos = {}
+        if data_549:
+            for row in data_549:
+                vendedor = row.get('VENDEDOR EXTERNO')
+                valor = row.get('VLR. TOTAL', 0)
+                if vendedor and vendedor != 'HELIBOMBAS' and valor:  # Exclude HELIBOMBAS as it's internal
+                    valor = float(valor) if valor else 0
+                    if vendedor in vendedores_externos:
+                        vendedores_externos[vendedor] += valor
+                    else:
+                        vendedores_externos[vendedor] = valor
+        
+        # Format external sellers for chart (with fallback data if no 549 data)
+        external_sellers = []
+        if vendedores_externos:
+            for vendedor, valor in sorted(vendedores_externos.items(), key=lambda x: x[1], reverse=True)[:5]:
+                external_sellers.append({
+                    "name": vendedor,
+                    "sales": valor,
+                    "growth": 0  # Would need historical data for real growth
+                })
+        else:
+            # Use mock data for external sellers if no 549 data
+            external_sellers = [
+                {"name": "Sem dados vendedor externo", "sales": 0, "growth": 0}
+            ]
+        
+        # Get real geographic distribution from 549 (if available)
+        estados_vendas = {}
+        if data_549:
+            for row in data_549:
+                estado = row.get('UF')
+                valor = row.get('VLR. TOTAL', 0)
+                if estado and valor:
+                    valor = float(valor) if valor else 0
+                    if estado in estados_vendas:
+                        estados_vendas[estado] += valor
+                    else:
+                        estados_vendas[estado] = valor
+        
+        geographic_distribution = []
+        if estados_vendas:
+            total_geographic = sum(estados_vendas.values()) if estados_vendas else 1
+            for estado, valor in sorted(estados_vendas.items(), key=lambda x: x[1], reverse=True)[:5]:
+                percentage = (valor / total_geographic) * 100 if total_geographic > 0 else 0
+                geographic_distribution.append({
+                    "state": estado,
+                    "value": valor,
+                    "percentage": round(percentage, 1)
+                })
+        else:
+            # Mock geographic data if no 549 data
+            geographic_distribution = [
+                {"state": "Dados não disponíveis", "value": total_vendas_530, "percentage": 100.0}
+            ]
+        
+        # Get real main clients from 530
+        clientes_vendas = {}
+        for row in data_530:
+            cliente = row.get('Cliente')
+            valor = row.get('Vlr.Total', 0)
+            if cliente and valor:
+                valor = float(valor) if valor else 0
+                if cliente in clientes_vendas:
+                    clientes_vendas[cliente] += valor
+                else:
+                    clientes_vendas[cliente] = valor
+        
+        main_clients = []
+        for cliente, valor in sorted(clientes_vendas.items(), key=lambda x: x[1], reverse=True)[:5]:
+            percentage = (valor / total_vendas_530) * 100 if total_vendas_530 > 0 else 0
+            main_clients.append({
+                "client": cliente,
+                "value": valor,
+                "percentage": round(percentage, 1)
+            })
+        
+        # Get real product analysis from 530
+        produtos_vendas = {}
+        produtos_qtd = {}
+        for row in data_530:
+            produto = row.get('Descrição')
+            valor = row.get('Vlr.Total', 0)
+            qtd = row.get('Qtde', 0)
+            if produto and valor:
+                valor = float(valor) if valor else 0
+                qtd = float(qtd) if qtd else 0
+                if produto in produtos_vendas:
+                    produtos_vendas[produto] += valor
+                    produtos_qtd[produto] += qtd
+                else:
+                    produtos_vendas[produto] = valor
+                    produtos_qtd[produto] = qtd
+        
+        product_analysis = []
+        for produto, valor in sorted(produtos_vendas.items(), key=lambda x: x[1], reverse=True)[:5]:
+            qtd = produtos_qtd.get(produto, 0)
+            # Truncate long product names
+            produto_nome = produto[:30] + "..." if len(str(produto)) > 30 else produto
+            product_analysis.append({
+                "product": produto_nome,
+                "quantity": int(qtd),
+                "revenue": valor
+            })
+        
+        # Calculate production status from 549 (if available)
+        production_status = {"completed": 95, "in_progress": 3, "delayed": 2}  # Default values
+        if data_549:
+            status_count = {}
+            for row in data_549:
+                status = row.get('STATUS')
+                if status:
+                    if status in status_count:
+                        status_count[status] += 1
+                    else:
+                        status_count[status] = 1
+            
+            if status_count:
+                total_orders = sum(status_count.values())
+                production_status = {
+                    "completed": round((status_count.get('F', 0) / total_orders) * 100, 0),
+                    "in_progress": round((status_count.get('L', 0) / total_orders) * 100, 0),
+                    "delayed": round((status_count.get('V', 0) / total_orders) * 100, 0)
+                }
+        
+        # Calculate real KPIs
+        total_clients = len(clientes_vendas) if clientes_vendas else 1
+        total_products = len(produtos_vendas) if produtos_vendas else 1
+        avg_ticket = total_vendas_530 / total_clients if total_clients > 0 else 0
+        
+        logging.debug(f"Total vendas from 530: {total_vendas_530}")
+        logging.debug(f"Number of clients: {len(clientes_vendas)}")
+        logging.debug(f"Number of products: {len(produtos_vendas)}")
+        logging.debug(f"Number of vendedores externos: {len(vendedores_externos)}")
+        
+        return {
+            "performance_vs_meta": {
+                "current_performance": total_vendas_530,
+                "meta_target": meta_target,
+                "percentage": round((total_vendas_530 / meta_target) * 100, 1) if meta_target > 0 else 0
+            },
+            "geographic_distribution": geographic_distribution,
+            "external_sellers": external_sellers,
+            "main_clients": main_clients,
+            "product_analysis": product_analysis,
+            "production_status": production_status,
+            "kpis": {
+                "conversion_rate": 8.7,  # Would need more data to calculate
+                "average_ticket": round(avg_ticket, 2),
+                "client_retention": 92.3,  # Would need historical data
+                "sales_cycle": 18  # Would need more data to calculate
+            }
+        }
+        
+    except Exception as e:
+        logging.error(f"Error processing real data: {e}")
+        return load_backend("parsing").generate_mock_chart_data()  # Fallback to mock data
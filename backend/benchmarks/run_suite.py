@@ -0,0 +1,227 @@
+"""
+Benchmark suite: one JSON result file per run, comparable between commits.
+
+For each size, synthetic 530/549 workbooks (and PDFs with --pdf-pages) are
+generated once under the temp dir, then these cases are timed:
+
+  extract      extract_report on the .xlsx bytes (EXCEL_INGESTION/EXCEL_ENGINE as configured)
+  extract_pdf  extract_pdf_pages over a whole synthetic PDF
+  aggregate    _aggregate_report_data on the extracted report
+  pack         pack_report_data: the raw report as it is stored (RAW_REPORT_STORAGE)
+  recompute    aggregate_columnar_report: chart aggregates from the memory-mapped columnar cache
+  serialize    prepare_for_mongo on an analysis with both reports as row dicts
+  upload       POST /api/upload-reports through the FastAPI app, buffered
+  upload_streaming  the same with UPLOAD_MODE=streaming
+
+Uploads run against the in-memory database (benchmarks/fake_mongo.py), a fresh
+one per run so no upload or parse cache is hit; they time the app, not Mongo.
+Results go to benchmarks/results/<commit>.json unless --output is given.
+--compare OLD.json prints the change per case and exits with status 1 when a
+case got slower than --threshold (best-of-runs ratio).
+
+Usage: python backend/benchmarks/run_suite.py [--sizes 10000,100000] [--pdf-pages 20] [--repeat 3]
+                                              [--cases extract,aggregate,...] [--output FILE] [--compare OLD.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import fake_mongo
+from synthetic import BACKEND_DIR, load_backend, pdf_pair, report_payloads, workbook_pair
+
+parsing = load_backend("parsing")
+server = load_backend()
+
+WORKDIR = Path(tempfile.gettempdir()) / "helibombas_bench"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+CASES = ["extract", "extract_pdf", "aggregate", "pack", "recompute", "serialize", "upload", "upload_streaming"]
+SETTINGS = ["PARSER_EXECUTOR", "PARSER_WORKERS", "EXCEL_INGESTION", "EXCEL_ENGINE", "RAW_REPORT_STORAGE", "UPLOAD_MODE"]
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    return commit, bool(git("status", "--porcelain", "--untracked-files=no"))
+
+
+def timed_runs(func, repeat):
+    """Seconds of each run; func is called once more beforehand as a warm-up"""
+    func()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def result(case, report_type, size, unit, runs, rows):
+    best = min(runs)
+    return {
+        "case": case,
+        "report": report_type,
+        "size": size,
+        "unit": unit,
+        "best_s": round(best, 5),
+        "median_s": round(statistics.median(runs), 5),
+        "runs": [round(run, 5) for run in runs],
+        "rows_per_s": round(rows / best, 1) if best else None
+    }
+
+
+def upload_runs(path_530, path_549, repeat, streaming):
+    import httpx
+
+    files = {"report_530": (path_530.name, path_530.read_bytes()), "report_549": (path_549.name, path_549.read_bytes())}
+
+    async def upload():
+        # A fresh database per run: nothing comes from the upload or parsed-report caches
+        fake_mongo.install()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as api:
+            response = await api.post("/api/upload-reports", data={"month_year": "2025-01"}, files=files)
+            response.raise_for_status()
+
+    mode = parsing.UPLOAD_MODE
+    parsing.UPLOAD_MODE = "streaming" if streaming else "buffered"
+    try:
+        return timed_runs(lambda: asyncio.run(upload()), repeat)
+    finally:
+        parsing.UPLOAD_MODE = mode
+        parsing.shutdown_parser_executor()
+
+
+def run_size(rows, cases, repeat):
+    path_530, path_549 = workbook_pair(WORKDIR, rows)
+    results = []
+    for report_type, path in (("530", path_530), ("549", path_549)):
+        content = path.read_bytes()
+        report_data = parsing.extract_report(content, path.name, report_type)
+        if "extract" in cases:
+            runs = timed_runs(lambda: parsing.extract_report(content, path.name, report_type), repeat)
+            results.append(result("extract", report_type, rows, "rows", runs, rows))
+        if "aggregate" in cases:
+            runs = timed_runs(lambda: parsing.aggregate_report_data(report_data, report_type), repeat)
+            results.append(result("aggregate", report_type, rows, "rows", runs, rows))
+        if "pack" in cases:
+            runs = timed_runs(lambda: parsing.pack_report_data(report_data), repeat)
+            results.append(result("pack", report_type, rows, "rows", runs, rows))
+        if "recompute" in cases:
+            cache_path = WORKDIR / "columnar" / f"{report_type}_{rows}"
+            shutil.rmtree(cache_path, ignore_errors=True)
+            parsing.columnar_job(cache_path, parsing.aggregate_report_data, report_data, report_type)
+            runs = timed_runs(lambda: parsing.aggregate_columnar_report(cache_path, report_type), repeat)
+            results.append(result("recompute", report_type, rows, "rows", runs, rows))
+    if "serialize" in cases:
+        report_530, report_549 = report_payloads(rows, rows)
+        analysis = {
+            "id": "bench", "month_year": "2025-01", "created_at": datetime.now(timezone.utc),
+            "report_530_data": report_530, "report_549_data": report_549,
+            "charts_data": parsing.generate_mock_chart_data()
+        }
+        runs = timed_runs(lambda: parsing.prepare_for_mongo(analysis), repeat)
+        results.append(result("serialize", "", rows, "rows", runs, 2 * rows))
+    for case in ("upload", "upload_streaming"):
+        if case in cases:
+            runs = upload_runs(path_530, path_549, repeat, case == "upload_streaming")
+            results.append(result(case, "", rows, "rows", runs, 2 * rows))
+    return results
+
+
+def run_pdf(pages, repeat):
+    path_530, path_549 = pdf_pair(WORKDIR, pages)
+    results = []
+    for report_type, path in (("530", path_530), ("549", path_549)):
+        rows = parsing.extract_pdf_pages(path, report_type)["row_count"]
+        runs = timed_runs(lambda: parsing.extract_pdf_pages(path, report_type), repeat)
+        results.append(result("extract_pdf", report_type, pages, "pages", runs, rows))
+    return results
+
+
+def compare(results, meta, baseline_path, threshold):
+    """Print the best-time ratio per case against an earlier result file; True if any case regressed"""
+    baseline = json.loads(Path(baseline_path).read_text())
+    previous = {(r["case"], r["report"], r["size"]): r for r in baseline["results"]}
+    print(f"\nvs {baseline['meta']['commit']} ({baseline_path})")
+    for key in ("python", "cpu_count", "settings"):
+        if baseline["meta"].get(key) != meta[key]:
+            print(f"note: {key} differs: {baseline['meta'].get(key)} then, {meta[key]} now")
+    print(f"{'case':>17} {'report':>6} {'size':>8} {'before (s)':>11} {'now (s)':>9} {'ratio':>7}")
+    regressed = False
+    for r in results:
+        old = previous.get((r["case"], r["report"], r["size"]))
+        if old is None:
+            continue
+        ratio = r["best_s"] / old["best_s"] if old["best_s"] else float("inf")
+        flag = "  SLOWER" if ratio > threshold else ""
+        regressed = regressed or bool(flag)
+        print(f"{r['case']:>17} {r['report']:>6} {r['size']:>8} {old['best_s']:>11.4f} {r['best_s']:>9.4f} {ratio:>6.2f}x{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000", help="rows per report, comma separated")
+    parser.add_argument("--pdf-pages", type=int, default=20, help="pages per PDF report (0 skips extract_pdf)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--output", help="result file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+    cases = set(args.cases.split(","))
+    unknown = cases - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    logging.getLogger().setLevel(logging.WARNING)
+    commit, dirty = git_revision()
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for rows in [int(size) for size in args.sizes.split(",") if size]:
+            results.extend(run_size(rows, cases, args.repeat))
+        if "extract_pdf" in cases and args.pdf_pages:
+            results.extend(run_pdf(args.pdf_pages, args.repeat))
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "settings": {name: str(getattr(parsing, name)) for name in SETTINGS}
+        },
+        "results": results
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit}{'-dirty' if dirty else ''}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    print(f"{commit}{' (dirty)' if dirty else ''}, python {report['meta']['python']}, {report['meta']['cpu_count']} CPUs")
+    print(f"{'case':>17} {'report':>6} {'size':>8} {'best (s)':>9} {'median (s)':>11} {'rows/s':>11}")
+    for r in results:
+        print(f"{r['case']:>17} {r['report']:>6} {r['size']:>8} {r['best_s']:>9.4f} {r['median_s']:>11.4f} {r['rows_per_s'] or 0:>11.0f}")
+    print(f"results written to {output}")
+    if args.compare and compare(results, report["meta"], args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
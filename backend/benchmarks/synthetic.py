@@ -0,0 +1,170 @@
+"""
+Synthetic Helibombas report generators shared by the benchmark scripts.
+
+Rows follow the real layouts: report 530 (`sheet1`: Cliente, Descrição, Qtde,
+Vlr.Total) and report 549 (`Planilha1`: VENDEDOR EXTERNO, UF, VLR. TOTAL, STATUS),
+written as .xlsx workbooks or as paginated PDF tables.
+"""
+
+import importlib
+import os
+import random
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+UFS = ["SP", "RJ", "MG", "PR", "SC", "RS", "BA", "GO", "PE", "ES", "CE", "MT"]
+STATUSES = ["F", "F", "F", "L", "V"]
+
+
+def load_backend(module="server"):
+    """Import a backend module (server.py or one of the modules it is split into) without needing a real .env"""
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "helibombas_bench")
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    return importlib.import_module(module)
+
+
+def iter_rows_530(rows, seed=530, clients=2000, products=800):
+    """Yield report 530 rows; blank cells are "" like in extract_excel_data records"""
+    rng = random.Random(seed)
+    for _ in range(rows):
+        yield {
+            "Cliente": f"CLIENTE {rng.randrange(clients):05d} LTDA",
+            "Descrição": f"BOMBA HELICOIDAL MODELO {rng.randrange(products):04d} INOX COM MOTOR",
+            "Qtde": rng.choice([1, 1, 2, 3, 5, 10, ""]),
+            "Vlr.Total": rng.choice([round(rng.uniform(50, 25000), 2), round(rng.uniform(50, 25000), 2), 0, ""])
+        }
+
+
+def iter_rows_549(rows, seed=549, sellers=40):
+    """Yield report 549 rows; blank cells are "" like in extract_excel_data records"""
+    rng = random.Random(seed)
+    for _ in range(rows):
+        seller = "HELIBOMBAS" if rng.random() < 0.2 else f"REPRESENTANTE {rng.randrange(sellers):02d}"
+        yield {
+            "VENDEDOR EXTERNO": seller,
+            "UF": rng.choice(UFS + [""]),
+            "VLR. TOTAL": rng.choice([round(rng.uniform(100, 50000), 2), 0, ""]),
+            "STATUS": rng.choice(STATUSES + [""])
+        }
+
+
+def records_530(rows, seed=530):
+    """Report 530 rows in the list-of-dicts shape produced by extract_excel_data"""
+    return list(iter_rows_530(rows, seed))
+
+
+def records_549(rows, seed=549):
+    """Report 549 rows in the list-of-dicts shape produced by extract_excel_data"""
+    return list(iter_rows_549(rows, seed))
+
+
+def write_workbook(path, sheet_name, rows):
+    """Stream rows (dicts) into an .xlsx with openpyxl write-only mode; blanks become empty cells"""
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    header = None
+    for row in rows:
+        if header is None:
+            header = list(row)
+            worksheet.append(header)
+        worksheet.append([None if row[col] == "" else row[col] for col in header])
+    workbook.save(path)
+    return Path(path)
+
+
+def workbook_pair(directory, rows):
+    """Create (or reuse) synthetic 530/549 workbooks with `rows` rows each"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path_530 = directory / f"530_{rows}.xlsx"
+    path_549 = directory / f"549_{rows}.xlsx"
+    if not path_530.exists():
+        write_workbook(path_530, "sheet1", iter_rows_530(rows))
+    if not path_549.exists():
+        write_workbook(path_549, "Planilha1", iter_rows_549(rows))
+    return path_530, path_549
+
+
+# x positions (points) of the PDF table columns: (header, left edge, right edge for right-aligned numbers)
+PDF_COLUMNS = {
+    "530": [("Código", 30, None), ("Cliente", 70, None), ("Descrição", 170, None), ("Qtde", None, 420), ("Vlr.Total", None, 500)],
+    "549": [("VENDEDOR EXTERNO", 40, None), ("UF", 200, None), ("VLR. TOTAL", None, 330), ("STATUS", 360, None)]
+}
+
+
+def format_brl(value):
+    """pt-BR number as printed in the ERP PDFs: 1.234,56"""
+    return f"{value:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def write_pdf_report(path, report_type, rows, rows_per_page=50, fontsize=7):
+    """Write report rows as a paginated PDF table: title, header repeated per page, footer, "Total" line"""
+    import fitz
+
+    columns = PDF_COLUMNS[report_type]
+    font = fitz.Font("helv")
+    doc = fitz.open()
+    pages = []
+    total = 0.0
+
+    def put(text, left, right, y):
+        x = left if right is None else right - font.text_length(text, fontsize=fontsize)
+        pages[-1].append((x, y), text, font=font, fontsize=fontsize)
+
+    def new_page():
+        pages.append(fitz.TextWriter(fitz.paper_rect("a4")))
+        put(f"HELIBOMBAS - RELATÓRIO {report_type}", 30, None, 40)
+        for header, left, right in columns:
+            put(header, left, right, 70)
+        put(f"Página {len(pages)}", 30, None, 820)
+
+    y = 70
+    for index, row in enumerate(rows):
+        if index % rows_per_page == 0:
+            new_page()
+            y = 70
+        y += 14
+        for header, left, right in columns:
+            value = index if header == "Código" else row[header]
+            if isinstance(value, float):
+                total += value if header in ("Vlr.Total", "VLR. TOTAL") else 0
+                value = format_brl(value)
+            if value != "":
+                put(str(value), left, right, y)
+    if not pages:
+        new_page()
+    put("Total", columns[0][1] or 30, None, y + 20)
+    put(format_brl(total), None, [right for _, _, right in columns if right][-1], y + 20)
+    for writer in pages:
+        writer.write_text(doc.new_page())
+    doc.save(path, garbage=0, deflate=True)
+    doc.close()
+    return Path(path)
+
+
+def pdf_pair(directory, pages, rows_per_page=50):
+    """Create (or reuse) synthetic 530/549 PDF reports with `pages` pages each"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rows = pages * rows_per_page
+    path_530 = directory / f"530_{pages}p.pdf"
+    path_549 = directory / f"549_{pages}p.pdf"
+    if not path_530.exists():
+        write_pdf_report(path_530, "530", iter_rows_530(rows), rows_per_page)
+    if not path_549.exists():
+        write_pdf_report(path_549, "549", iter_rows_549(rows), rows_per_page)
+    return path_530, path_549
+
+
+def report_payloads(rows_530, rows_549):
+    """(report_530_data, report_549_data) dicts as handed to process_real_data"""
+    return (
+        {"sheets": {"sheet1": records_530(rows_530)}, "success": True},
+        {"sheets": {"Planilha1": records_549(rows_549)}, "success": True}
+    )
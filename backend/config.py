@@ -0,0 +1,5 @@
+"""Backend settings location: backend/.env is loaded here, before any module reads its environment"""
+from pathlib import Path
+from dotenv import load_dotenv
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
@@ -0,0 +1,62 @@
+"""MongoDB connection shared by the API, the job workers and the maintenance scripts"""
+from __future__ import annotations
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.write_concern import WriteConcern
+import os
+import importlib.util
+from typing import List, Dict, Any
+import config  # Loads backend/.env
+# MongoDB connection
+# One client (and connection pool) per process, shared by the API and the job workers.
+# Pool size bounds the concurrent operations of a process; further operations wait up to
+# MONGO_WAIT_QUEUE_TIMEOUT_MS for a free connection.
+mongo_url = os.environ['MONGO_URL']
+MONGO_TLS = os.environ.get('MONGO_TLS', 'true').lower() == 'true'
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '50'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '2'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '120000'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '30000'))
+# Write concern of every write: "majority", or a number of nodes; empty keeps the server default
+MONGO_WRITE_CONCERN = os.environ.get('MONGO_WRITE_CONCERN', 'majority')
+# "true"/"false" to require (or not) the journal; empty keeps the server default
+MONGO_WRITE_JOURNAL = os.environ.get('MONGO_WRITE_JOURNAL', '')
+# Wire compression, in order of preference; codecs whose Python package is missing are skipped
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', 'zstd,snappy,zlib')
+# Documents per cursor batch for unbounded reads (paged endpoints fetch a whole page at once)
+MONGO_CURSOR_BATCH_SIZE = int(os.environ.get('MONGO_CURSOR_BATCH_SIZE', '1000'))
+MONGO_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+def mongo_compressors() -> List[str]:
+    """MONGO_COMPRESSORS that can be used here"""
+    names = [name.strip() for name in MONGO_COMPRESSORS.split(',') if name.strip()]
+    return [name for name in names if name in MONGO_COMPRESSOR_MODULES and importlib.util.find_spec(MONGO_COMPRESSOR_MODULES[name])]
+def mongo_write_concern() -> WriteConcern:
+    """WriteConcern from MONGO_WRITE_CONCERN and MONGO_WRITE_JOURNAL"""
+    if not MONGO_WRITE_CONCERN:
+        return WriteConcern()
+    w = int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+    journal = MONGO_WRITE_JOURNAL.lower() == 'true' if MONGO_WRITE_JOURNAL else None
+    return WriteConcern(w=w, j=journal)
+def mongo_client_options() -> Dict[str, Any]:
+    """Keyword arguments of the shared AsyncIOMotorClient"""
+    options = {
+        "tls": MONGO_TLS,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "retryWrites": True
+    }
+    if MONGO_TLS:
+        options["tlsAllowInvalidCertificates"] = False
+    compressors = mongo_compressors()
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+client = AsyncIOMotorClient(mongo_url, **mongo_client_options())
+db = client.get_database(os.environ['DB_NAME'], write_concern=mongo_write_concern())
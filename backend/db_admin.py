@@ -0,0 +1,45 @@
+"""
+Database maintenance CLI for the Helibombas API.
+
+Usage (from backend/):
+    python db_admin.py ensure-indexes   create any missing index (idempotent)
+    python db_admin.py indexes          index definitions and usage counters
+    python db_admin.py explain          query plan per API route; exits 1 on collection scans
+    python db_admin.py recompute-meta   store the meta-dependent fields of every analysis for the current meta
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+import analyses
+import database
+import server
+
+
+async def run(command):
+    if command == "ensure-indexes":
+        result = await server.ensure_indexes()
+    elif command == "indexes":
+        result = await server.collect_index_usage()
+    elif command == "recompute-meta":
+        result = await analyses.recompute_meta_fields()
+    else:
+        result = await server.explain_route_queries()
+    print(json.dumps(result, indent=2, ensure_ascii=False, default=str))
+    database.client.close()
+    if command == "explain" and any(plan["collection_scan"] for plan in result):
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database maintenance for the Helibombas API")
+    parser.add_argument("command", choices=["ensure-indexes", "indexes", "explain", "recompute-meta"])
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.command)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Bulk import of many months of 530/549 reports, e.g. a year of history.
+
+SOURCE is a directory or a .zip of .xlsx/.xls/.pdf files. Without --mapping,
+the report number and month are read from each path: 2025-01/530.xlsx,
+relatorio_549_01-2025.pdf and 530_2025_1.xlsx all work. --mapping names a CSV
+with month_year, report_530 and report_549 columns (paths relative to SOURCE).
+Files are parsed in parallel over the parser pool and months are written in
+batches of IMPORT_BATCH_MONTHS with insert_many. A month that fails is
+reported without stopping the others; the exit status is 1 if any failed.
+Rows with cells that do not parse (e.g. text in a value column) keep their
+other cells and are counted per file in the "bad" column.
+
+Usage (from backend/): python import_reports.py SOURCE [--mapping months.csv] [--workers N] [--batch-months N] [--json report.json] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import jobs
+import parsing
+
+
+def print_month(result):
+    detail = result.get("analysis_id") or result.get("error", "")
+    print(f"{result['month_year']}: {result['status']:<9} {result['rows']:>9} rows  {detail}")
+
+
+def print_files(files):
+    print(f"{'month':>8} {'report':>6} {'MB':>8} {'rows':>9} {'bad':>6} {'seconds':>8} {'rows/s':>10} {'MB/s':>7}  file")
+    for f in files:
+        status = "cache" if f["cached"] else (f"FAILED: {f['error']}" if f.get("error") else "")
+        print(
+            f"{f['month_year']:>8} {f['report_type']:>6} {f['size'] / 1024 / 1024:>8.2f} {f['rows']:>9} {f['bad_rows']:>6} "
+            f"{f['seconds']:>8.2f} {f['rows_per_second'] or 0:>10.0f} {f['mb_per_second'] or 0:>7.2f}  {Path(f['path']).name} {status}"
+        )
+
+
+async def run(args, root):
+    months, problems = jobs.discover_import_months(root, Path(args.mapping) if args.mapping else None)
+    print(f"{len(months)} months found in {args.source}{' (dry run)' if args.dry_run else ''}")
+    for problem in problems:
+        print(f"skipped {problem.get('path') or problem.get('month_year')}: {problem['error']}")
+    if args.dry_run:
+        for month, files in sorted(months.items()):
+            print(f"{month}: {files['530'].relative_to(root)}  {files['549'].relative_to(root)}")
+        return {"months": [], "files": [], "problems": problems}
+    start = time.perf_counter()
+    try:
+        report = await jobs.import_months(months, progress=print_month)
+    finally:
+        parsing.shutdown_parser_executor()
+    elapsed = time.perf_counter() - start
+    print_files(report["files"])
+    statuses = [month["status"] for month in report["months"]]
+    total_mb = sum(f["size"] for f in report["files"]) / 1024 / 1024
+    print(
+        f"{statuses.count('imported')} imported, {statuses.count('unchanged')} unchanged, {statuses.count('failed')} failed "
+        f"in {elapsed:.1f}s ({total_mb / elapsed if elapsed else 0:.2f} MB/s, {parsing.PARSER_WORKERS} workers)"
+    )
+    report["problems"] = problems
+    report["seconds"] = round(elapsed, 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="directory or .zip with the report files")
+    parser.add_argument("--mapping", help="CSV with month_year, report_530 and report_549 columns")
+    parser.add_argument("--workers", type=int, help="parser processes (default PARSER_WORKERS)")
+    parser.add_argument("--batch-months", type=int, help="months per insert_many batch (default IMPORT_BATCH_MONTHS)")
+    parser.add_argument("--json", help="also write the per-month and per-file report to this file")
+    parser.add_argument("--dry-run", action="store_true", help="only list the months that would be imported")
+    args = parser.parse_args()
+    if args.workers:
+        parsing.PARSER_WORKERS = args.workers
+    if args.batch_months:
+        jobs.IMPORT_BATCH_MONTHS = args.batch_months
+    source = Path(args.source)
+    with tempfile.TemporaryDirectory(prefix="helibombas_import_") as workdir:
+        root = jobs.extract_import_archive(source, Path(workdir)) if source.suffix.lower() == ".zip" else source
+        report = asyncio.run(run(args, root))
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    failed = any(month["status"] == "failed" for month in report["months"]) or report["problems"]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""Background upload jobs and the batch import of report history"""
+from __future__ import annotations
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+import os
+import re
+import logging
+from pathlib import Path
+from typing import List, Optional, Dict, Any
+from datetime import datetime, timedelta, timezone
+import asyncio
+import contextlib
+import csv
+import hashlib
+import time
+import zipfile
+import database
+from database import MONGO_CURSOR_BATCH_SIZE
+from analyses import (analysis_content_key, analyze_reports, build_analysis_document, build_charts_payload,
+                      cache_charts_payload, cache_parsed_report, current_meta_value, find_current_analysis,
+                      month_lock, parse_with_cache, report_bad_rows)
+from config import ROOT_DIR
+import parsing
+from parsing import (UPLOAD_CHUNK_BYTES, charts_or_mock, discard_spooled_rows, prepare_for_mongo, run_parser_job,
+                     spooled_parse_job, use_streaming)
+from rollups import (apply_history, build_month_rollup, insert_facts, iter_fact_documents, load_month_rollups,
+                     parse_month_year, shift_month)
+from tracing import count, traced_upload
+# Upload jobs
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_SPOOL_DIR = Path(os.environ.get('JOB_SPOOL_DIR') or ROOT_DIR / 'upload_jobs')
+# A running job whose heartbeat is older than this is considered orphaned by a dead worker
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', '900'))
+# Jobs that hold their dedupe key (unique among them, see INDEX_SPECS); a failed job lets the same files be queued again
+JOB_ACTIVE_STATUSES = ["queued", "running", "completed"]
+_job_queue = None
+_job_workers = []
+async def _update_job(job_id: str, **fields):
+    fields["updated_at"] = datetime.now(timezone.utc)
+    await database.db.upload_jobs.update_one({"id": job_id}, {"$set": prepare_for_mongo(fields)})
+async def _job_heartbeat(job_id: str):
+    """Keep updated_at of a running job fresh, so resume_upload_jobs only requeues jobs whose worker died"""
+    while True:
+        await asyncio.sleep(JOB_STALE_SECONDS / 3)
+        try:
+            await database.db.upload_jobs.update_one(
+                {"id": job_id, "status": "running"}, {"$set": prepare_for_mongo({"updated_at": datetime.now(timezone.utc)})}
+            )
+        except Exception as e:
+            logging.warning(f"Could not renew the heartbeat of upload job {job_id}: {str(e)}")
+async def run_upload_job(job_id: str):
+    """Process one queued upload job end to end, recording progress on the job document"""
+    now = datetime.now(timezone.utc)
+    job = await database.db.upload_jobs.find_one_and_update(
+        {"id": job_id, "status": "queued"},
+        {"$set": prepare_for_mongo({"status": "running", "stage": "parsing", "started_at": now, "updated_at": now})},
+        return_document=ReturnDocument.AFTER
+    )
+    if not job:
+        return  # Already claimed by another worker, or no longer queued
+    files = {f["report_type"]: f for f in job["files"]}
+    heartbeat = asyncio.get_running_loop().create_task(_job_heartbeat(job_id))
+    try:
+        async with traced_upload("job", profile=job.get("profile", False)) as trace:
+            streaming = use_streaming(*(f["size"] for f in files.values()))
+            reports = {
+                report_type: (f["sha256"], *spooled_parse_job(Path(f["path"]), f["filename"], report_type, streaming))
+                for report_type, f in files.items()
+            }
+            for report_type, f in files.items():
+                count("bytes_in", f["size"], report_type)
+            
+            async def progress(**fields):
+                await _update_job(job_id, **fields)
+            
+            result = await analyze_reports(job["month_year"], reports, progress)
+            trace["analysis_id"] = result["analysis_id"]
+        await _update_job(
+            job_id, status="completed", stage="done", analysis_id=result["analysis_id"], bad_rows=result["bad_rows"],
+            profile_id=trace["profile_id"], finished_at=datetime.now(timezone.utc)
+        )
+    except Exception as e:
+        logging.error(f"Error processing upload job {job_id}: {str(e)}")
+        await _update_job(job_id, status="failed", error=str(e), finished_at=datetime.now(timezone.utc))
+    finally:
+        heartbeat.cancel()
+        for f in files.values():
+            Path(f["path"]).unlink(missing_ok=True)
+async def _upload_job_worker():
+    while True:
+        job_id = await _job_queue.get()
+        try:
+            await run_upload_job(job_id)
+        except Exception as e:
+            logging.error(f"Upload job worker error on {job_id}: {str(e)}")
+        finally:
+            _job_queue.task_done()
+def _ensure_job_workers():
+    """Start the background job workers on the running event loop (once)"""
+    global _job_queue, _job_workers
+    loop = asyncio.get_running_loop()
+    if _job_queue is None or _job_workers[0].get_loop() is not loop:
+        _job_queue = asyncio.Queue()
+        _job_workers = [loop.create_task(_upload_job_worker()) for _ in range(JOB_WORKERS)]
+async def enqueue_upload_job(job_id: str):
+    _ensure_job_workers()
+    await _job_queue.put(job_id)
+async def resume_upload_jobs():
+    """Re-queue jobs left queued, or running with a stale heartbeat, by a previous worker"""
+    stale = (datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_SECONDS)).isoformat()
+    await database.db.upload_jobs.update_many(
+        {"status": "running", "updated_at": {"$lt": stale}},
+        {"$set": {"status": "queued", "stage": "queued"}}
+    )
+    async for job in database.db.upload_jobs.find({"status": "queued"}, {"id": 1}).batch_size(MONGO_CURSOR_BATCH_SIZE):
+        await enqueue_upload_job(job["id"])
+def upload_dedupe_key(month_year: str, sha256_530: str, sha256_549: str) -> str:
+    """Dedupe key of an upload job: the normalized month ("01/2025" is "2025-01") and both file hashes"""
+    return f"{parse_month_year(month_year) or month_year.strip()}:{sha256_530}:{sha256_549}"
+async def find_active_upload_job(dedupe_key: str) -> Optional[Dict[str, Any]]:
+    return await database.db.upload_jobs.find_one({"dedupe_key": dedupe_key, "status": {"$in": JOB_ACTIVE_STATUSES}})
+def format_upload_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a job document: no _id or spool paths, plus elapsed time"""
+    job.pop('_id', None)
+    job["files"] = [{k: v for k, v in f.items() if k != "path"} for f in job.get("files", [])]
+    start = datetime.fromisoformat(job.get("started_at") or job["created_at"])
+    end = datetime.fromisoformat(job["finished_at"]) if job.get("finished_at") else datetime.now(timezone.utc)
+    job["elapsed_seconds"] = round((end - start).total_seconds(), 2)
+    return job
+# Batch import
+# Months parsed together and then written with insert_many; a history backfill runs in batches of this many months
+IMPORT_BATCH_MONTHS = int(os.environ.get('IMPORT_BATCH_MONTHS', '12'))
+IMPORT_SUFFIXES = ('.xlsx', '.xls', '.pdf')
+_IMPORT_REPORT_PATTERN = re.compile(r"(?<!\d)(530|549)(?!\d)")
+# "2025-01", "2025_1" or "01-2025", "1.2025" anywhere in the path relative to the import root
+_IMPORT_MONTH_PATTERNS = [
+    (re.compile(r"(?<!\d)(\d{4})[-_.](\d{1,2})(?!\d)"), "{0}-{1}"),
+    (re.compile(r"(?<!\d)(\d{1,2})[-_.](\d{4})(?!\d)"), "{1}-{0}")
+]
+def infer_import_file(relative_path: str):
+    """(report type, "YYYY-MM") guessed from a path like 2025-01/530.xlsx or relatorio_549_01-2025.pdf"""
+    name = Path(relative_path).name
+    report_match = _IMPORT_REPORT_PATTERN.search(name)
+    if not report_match:
+        return None, None
+    # Drop the report number so it cannot be read as part of a month
+    remainder = str(Path(relative_path).parent / (name[:report_match.start()] + " " + name[report_match.end():]))
+    for pattern, template in _IMPORT_MONTH_PATTERNS:
+        for match in pattern.finditer(remainder):
+            month = parse_month_year(template.format(*match.groups()))
+            if month:
+                return report_match.group(1), month
+    return report_match.group(1), None
+def read_import_mapping(mapping_path: Path, root: Path) -> Dict[str, Dict[str, Path]]:
+    """Months from a CSV with month_year, report_530 and report_549 columns; paths are relative to root"""
+    months = {}
+    with open(mapping_path, newline='', encoding='utf-8-sig') as handle:
+        for line, row in enumerate(csv.DictReader(handle), start=2):
+            month = parse_month_year(row.get("month_year") or "")
+            if month is None:
+                raise ValueError(f"{mapping_path.name}:{line}: mês inválido {row.get('month_year')!r}")
+            months[month] = {report_type: root / row[f"report_{report_type}"].strip() for report_type in ("530", "549")}
+    return months
+def discover_import_months(root: Path, mapping_path: Optional[Path] = None):
+    """Pair the report files under root by month.
+
+    Returns ({"YYYY-MM": {"530": path, "549": path}}, problems) where problems lists
+    the files and months that cannot be imported, with the reason.
+    """
+    if mapping_path is not None:
+        months = read_import_mapping(mapping_path, root)
+    else:
+        months = {}
+        for path in sorted(root.rglob("*")):
+            if not path.is_file() or path.suffix.lower() not in IMPORT_SUFFIXES:
+                continue
+            relative = path.relative_to(root)
+            report_type, month = infer_import_file(str(relative))
+            if report_type is None or month is None:
+                months.setdefault(None, []).append({"path": str(relative), "error": "Relatório ou mês não identificado no nome"})
+            elif report_type in months.setdefault(month, {}):
+                months.setdefault(None, []).append({"path": str(relative), "error": f"Relatório {report_type} repetido para {month}"})
+            else:
+                months[month][report_type] = path
+    problems = months.pop(None, [])
+    for month, files in list(months.items()):
+        missing = [report_type for report_type in ("530", "549") if report_type not in files]
+        missing += [report_type for report_type, path in files.items() if not path.is_file()]
+        if missing:
+            problems.append({"month_year": month, "error": f"Faltando relatório {', '.join(missing)}"})
+            del months[month]
+    return months, problems
+def extract_import_archive(archive: Path, directory: Path) -> Path:
+    """Unpack a zip of reports into directory, refusing members that would land outside it"""
+    directory = directory.resolve()
+    with zipfile.ZipFile(archive) as bundle:
+        for member in bundle.namelist():
+            if not (directory / member).resolve().is_relative_to(directory):
+                raise ValueError(f"Caminho inválido no arquivo zip: {member}")
+        bundle.extractall(directory)
+    return directory
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(UPLOAD_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+async def _import_parse(month: str, report_type: str, path: Path, slots: asyncio.Semaphore) -> Dict[str, Any]:
+    """Parse one file of a batch import; failures are recorded on the result instead of raised"""
+    size = path.stat().st_size
+    result = {
+        "month_year": month, "report_type": report_type, "path": str(path), "size": size,
+        "rows": 0, "bad_rows": 0, "cached": False
+    }
+    async with slots:
+        start = time.perf_counter()
+        try:
+            sha256 = await asyncio.to_thread(file_sha256, path)
+            streaming = use_streaming(size)
+            report_data, aggregates, hit = await parse_with_cache(
+                report_type, sha256, *spooled_parse_job(path, path.name, report_type, streaming)
+            )
+            result.update(
+                sha256=sha256, report_data=report_data, aggregates=aggregates, cached=hit,
+                bad_rows=report_bad_rows(report_data)["count"]
+            )
+            if aggregates is None or aggregates["row_count"] == 0:
+                result["error"] = report_data.get("error") or "Nenhuma linha encontrada"
+            else:
+                result["rows"] = aggregates["row_count"]
+        except Exception as e:
+            result["error"] = str(e)
+        seconds = time.perf_counter() - start
+    result.update(
+        seconds=round(seconds, 3),
+        rows_per_second=round(result["rows"] / seconds, 1) if seconds else None,
+        mb_per_second=round(size / 1024 / 1024 / seconds, 2) if seconds else None
+    )
+    return result
+async def _import_history(month: str, imported: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Previous month for apply_history: from this import when it is part of it, else its stored rollup"""
+    previous_month = shift_month(month, -1)
+    if previous_month in imported:
+        aggregates_530, aggregates_549 = imported[previous_month]["530"], imported[previous_month]["549"]
+        return {"dimensions": {"clients": aggregates_530["clients"], "sellers": aggregates_549["sellers"]}}
+    previous = await load_month_rollups(previous_month, previous_month, ("clients", "sellers"))
+    return previous[0] if previous else None
+async def import_months(months: Dict[str, Dict[str, Path]], progress=None) -> Dict[str, Any]:
+    """Bulk counterpart of analyze_reports for many months of 530/549 files.
+
+    Files are parsed in parallel (at most PARSER_WORKERS at a time, through the
+    parsed-report cache) IMPORT_BATCH_MONTHS months at a time; each batch is then
+    written with insert_many. The month_lock of every month is held from its
+    duplicate check until its batch is written, so uploads of those months wait.
+    A month whose files fail (or whose lock times out) is reported and skipped,
+    the rest of the batch goes on. progress, if given, is called with each month result.
+    """
+    meta_value = await current_meta_value()
+    slots = asyncio.Semaphore(parsing.PARSER_WORKERS)  # Read here: import_reports.py --workers sets it
+    report = {"months": [], "files": []}
+    imported = {}  # month -> aggregates by report, for the next month's history
+    ordered = sorted(months)
+    for start in range(0, len(ordered), IMPORT_BATCH_MONTHS):
+        batch = ordered[start:start + IMPORT_BATCH_MONTHS]
+        parsed = await asyncio.gather(*(
+            _import_parse(month, report_type, months[month][report_type], slots)
+            for month in batch for report_type in ("530", "549")
+        ))
+        files = {(result["month_year"], result["report_type"]): result for result in parsed}
+        analyses, rollups, month_results = [], [], []
+        async with contextlib.AsyncExitStack() as locks:
+            for month in batch:
+                file_530, file_549 = files[(month, "530")], files[(month, "549")]
+                month_result = {"month_year": month, "rows": file_530["rows"] + file_549["rows"]}
+                month_results.append(month_result)
+                errors = [f"{f['report_type']}: {f['error']}" for f in (file_530, file_549) if f.get("error")]
+                if errors:
+                    month_result.update(status="failed", error="; ".join(errors))
+                    continue
+                aggregates_530, aggregates_549 = file_530["aggregates"], file_549["aggregates"]
+                try:
+                    # Lock order is the batch's sorted month order, so imports cannot deadlock each other
+                    await locks.enter_async_context(month_lock(month))
+                    content_key = analysis_content_key(month, file_530["sha256"], file_549["sha256"])
+                    cached = await find_current_analysis(content_key, month)
+                    if cached:
+                        month_result.update(status="unchanged", analysis_id=cached["id"])
+                        imported[month] = {"530": aggregates_530, "549": aggregates_549}
+                        continue
+                    charts_data = charts_or_mock(aggregates_530, aggregates_549, meta_value)
+                    previous = await _import_history(month, imported)
+                    if previous:
+                        apply_history(charts_data, aggregates_530, previous)
+                    analysis, analysis_dict = await build_analysis_document(
+                        month, file_530["report_data"], file_549["report_data"], charts_data, content_key,
+                        {"530": file_530["sha256"], "549": file_549["sha256"]}
+                    )
+                except HTTPException as e:
+                    month_result.update(status="failed", error=e.detail)
+                    continue
+                except Exception as e:
+                    month_result.update(status="failed", error=str(e))
+                    continue
+                analyses.append((analysis, analysis_dict, file_530, file_549))
+                rollups.append(build_month_rollup(month, analysis.id, aggregates_530, aggregates_549))
+                month_result.update(status="imported", analysis_id=analysis.id)
+                imported[month] = {"530": aggregates_530, "549": aggregates_549}
+            try:
+                await _write_import_batch(analyses, rollups)
+            except Exception as e:
+                logging.error(f"Error writing import batch {batch[0]}..{batch[-1]}: {str(e)}")
+                for month_result in month_results:
+                    if month_result["status"] == "imported":
+                        month_result.update(status="failed", error=str(e))
+                        imported.pop(month_result["month_year"], None)
+        for result in parsed:
+            # Spools of months that failed or were unchanged were never stored
+            discard_spooled_rows((result.pop("report_data", None) or {}).get("_spool"))
+            result.pop("aggregates", None)
+        report["files"].extend(parsed)
+        report["months"].extend(month_results)
+        if progress:
+            for month_result in month_results:
+                progress(month_result)
+    return report
+async def _write_import_batch(analyses: List[tuple], rollups: List[Dict[str, Any]]):
+    """Store the analyses of one import batch with insert_many: documents, charts payloads, rollups and facts"""
+    if not analyses:
+        return
+    documents = [analysis_dict for _, analysis_dict, _, _ in analyses]
+    await database.db.report_analyses.insert_many(documents, ordered=False)
+    meta_value = await current_meta_value()
+    payloads = [await run_parser_job(build_charts_payload, document, meta_value) for document in documents]
+    await database.db.analysis_charts.insert_many(payloads, ordered=False)
+    for payload in payloads:
+        cache_charts_payload(payload)
+    await database.db.monthly_rollups.insert_many(rollups, ordered=False)
+    await insert_facts(
+        fact
+        for analysis, _, file_530, file_549 in analyses
+        for report_type, parsed in (("530", file_530), ("549", file_549))
+        for fact in iter_fact_documents(analysis.id, analysis.month_year, report_type, parsed["aggregates"])
+    )
+    await database.db.report_facts.delete_many({
+        "month": {"$in": [analysis.month_year for analysis, _, _, _ in analyses]},
+        "analysis_id": {"$nin": [analysis.id for analysis, _, _, _ in analyses]}
+    })
+    for analysis, _, *parsed_files in analyses:
+        for parsed in parsed_files:
+            report_ref = getattr(analysis, f"report_{parsed['report_type']}_ref")
+            if not parsed["cached"] and report_ref:
+                await cache_parsed_report(parsed["report_type"], parsed["sha256"], report_ref, parsed["aggregates"])
@@ -0,0 +1,78 @@
+"""
+Move raw report payloads embedded in report_analyses documents into GridFS.
+
+Each report_530_data / report_549_data is stored as a compressed columnar blob
+in the raw_reports bucket and replaced by a small report_*_ref. Prints document
+size and find_one latency before and after for every migrated analysis.
+
+Usage (from backend/): python migrate_raw_reports.py [--dry-run] [--limit N]
+"""
+
+import argparse
+import asyncio
+import time
+
+import bson
+
+import database
+import parsing
+import storage
+
+
+async def timed_find(analysis_id):
+    start = time.perf_counter()
+    doc = await database.db.report_analyses.find_one({"id": analysis_id})
+    return doc, (time.perf_counter() - start) * 1000
+
+
+async def migrate(dry_run=False, limit=0):
+    query = {"$or": [{"report_530_data": {"$exists": True}}, {"report_549_data": {"$exists": True}}]}
+    ids = [doc["id"] async for doc in database.db.report_analyses.find(query, {"id": 1}).limit(limit)]
+    print(f"{len(ids)} analyses with inline raw reports{' (dry run)' if dry_run else ''}")
+    total_before = total_after = 0
+    for analysis_id in ids:
+        doc, read_before = await timed_find(analysis_id)
+        size_before = len(bson.encode(doc))
+        refs = {}
+        for report_type in ("530", "549"):
+            report_data = doc.get(f"report_{report_type}_data")
+            if report_data is None:
+                continue
+            if report_data.get("format") == storage.REPORT_ROWS_FORMAT:
+                # Streamed report whose rows already live in report_rows: only the reference moves
+                refs[f"report_{report_type}_ref"] = report_data
+                continue
+            packed = parsing.report_summary(report_data)
+            packed["_blob"] = parsing.encode_report_blob(report_data)
+            if dry_run:
+                packed["compressed_size"] = len(packed.pop("_blob"))
+                refs[f"report_{report_type}_ref"] = packed
+            else:
+                refs[f"report_{report_type}_ref"] = await storage.store_raw_report(analysis_id, report_type, packed)
+        unset = {f"report_{report_type}_data": "" for report_type in ("530", "549")}
+        if dry_run:
+            after = {key: value for key, value in doc.items() if key not in unset}
+            after.update(refs)
+            size_after, read_after = len(bson.encode(after)), None
+        else:
+            await database.db.report_analyses.update_one({"id": analysis_id}, {"$set": refs, "$unset": unset})
+            after, read_after = await timed_find(analysis_id)
+            size_after = len(bson.encode(after))
+        total_before += size_before
+        total_after += size_after
+        latency = f"{read_before:.1f} ms -> {read_after:.1f} ms" if read_after is not None else f"{read_before:.1f} ms"
+        print(f"{analysis_id} {doc.get('month_year')}: {size_before / 1024:.1f} KB -> {size_after / 1024:.1f} KB, find_one {latency}")
+    if ids:
+        print(f"Total: {total_before / 1024 / 1024:.2f} MB -> {total_after / 1024 / 1024:.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="report sizes without writing anything")
+    parser.add_argument("--limit", type=int, default=0, help="migrate at most N analyses")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.dry_run, args.limit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Pydantic models of the API and of the documents behind them"""
+from __future__ import annotations
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any
+import uuid
+from datetime import datetime, timezone
+class MetaConfig(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    meta_value: float
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+class MetaConfigCreate(BaseModel):
+    meta_value: float
+class ReportAnalysis(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    month_year: str
+    # Raw reports are either embedded (*_data) or stored in GridFS and referenced (*_ref)
+    report_530_data: Optional[Dict[str, Any]] = None
+    report_549_data: Optional[Dict[str, Any]] = None
+    report_530_ref: Optional[Dict[str, Any]] = None
+    report_549_ref: Optional[Dict[str, Any]] = None
+    ai_analysis: Dict[str, Any]
+    charts_data: Dict[str, Any]
+    # Hash of month, file contents and parser version (see analysis_content_key)
+    content_key: Optional[str] = None
+    # SHA-256 of the uploaded 530/549 files: keys of their parsed-report and columnar cache entries
+    source_sha256: Optional[Dict[str, str]] = None
+    # Set when charts_data was rebuilt from the stored reports (POST /api/analyses/{id}/recompute)
+    recomputed_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+class ReportAnalysisCreate(BaseModel):
+    month_year: str
+class UploadJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    month_year: str
+    status: str = "queued"  # queued, running, completed, failed
+    stage: str = "queued"  # queued, parsing, aggregating, saving, done
+    rows_parsed: int = 0
+    files: List[Dict[str, Any]] = []
+    dedupe_key: str
+    analysis_id: Optional[str] = None
+    # Per report: cells that could not be parsed and were skipped, see convert_columns
+    bad_rows: Dict[str, Any] = {}
+    error: Optional[str] = None
+    # Set with X-Profile: the job is profiled and profile_id names its report (GET /api/admin/profiles/{id})
+    profile: bool = False
+    profile_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,1722 @@
+"""Report parsing: extraction, typed columns, aggregation and the parser pool.
+
+Everything here runs without the database, in the API process or in the
+parser workers, which import this module alone.
+"""
+from __future__ import annotations
+import os
+import logging
+from pathlib import Path
+from typing import List, Optional, Dict, Any
+from datetime import datetime, timezone
+import asyncio
+import json
+import gzip
+import collections.abc
+import contextlib
+import contextvars
+import heapq
+import importlib
+import itertools
+import multiprocessing
+import operator
+import shutil
+import sys
+import tempfile
+import time
+import unicodedata
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from config import ROOT_DIR
+from tracing import stage, current_trace, traced_job, merge_trace
+class LazyModule:
+    """Stand-in for a heavy module, imported on first attribute access.
+
+    The first access rebinds the module-level name to the real module, so later
+    lookups cost nothing. The API process only pays for the parsing stack once it
+    parses; with the process executor that only happens in the parser workers.
+    """
+    def __init__(self, name: str, alias: str):
+        self._name = name
+        self._alias = alias
+    # Named so it cannot shadow an attribute of the module it stands for (np.load)
+    def _import(self):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return module
+    def __getattr__(self, attr):
+        return getattr(self._import(), attr)
+np = LazyModule("numpy", "np")
+pd = LazyModule("pandas", "pd")
+fitz = LazyModule("fitz", "fitz")  # PyMuPDF
+openpyxl = LazyModule("openpyxl", "openpyxl")
+PARSER_STACK = ("np", "pd", "openpyxl", "fitz")
+def load_parser_stack():
+    """Import the parsing dependencies now (parser worker initializer and pool warm-up job)"""
+    for alias in PARSER_STACK:
+        module = globals()[alias]
+        if isinstance(module, LazyModule):
+            module._import()
+# Helper functions
+def extract_pdf_data(file_content: bytes, report_type: Optional[str] = None) -> Dict[str, Any]:
+    """Extract data from PDF content.
+
+    With a report_type the 530/549 table is rebuilt from word coordinates
+    (see extract_pdf_pages); without one only the page text is returned.
+    """
+    try:
+        if report_type is not None:
+            result = extract_pdf_pages(file_content, report_type)
+            return pdf_report_data(result["pages"], result["frame"], report_type, result["row_count"], result["bad_rows"])
+        doc = fitz.open(stream=file_content, filetype="pdf")
+        pages = [page.get_text() for page in doc]
+        doc.close()
+        
+        return {
+            "raw_text": "".join(pages),
+            "extracted_values": {},
+            "page_count": len(pages),
+            "success": True
+        }
+    except Exception as e:
+        return {"error": str(e), "success": False}
+def extract_excel_data(file_content: bytes) -> Dict[str, Any]:
+    """Extract data from Excel content: every sheet as a CompactTable (rows read like the old row dicts)"""
+    try:
+        from io import BytesIO
+        
+         # Use BytesIO to avoid deprecation warning
+        excel_buffer = BytesIO(file_content)
+        df_dict = pd.read_excel(excel_buffer, sheet_name=None)  # Read all sheets
+        
+        data = {}
+        for sheet_name, sheet_df in df_dict.items():
+            data[sheet_name] = CompactTable.from_frame(normalize_frame(sheet_df))
+        
+        return {
+            "sheets": data,
+            "success": True
+        }
+    except Exception as e:
+        logging.exception(f"Error extracting Excel data: {e}")
+        return {"error": str(e), "success": False}
+# Columnar Excel ingestion
+# Schema of each report: the layout sheet and, per column read by the aggregations, its dtype and
+# header aliases. Sheet names and headers are compared by _header_key (accents, case, spaces and
+# punctuation ignored), so "VLR TOTAL", "Vlr. Total" and "vlr_total" all resolve to "VLR. TOTAL".
+REPORT_SCHEMAS = {
+    "530": {
+        "sheet": "sheet1",
+        "columns": {
+            "Cliente": {"dtype": "text", "aliases": ["Nome Cliente", "Razão Social"]},
+            "Descrição": {"dtype": "text", "aliases": ["Produto", "Descrição Produto"]},
+            "Qtde": {"dtype": "number", "aliases": ["Qtd", "Quantidade"]},
+            "Vlr.Total": {"dtype": "number", "aliases": ["Valor Total"]}
+        }
+    },
+    "549": {
+        "sheet": "Planilha1",
+        "columns": {
+            "VENDEDOR EXTERNO": {"dtype": "text", "aliases": ["Vendedor Ext"]},
+            "UF": {"dtype": "text", "aliases": ["Estado"]},
+            "VLR. TOTAL": {"dtype": "number", "aliases": ["Valor Total"]},
+            "STATUS": {"dtype": "text", "aliases": ["Situação"]}
+        }
+    }
+}
+def _header_key(name) -> str:
+    """Comparison key of a sheet name or header: no accents, casefolded, letters and digits only"""
+    decomposed = unicodedata.normalize("NFKD", str(name))
+    return "".join(char for char in decomposed if char.isalnum()).casefold()
+# Sheets and columns that process_real_data actually reads from each report
+REPORT_LAYOUTS = {
+    report_type: {
+        "sheet": schema["sheet"],
+        "columns": list(schema["columns"]),
+        "numeric": [name for name, column in schema["columns"].items() if column["dtype"] == "number"]
+    }
+    for report_type, schema in REPORT_SCHEMAS.items()
+}
+# Header key -> canonical column of each report, built once from the schemas
+SCHEMA_HEADERS = {
+    report_type: {
+        _header_key(label): name
+        for name, column in schema["columns"].items()
+        for label in (name, *column["aliases"])
+    }
+    for report_type, schema in REPORT_SCHEMAS.items()
+}
+# Bad cells kept (with their row, column and raw value) in the bad_rows report of an upload
+BAD_ROWS_SAMPLE = int(os.environ.get('BAD_ROWS_SAMPLE', '20'))
+# "columnar" reads only the layout columns into DataFrames, "full" keeps the old all-sheets records
+EXCEL_INGESTION = os.environ.get('EXCEL_INGESTION', 'columnar')
+# "auto" prefers python-calamine when installed and falls back to openpyxl (read-only)
+EXCEL_ENGINE = os.environ.get('EXCEL_ENGINE', 'auto')
+def resolve_excel_engine(engine: Optional[str] = None) -> str:
+    """Pick the pandas Excel reader engine"""
+    engine = engine or EXCEL_ENGINE
+    if engine == 'auto':
+        return 'calamine' if importlib.util.find_spec('python_calamine') else 'openpyxl'
+    return engine
+def _fix_column_name(col, position: int) -> str:
+    """Turn a header cell into a string column name (NaN and datetime headers included)"""
+    if pd.isna(col):
+        return "unnamed_column"
+    if hasattr(col, 'strftime'):
+        try:
+            return col.strftime('%Y-%m-%d_%H-%M-%S')
+        except Exception:
+            return f"datetime_col_{position}"
+    return str(col)
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize a sheet column by column: string headers, datetimes as text, blank text cells as ""
+
+    Numeric columns keep NaN for blank cells, which the aggregation engine treats like "".
+    """
+    df.columns = [_fix_column_name(col, i) for i, col in enumerate(df.columns)]
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            df[column] = values.dt.strftime('%Y-%m-%d %H:%M:%S').fillna("")
+        elif values.dtype == object:
+            df[column] = values.where(values.notna(), "")
+    return df
+def resolve_columns(headers, report_type: str) -> Dict[int, str]:
+    """Positions of the schema columns in a header row, in sheet order, mapped to their canonical names.
+
+    A column spelled like its canonical name wins over an alias of it; otherwise the first alias does.
+    """
+    lookup = SCHEMA_HEADERS[report_type]
+    found = {}
+    for position, header in enumerate(headers):
+        key = _header_key(header)
+        name = lookup.get(key)
+        if name is None:
+            continue
+        exact = key == _header_key(name)
+        if name not in found or (exact and not found[name][1]):
+            found[name] = (position, exact)
+    missing = [name for name in REPORT_LAYOUTS[report_type]["columns"] if name not in found]
+    if missing:
+        logging.warning(f"Columns {missing} not found in report {report_type}")
+    return {position: name for name, (position, _) in sorted(found.items(), key=lambda item: item[1][0])}
+def layout_sheet(sheets: Dict[str, Any], report_type: str):
+    """The layout sheet of an extracted report, its name matched like a header ("Sheet1" is sheet1); [] if absent"""
+    key = _header_key(REPORT_LAYOUTS[report_type]["sheet"])
+    return next((sheet for name, sheet in sheets.items() if _header_key(name) == key), [])
+def convert_text_column(values: pd.Series):
+    """Text column with surrounding whitespace stripped; non-text cells are kept and nothing is flagged"""
+    try:
+        stripped = values.str.strip()
+    except AttributeError:  # No text in the column
+        return values, np.zeros(len(values), dtype=bool)
+    return stripped.where(stripped.notna(), values), np.zeros(len(values), dtype=bool)
+# pt-BR numbers whose dots only group thousands ("1.234", "1.234.567"); pd.to_numeric reads "1.234" as 1.234
+THOUSANDS_ONLY = r"-?\d{1,3}(?:\.\d{3})+"
+def convert_number_column(values: pd.Series):
+    """Float column from numbers and numeric text, pt-BR ("R$ 1.234,56", "1.234") or plain ("1234.56").
+
+    Runs as a few vectorized passes: pd.to_numeric first, then the text it rejected
+    (or read as a dot decimal while the dots group thousands) once more with the
+    separators swapped. Blank cells become NaN; cells that still do not convert
+    become NaN too and are flagged in the returned mask.
+    """
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return values.astype(np.float64), np.zeros(len(values), dtype=bool)
+    numbers = pd.to_numeric(values, errors="coerce").astype(np.float64)
+    retry = numbers.isna() & values.notna() & (values != "")
+    # Only text cells that pd.to_numeric accepted can be misread thousands; number cells are final
+    parsed_text = numbers.notna().to_numpy() & np.fromiter((type(value) is str for value in values.to_numpy()), dtype=bool, count=len(values))
+    if parsed_text.any():
+        misread = np.zeros(len(values), dtype=bool)
+        misread[parsed_text] = values[parsed_text].str.fullmatch(rf"\s*{THOUSANDS_ONLY}\s*").to_numpy(dtype=bool)
+        retry |= misread
+    bad = np.zeros(len(values), dtype=bool)
+    if retry.any():
+        text = values[retry].astype(str).str.replace("R$", "", regex=False).str.replace(r"\s", "", regex=True)
+        # The separator that comes last is the decimal one; the other groups thousands.
+        # Dots alone group thousands when they split 3-digit groups or there are several of them
+        thousands = text.str.fullmatch(THOUSANDS_ONLY) | ((text.str.count(r"\.") > 1) & ~text.str.contains(",", regex=False))
+        decimal_comma = (text.str.rfind(",") > text.str.rfind(".")) | thousands
+        text = text.where(~decimal_comma, text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+        parsed = pd.to_numeric(text.str.replace(",", "", regex=False), errors="coerce")
+        numbers[retry] = parsed
+        bad[retry.to_numpy()] = (parsed.isna() & (text != "")).to_numpy()
+    return numbers, bad
+COLUMN_CONVERTERS = {
+    "text": convert_text_column,
+    "number": convert_number_column
+}
+# Canonical column -> converter of each report, built once from the schemas
+SCHEMA_CONVERTERS = {
+    report_type: {name: COLUMN_CONVERTERS[column["dtype"]] for name, column in schema["columns"].items()}
+    for report_type, schema in REPORT_SCHEMAS.items()
+}
+def no_bad_rows() -> Dict[str, Any]:
+    """Empty bad-rows report"""
+    return {"count": 0, "sample": []}
+def merge_bad_rows(running: Dict[str, Any], chunk: Dict[str, Any], offset: int = 0) -> Dict[str, Any]:
+    """Fold the bad rows of a chunk into a running report; offset shifts the chunk's row numbers"""
+    running["count"] += chunk["count"]
+    room = BAD_ROWS_SAMPLE - len(running["sample"])
+    running["sample"].extend({**cell, "row": cell["row"] + offset} for cell in chunk["sample"][:max(room, 0)])
+    return running
+def schema_frame(df: pd.DataFrame, report_type: str) -> pd.DataFrame:
+    """The schema columns of a normalized sheet, under their canonical names"""
+    positions = resolve_columns(df.columns, report_type)
+    return df.iloc[:, list(positions)].set_axis(list(positions.values()), axis=1)
+def convert_columns(df: pd.DataFrame, report_type: str, first_row: int = 2):
+    """Convert the canonical columns of a frame to their schema dtypes, one vectorized pass per column.
+
+    Cells that do not convert are left blank and reported rather than failing the
+    aggregation; first_row is the sheet row of the first frame row.
+    Returns (frame, bad rows as {"count", "sample": [{"row", "column", "value"}]}).
+    """
+    converters = SCHEMA_CONVERTERS[report_type]
+    bad_mask = np.zeros(len(df), dtype=bool)
+    sample = []
+    columns = {}
+    for name in df.columns:
+        raw = df[name]
+        values, bad = converters[name](raw) if name in converters else (raw, None)
+        columns[name] = values
+        if bad is not None and bad.any():
+            bad_mask |= bad
+            rows = np.flatnonzero(bad)[:BAD_ROWS_SAMPLE]
+            sample.extend(
+                {"row": first_row + int(row), "column": name, "value": str(value)}
+                for row, value in zip(rows.tolist(), raw.to_numpy()[rows].tolist())
+            )
+    bad_rows = no_bad_rows()
+    bad_rows["count"] = int(bad_mask.sum())
+    bad_rows["sample"] = sorted(sample, key=lambda cell: cell["row"])[:BAD_ROWS_SAMPLE]
+    if bad_rows["count"]:
+        logging.warning(f"{bad_rows['count']} bad rows in report {report_type}, first: {bad_rows['sample'][0]}")
+    return pd.DataFrame(columns, index=df.index), bad_rows
+def typed_frame(df: pd.DataFrame, report_type: str, first_row: int = 2):
+    """schema_frame plus convert_columns: the typed layout columns of a sheet and its bad rows"""
+    return convert_columns(schema_frame(df, report_type), report_type, first_row)
+def frame_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Convert a normalized sheet to the list-of-dicts layout stored by the legacy path (blanks as "")"""
+    columns = frame_columns(df, missing="")
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+def extract_excel_columns(file_content: bytes, report_type: str, engine: Optional[str] = None) -> Dict[str, Any]:
+    """Extract only the layout sheet/columns of a 530 or 549 workbook as a typed DataFrame (see REPORT_SCHEMAS)"""
+    try:
+        from io import BytesIO
+        layout = REPORT_LAYOUTS[report_type]
+        headers = SCHEMA_HEADERS[report_type]
+        sheets = {}
+        bad_rows = no_bad_rows()
+        with pd.ExcelFile(BytesIO(file_content), engine=resolve_excel_engine(engine)) as workbook:
+            sheet_name = layout_sheet({name: name for name in workbook.sheet_names}, report_type)
+            if sheet_name:
+                df = workbook.parse(sheet_name, usecols=lambda col: _header_key(col) in headers)
+                sheets[layout["sheet"]], bad_rows = typed_frame(normalize_frame(df), report_type)
+            else:
+                logging.warning(f"Sheet {layout['sheet']} not found in report {report_type}: {workbook.sheet_names}")
+        return {
+            "sheets": sheets,
+            "bad_rows": bad_rows,
+            "success": True
+        }
+    except Exception as e:
+        logging.exception(f"Error extracting Excel data: {e}")
+        return {"error": str(e), "success": False}
+def extract_report(file_content: bytes, filename: str, report_type: str) -> Dict[str, Any]:
+    """Extract a 530/549 upload according to its file type and the configured ingestion mode"""
+    if filename.endswith('.pdf'):
+        return extract_pdf_data(file_content, report_type)
+    if EXCEL_INGESTION == 'columnar':
+        return extract_excel_columns(file_content, report_type)
+    return extract_excel_data(file_content)
+# Mongo serialization
+def _iso_datetime(value) -> Optional[str]:
+    return value.isoformat()  # NaT has its own entry (_to_none)
+def _iso_datetime64(value) -> Optional[str]:
+    return None if np.isnat(value) else pd.Timestamp(value).isoformat()
+def _native_float(value) -> Optional[float]:
+    value = float(value)
+    return None if value != value else value  # NaN
+def _native_scalar(value):
+    return value.item()
+def _to_none(value):
+    return None
+def _identity(value):
+    return value
+# Leaf converters by exact type; subclasses are resolved through the MRO once and cached here
+MONGO_LEAF_CONVERTERS = {
+    str: _identity,
+    int: _identity,
+    bool: _identity,
+    type(None): _identity,
+    bytes: _identity,
+    float: _native_float,
+    datetime: _iso_datetime
+}
+def _register_array_converters(package: str):
+    """Add the numpy or pandas scalar converters; their values cannot exist before the package is loaded"""
+    if package == "numpy":
+        MONGO_LEAF_CONVERTERS.update({
+            np.datetime64: _iso_datetime64,
+            np.floating: _native_float,
+            np.integer: _native_scalar,
+            np.bool_: _native_scalar,
+            np.str_: str
+        })
+    elif package == "pandas":
+        MONGO_LEAF_CONVERTERS.update({
+            pd.Timestamp: _iso_datetime,
+            type(pd.NaT): _to_none,
+            type(pd.NA): _to_none
+        })
+def _leaf_converter(kind: type):
+    """Converter for a leaf type, looked up along its MRO (e.g. np.float64 -> np.floating)"""
+    package = kind.__module__.partition('.')[0]
+    if package in ("numpy", "pandas"):
+        _register_array_converters(package)
+    for base in kind.__mro__:
+        if base in MONGO_LEAF_CONVERTERS:
+            MONGO_LEAF_CONVERTERS[kind] = MONGO_LEAF_CONVERTERS[base]
+            return MONGO_LEAF_CONVERTERS[kind]
+    MONGO_LEAF_CONVERTERS[kind] = _identity
+    return _identity
+def _iso_column(values: pd.Series) -> list:
+    """Timestamp.isoformat() of a whole datetime column (NaT comes back as NaN)"""
+    parts = values.dt
+    if parts.tz is not None or ((parts.microsecond != 0) | (parts.nanosecond != 0)).any():
+        return [None if value is pd.NaT else value.isoformat() for value in values]
+    return np.datetime_as_string(values.to_numpy(), unit='s').tolist()
+def frame_columns(df: pd.DataFrame, missing: Any = None) -> Dict[str, list]:
+    """Mongo-ready value lists for every column of a frame, converted a whole column at a time.
+
+    Numeric and boolean columns go through tolist() (native Python scalars), datetime
+    columns become ISO strings, and NaN/NaT/None become `missing`.
+    """
+    columns = {}
+    for position, name in enumerate(df.columns):
+        values = df.iloc[:, position]
+        mask = values.isna().to_numpy()
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            converted = _iso_column(values)
+        elif values.dtype == object:
+            converted = values.tolist()
+            for i, value in enumerate(converted):
+                kind = type(value)
+                if kind is not str:
+                    converted[i] = (MONGO_LEAF_CONVERTERS.get(kind) or _leaf_converter(kind))(value)
+        else:
+            converted = values.tolist()
+        if mask.any():
+            for i in np.flatnonzero(mask).tolist():
+                converted[i] = missing
+        columns[str(name)] = converted
+    return columns
+def prepare_for_mongo(data):
+    """Prepare data for MongoDB: datetimes to ISO strings, NaN/NaT to None, numpy scalars to Python values.
+
+    DataFrames are converted column by column (frame_to_records) and CompactTables
+    through their dictionaries (records()); other data is walked iteratively with
+    the MONGO_LEAF_CONVERTERS dispatch table. Keys become strings and tuples become lists.
+    """
+    converters = MONGO_LEAF_CONVERTERS
+    # Without pandas/numpy loaded there can be no frames or arrays: () matches nothing
+    frame_type = pd.DataFrame if "pandas" in sys.modules else ()
+    array_type = np.ndarray if "numpy" in sys.modules else ()
+    containers = (dict, list, tuple, frame_type, array_type, CompactTable)
+    root = [data]
+    pending = [(root, 0)]
+    while pending:
+        parent, key = pending.pop()
+        value = parent[key]
+        if isinstance(value, dict):
+            converted = {}
+            for k, v in value.items():
+                k = k if type(k) is str else str(k)
+                convert = converters.get(type(v))
+                if convert is not None:
+                    converted[k] = convert(v)
+                else:
+                    converted[k] = v
+                    if isinstance(v, containers):
+                        pending.append((converted, k))
+                    else:
+                        converted[k] = _leaf_converter(type(v))(v)
+        elif isinstance(value, (list, tuple)):
+            converted = list(value)
+            for i, v in enumerate(converted):
+                convert = converters.get(type(v))
+                if convert is not None:
+                    converted[i] = convert(v)
+                elif isinstance(v, containers):
+                    pending.append((converted, i))
+                else:
+                    converted[i] = _leaf_converter(type(v))(v)
+        elif isinstance(value, frame_type):
+            converted = frame_to_records(value)
+        elif isinstance(value, CompactTable):
+            converted = value.records()
+        elif isinstance(value, array_type):
+            converted = value.tolist()
+            pending.append((parent, key))  # Walk the list form again for datetimes/NaN
+        else:
+            converted = (MONGO_LEAF_CONVERTERS.get(type(value)) or _leaf_converter(type(value)))(value)
+        parent[key] = converted
+    return root[0]
+# Compact tables
+# Parsed sheets kept as columns instead of one dict per row: text (object) columns are dictionary-
+# encoded, i.e. each distinct value is stored once and rows hold small integer codes into it, and
+# numeric columns stay typed arrays. Rows are still available as read-only mappings for row-by-row
+# callers; blank cells read as "" there, like in the old records.
+NUMERIC_INFERRED_TYPES = ("integer", "floating", "mixed-integer-float")
+def _code_dtype(size: int):
+    """Smallest signed integer type for dictionary codes 0..size-1 plus the blank code -1"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+def _dictionary_column(values: np.ndarray) -> tuple:
+    """(codes, dictionary) of an object column; blanks (NaN/None) get the trailing "" entry via code -1"""
+    codes, uniques = pd.factorize(values)
+    dictionary = np.empty(len(uniques) + 1, dtype=object)
+    dictionary[:-1] = [str(value) if isinstance(value, datetime) else value for value in uniques.tolist()]
+    dictionary[-1] = ""
+    return codes.astype(_code_dtype(len(dictionary))), dictionary
+class CompactRow(collections.abc.Mapping):
+    """Read-only view of one row of a CompactTable; values are decoded on access"""
+    __slots__ = ("_table", "_index")
+    def __init__(self, table: CompactTable, index: int):
+        self._table = table
+        self._index = index
+    def __getitem__(self, name: str):
+        return self._table.value(name, self._index)
+    def __iter__(self):
+        return iter(self._table.columns)
+    def __len__(self):
+        return len(self._table.columns)
+    def __repr__(self):
+        return repr(dict(self))
+class CompactTable:
+    """A sheet as typed arrays and dictionary-encoded columns, with list-of-rows access.
+
+    len(), iteration and indexing give CompactRow views, so code written for the
+    list-of-dicts records keeps working; the columnar engine reads to_frame() instead.
+    """
+    def __init__(self, columns: Dict[str, Any], length: int):
+        self._columns = columns  # name -> typed array, or (codes, dictionary) when dictionary-encoded
+        self._length = length
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> CompactTable:
+        """Table of a normalized sheet: object columns dictionary-encoded, the others kept as arrays"""
+        columns = {}
+        for position, name in enumerate(df.columns):
+            values = df.iloc[:, position].to_numpy()
+            columns[str(name)] = _dictionary_column(values) if values.dtype == object else values
+        return cls(columns, len(df))
+    @classmethod
+    def from_columns(cls, columns: Dict[str, list]) -> CompactTable:
+        """Table of stored value lists (blanks as ""): numbers-only columns become int64/float64 arrays"""
+        encoded = {}
+        length = 0
+        for name, values in columns.items():
+            values = np.asarray(values, dtype=object) if not isinstance(values, np.ndarray) else values
+            length = len(values)
+            blank = values == ""
+            if pd.api.types.infer_dtype(values[~blank], skipna=True) in NUMERIC_INFERRED_TYPES:
+                numbers = np.where(blank, np.nan, values).astype(np.float64)
+                if not blank.any() and pd.api.types.infer_dtype(values, skipna=False) == "integer":
+                    numbers = values.astype(np.int64)
+                encoded[name] = numbers
+            else:
+                encoded[name] = _dictionary_column(values)
+        return cls(encoded, length)
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> CompactTable:
+        names = list(dict.fromkeys(key for record in records for key in record))
+        return cls.from_columns({name: [record.get(name, "") for record in records] for name in names})
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+    def __len__(self):
+        return self._length
+    def __iter__(self):
+        return (CompactRow(self, index) for index in range(self._length))
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [CompactRow(self, i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("row index out of range")
+        return CompactRow(self, index)
+    def value(self, name: str, index: int):
+        """One cell as the old records held it: a Python scalar, "" when blank"""
+        column = self._columns[name]
+        if isinstance(column, tuple):
+            codes, dictionary = column
+            return dictionary[codes[index]]
+        value = column[index].item()
+        return "" if value != value else value  # NaN
+    def column(self, name: str) -> np.ndarray:
+        """A whole column: the typed array itself (NaN for blanks), or the decoded values of an encoded one"""
+        column = self._columns[name]
+        if isinstance(column, tuple):
+            codes, dictionary = column
+            return dictionary[codes]
+        return column
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({name: self.column(name) for name in self._columns}, index=pd.RangeIndex(self._length), copy=False)
+    def to_columns(self, missing: Any = "") -> Dict[str, list]:
+        """Mongo-ready value lists per column; dictionaries are converted once, not once per row"""
+        columns = {}
+        for name, column in self._columns.items():
+            if isinstance(column, tuple):
+                codes, dictionary = column
+                dictionary = np.array(prepare_for_mongo(dictionary[:-1].tolist()) + [missing], dtype=object)
+                columns[name] = dictionary[codes].tolist()
+            else:
+                values = column.tolist()
+                if column.dtype.kind == "f":
+                    for i in np.flatnonzero(np.isnan(column)).tolist():
+                        values[i] = missing
+                columns[name] = values
+        return columns
+    def records(self, missing: Any = "") -> List[Dict[str, Any]]:
+        """The table as the old list of row dicts"""
+        columns = self.to_columns(missing)
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the arrays and the dictionary values"""
+        total = 0
+        for column in self._columns.values():
+            if isinstance(column, tuple):
+                codes, dictionary = column
+                total += codes.nbytes + dictionary.nbytes + sum(sys.getsizeof(value) for value in dictionary.tolist())
+            else:
+                total += column.nbytes
+        return total
+# Columnar aggregation engine
+def _sheet_to_frame(sheet) -> pd.DataFrame:
+    """Return a sheet as a DataFrame, accepting a DataFrame, a CompactTable or a list of row dicts"""
+    if isinstance(sheet, pd.DataFrame):
+        return sheet
+    if isinstance(sheet, CompactTable):
+        return sheet.to_frame()
+    if not sheet:
+        return pd.DataFrame()
+    return pd.DataFrame.from_records(sheet)
+def _truthy_mask(df: pd.DataFrame, column: str) -> np.ndarray:
+    """Vectorized equivalent of `if row.get(column)` for every row of the frame"""
+    if column not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    values = df[column]
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return (values.notna() & (values != 0)).to_numpy()
+    # Missing cells are "" in the records produced by extract_excel_data
+    return values.where(values.notna(), "").to_numpy(dtype=object).astype(bool)
+def _float_values(df: pd.DataFrame, column: str, mask: np.ndarray) -> np.ndarray:
+    """Vectorized equivalent of `float(value)` for the masked rows of a column"""
+    values = df[column].to_numpy()[mask]
+    if values.dtype == object:
+        # Raises on non-numeric text, exactly like float() did in the row loops
+        values = pd.to_numeric(values, errors="raise")
+    return np.asarray(values, dtype=np.float64)
+def _group_sum(keys: np.ndarray, *weights: np.ndarray) -> List[Dict[Any, float]]:
+    """Sum each weight array per key, preserving first-appearance key order.
+
+    np.bincount adds the weights sequentially in row order, so the totals are
+    bit-for-bit the same as the old `dict[key] += value` loops.
+    """
+    codes, uniques = pd.factorize(keys)
+    keys_list = uniques.tolist()
+    results = []
+    for weight in weights:
+        sums = np.bincount(codes, weights=weight, minlength=len(keys_list))
+        results.append(dict(zip(keys_list, sums.tolist())))
+    return results
+def aggregate_report_530(df: pd.DataFrame) -> Dict[str, Any]:
+    """Aggregate report 530 (sheet1) into sales totals by client and by product"""
+    aggregates = {
+        "row_count": len(df),
+        "total_sales": 0,
+        "clients": {},
+        "products": {},
+        "products_qty": {}
+    }
+    value_mask = _truthy_mask(df, 'Vlr.Total')
+    if not value_mask.any():
+        return aggregates
+    # Converted once; the client and product groups select their rows from it
+    totals = _float_values(df, 'Vlr.Total', value_mask)
+    # Builtin sum keeps the exact float semantics of the previous generator expression
+    aggregates["total_sales"] = sum(totals.tolist())
+    client_mask = value_mask & _truthy_mask(df, 'Cliente')
+    if client_mask.any():
+        (aggregates["clients"],) = _group_sum(
+            df['Cliente'].to_numpy()[client_mask],
+            totals[client_mask[value_mask]]
+        )
+    product_mask = value_mask & _truthy_mask(df, 'Descrição')
+    if product_mask.any():
+        quantities = np.zeros(int(product_mask.sum()), dtype=np.float64)
+        qty_mask = _truthy_mask(df, 'Qtde')
+        if qty_mask.any():
+            qty_rows = qty_mask[product_mask]
+            quantities[qty_rows] = _float_values(df, 'Qtde', product_mask & qty_mask)
+        aggregates["products"], aggregates["products_qty"] = _group_sum(
+            df['Descrição'].to_numpy()[product_mask],
+            totals[product_mask[value_mask]],
+            quantities
+        )
+    return aggregates
+def aggregate_report_549(df: pd.DataFrame) -> Dict[str, Any]:
+    """Aggregate report 549 (Planilha1) into sales by external seller and state, plus STATUS counts"""
+    aggregates = {
+        "row_count": len(df),
+        "sellers": {},
+        "states": {},
+        "status_counts": {}
+    }
+    if len(df) == 0:
+        return aggregates
+    value_mask = _truthy_mask(df, 'VLR. TOTAL')
+    totals = _float_values(df, 'VLR. TOTAL', value_mask) if value_mask.any() else np.zeros(0)
+    seller_mask = value_mask & _truthy_mask(df, 'VENDEDOR EXTERNO')
+    if seller_mask.any():
+        # Exclude HELIBOMBAS as it's internal
+        seller_mask &= (df['VENDEDOR EXTERNO'] != 'HELIBOMBAS').to_numpy()
+    if seller_mask.any():
+        (aggregates["sellers"],) = _group_sum(
+            df['VENDEDOR EXTERNO'].to_numpy()[seller_mask],
+            totals[seller_mask[value_mask]]
+        )
+    state_mask = value_mask & _truthy_mask(df, 'UF')
+    if state_mask.any():
+        (aggregates["states"],) = _group_sum(
+            df['UF'].to_numpy()[state_mask],
+            totals[state_mask[value_mask]]
+        )
+    status_mask = _truthy_mask(df, 'STATUS')
+    if status_mask.any():
+        codes, uniques = pd.factorize(df['STATUS'].to_numpy()[status_mask])
+        counts = np.bincount(codes, minlength=len(uniques))
+        aggregates["status_counts"] = dict(zip(uniques.tolist(), counts.tolist()))
+    return aggregates
+def top_items(values: Dict[Any, float], n: int = 5):
+    """Top-n (key, value) pairs by value, ties kept in insertion order like sorted(reverse=True)"""
+    return heapq.nlargest(n, values.items(), key=lambda x: x[1])
+def performance_vs_meta(current_performance: float, meta_target: float) -> Dict[str, Any]:
+    """The meta-dependent block of charts_data; everything else in it depends on the reports only"""
+    return {
+        "current_performance": current_performance,
+        "meta_target": meta_target,
+        "percentage": round((current_performance / meta_target) * 100, 1) if meta_target > 0 else 0
+    }
+def apply_meta(charts_data: Optional[Dict[str, Any]], meta_target: float) -> Optional[Dict[str, Any]]:
+    """Re-derive performance_vs_meta of stored charts_data (in place) for a meta, from its stored total"""
+    block = (charts_data or {}).get("performance_vs_meta")
+    if isinstance(block, dict) and "current_performance" in block:
+        charts_data["performance_vs_meta"] = performance_vs_meta(block["current_performance"], meta_target)
+    return charts_data
+def build_charts_data(aggregates_530: Dict[str, Any], aggregates_549: Dict[str, Any], meta_target: float) -> Dict[str, Any]:
+    """Build the dashboard chart blocks from the 530/549 aggregates"""
+    total_vendas_530 = aggregates_530["total_sales"]
+    vendedores_externos = aggregates_549["sellers"]
+    estados_vendas = aggregates_549["states"]
+    clientes_vendas = aggregates_530["clients"]
+    produtos_vendas = aggregates_530["products"]
+    produtos_qtd = aggregates_530["products_qty"]
+    status_count = aggregates_549["status_counts"]
+    # Format external sellers for chart (with fallback data if no 549 data)
+    if vendedores_externos:
+        external_sellers = [
+            {"name": vendedor, "sales": valor, "growth": 0}  # Would need historical data for real growth
+            for vendedor, valor in top_items(vendedores_externos)
+        ]
+    else:
+        external_sellers = [
+            {"name": "Sem dados vendedor externo", "sales": 0, "growth": 0}
+        ]
+    if estados_vendas:
+        total_geographic = sum(estados_vendas.values())
+        geographic_distribution = [
+            {
+                "state": estado,
+                "value": valor,
+                "percentage": round((valor / total_geographic) * 100 if total_geographic > 0 else 0, 1)
+            }
+            for estado, valor in top_items(estados_vendas)
+        ]
+    else:
+        geographic_distribution = [
+            {"state": "Dados não disponíveis", "value": total_vendas_530, "percentage": 100.0}
+        ]
+    main_clients = [
+        {
+            "client": cliente,
+            "value": valor,
+            "percentage": round((valor / total_vendas_530) * 100 if total_vendas_530 > 0 else 0, 1)
+        }
+        for cliente, valor in top_items(clientes_vendas)
+    ]
+    product_analysis = []
+    for produto, valor in top_items(produtos_vendas):
+        qtd = produtos_qtd.get(produto, 0)
+        # Truncate long product names
+        produto_nome = produto[:30] + "..." if len(str(produto)) > 30 else produto
+        product_analysis.append({
+            "product": produto_nome,
+            "quantity": int(qtd),
+            "revenue": valor
+        })
+    production_status = {"completed": 95, "in_progress": 3, "delayed": 2}  # Default values
+    if status_count:
+        total_orders = sum(status_count.values())
+        production_status = {
+            "completed": round((status_count.get('F', 0) / total_orders) * 100, 0),
+            "in_progress": round((status_count.get('L', 0) / total_orders) * 100, 0),
+            "delayed": round((status_count.get('V', 0) / total_orders) * 100, 0)
+        }
+    total_clients = len(clientes_vendas) if clientes_vendas else 1
+    avg_ticket = total_vendas_530 / total_clients if total_clients > 0 else 0
+    logging.debug(f"Total vendas from 530: {total_vendas_530}")
+    logging.debug(f"Number of clients: {len(clientes_vendas)}")
+    logging.debug(f"Number of products: {len(produtos_vendas)}")
+    logging.debug(f"Number of vendedores externos: {len(vendedores_externos)}")
+    return {
+        "performance_vs_meta": performance_vs_meta(total_vendas_530, meta_target),
+        "geographic_distribution": geographic_distribution,
+        "external_sellers": external_sellers,
+        "main_clients": main_clients,
+        "product_analysis": product_analysis,
+        "production_status": production_status,
+        "kpis": {
+            "conversion_rate": 8.7,  # Would need more data to calculate
+            "average_ticket": round(avg_ticket, 2),
+            "client_retention": 92.3,  # Would need historical data
+            "sales_cycle": 18  # Would need more data to calculate
+        }
+    }
+def charts_from_aggregates(aggregates_530: Dict[str, Any], aggregates_549: Dict[str, Any], meta_target: float) -> Dict[str, Any]:
+    """Chart blocks from report aggregates, with the mock fallback when report 530 has no rows"""
+    if aggregates_530["row_count"] == 0:
+        logging.warning("No data 530 found, using mock data")
+        return generate_mock_chart_data()  # Fallback to mock data
+    if aggregates_549["row_count"] == 0:
+        logging.warning("No data 549 found, will process with 530 data only")
+    return build_charts_data(aggregates_530, aggregates_549, meta_target)
+def process_real_data(report_530_data: Dict, report_549_data: Dict, meta_target: float) -> Dict[str, Any]:
+    """Process real Helibombas data from reports 530 and 549.
+
+    Each report is kept as a columnar DataFrame and reduced with grouped,
+    vectorized sums; the JSON is identical to the row-by-row reference
+    (benchmarks/reference_loop.py).
+    """
+    try:
+        logging.debug(f"Processing real data - 530: {report_530_data.keys()}, 549: {report_549_data.keys()}")
+        # Extract data from report 530 (sheet1) and report 549 (Planilha1)
+        df_530 = report_frame(report_530_data, "530")[0]
+        df_549 = report_frame(report_549_data, "549")[0]
+        logging.debug(f"Data 530 records: {len(df_530)}")
+        logging.debug(f"Data 549 records: {len(df_549)}")
+        return charts_from_aggregates(
+            aggregate_report_530(df_530),
+            aggregate_report_549(df_549),
+            meta_target
+        )
+    except Exception as e:
+        logging.exception(f"Error processing real data, falling back to mock charts: {e}")
+        return generate_mock_chart_data()  # Fallback to mock data
+# Streaming ingestion
+# "auto" streams uploads of at least UPLOAD_STREAMING_THRESHOLD bytes, "buffered"/"streaming" force a mode
+UPLOAD_MODE = os.environ.get('UPLOAD_MODE', 'auto')
+UPLOAD_STREAMING_THRESHOLD = int(os.environ.get('UPLOAD_STREAMING_THRESHOLD', str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.environ.get('UPLOAD_CHUNK_BYTES', str(1024 * 1024)))
+STREAM_CHUNK_ROWS = int(os.environ.get('STREAM_CHUNK_ROWS', '20000'))
+UPLOAD_SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR') or None
+def use_streaming(*sizes: int) -> bool:
+    """Whether uploads of these sizes (bytes) go through the constant-memory streaming path"""
+    return UPLOAD_MODE == 'streaming' or (UPLOAD_MODE == 'auto' and any(size >= UPLOAD_STREAMING_THRESHOLD for size in sizes))
+# Fact table grain: fact field -> sheet column, one fact per distinct combination of the dimensions
+FACT_DIMENSIONS = {
+    "530": {"client": "Cliente", "product": "Descrição"},
+    "549": {"seller": "VENDEDOR EXTERNO", "uf": "UF", "status": "STATUS"}
+}
+FACT_MEASURES = {
+    "530": {"value": "Vlr.Total", "qty": "Qtde"},
+    "549": {"value": "VLR. TOTAL"}
+}
+def aggregate_facts(df: pd.DataFrame, report_type: str) -> Dict[str, Dict[tuple, float]]:
+    """Sum the fact measures (and row counts) of a sheet per dimension tuple, as fact_<measure> dicts"""
+    measures = FACT_MEASURES[report_type]
+    facts = {f"fact_{name}": {} for name in ("rows", *measures)}
+    if len(df) == 0:
+        return facts
+    blank = np.full(len(df), "", dtype=object)
+    keys = [
+        df[column].where(df[column].notna(), "").astype(str).to_numpy() if column in df.columns else blank
+        for column in FACT_DIMENSIONS[report_type].values()
+    ]
+    codes, uniques = pd.factorize(pd.MultiIndex.from_arrays(keys))
+    keys_list = uniques.tolist()
+    weights = {"fact_rows": np.ones(len(df))}
+    for name, column in measures.items():
+        weights[f"fact_{name}"] = (
+            pd.to_numeric(df[column], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+            if column in df.columns else np.zeros(len(df))
+        )
+    for name, weight in weights.items():
+        facts[name] = dict(zip(keys_list, np.bincount(codes, weights=weight, minlength=len(keys_list)).tolist()))
+    return facts
+def aggregate_upload_530(df: pd.DataFrame) -> Dict[str, Any]:
+    """aggregate_report_530 plus the fact-table grain"""
+    return {**aggregate_report_530(df), **aggregate_facts(df, "530")}
+def aggregate_upload_549(df: pd.DataFrame) -> Dict[str, Any]:
+    """aggregate_report_549 plus the fact-table grain"""
+    return {**aggregate_report_549(df), **aggregate_facts(df, "549")}
+REPORT_AGGREGATORS = {
+    "530": aggregate_upload_530,
+    "549": aggregate_upload_549
+}
+# What charts_data needs, e.g. to recompute an analysis
+CHART_AGGREGATORS = {
+    "530": aggregate_report_530,
+    "549": aggregate_report_549
+}
+def merge_aggregates(running: Dict[str, Any], chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Fold the aggregates of one chunk into the running aggregates of a report"""
+    for key, value in chunk.items():
+        if isinstance(value, dict):
+            target = running.setdefault(key, {})
+            for group, amount in value.items():
+                target[group] = target.get(group, 0) + amount
+        else:
+            running[key] = running.get(key, 0) + value
+    return running
+def stream_excel_file(path: Path, report_type: str, chunk_rows: int = STREAM_CHUNK_ROWS):
+    """Aggregate a 530/549 workbook chunk by chunk with openpyxl read-only iter_rows.
+
+    Only the layout columns of STREAM_CHUNK_ROWS rows are held in memory at a time; headers
+    are resolved once and each chunk is typed by convert_columns, written to a ReportRowsSpool
+    (and, inside columnar_job, appended to the columnar cache).
+    Returns (report_data, aggregates); report_data keeps counts, bad rows and the spool of its rows.
+    """
+    layout = REPORT_LAYOUTS[report_type]
+    aggregate = REPORT_AGGREGATORS[report_type]
+    aggregates = empty_aggregates(report_type)
+    report_data = {"sheets": {}, "streamed": True, "row_count": 0, "columns": [], "bad_rows": no_bad_rows(), "success": True}
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    writer = None
+    spool = None
+    try:
+        sheet_name = layout_sheet({name: name for name in workbook.sheetnames}, report_type)
+        if not sheet_name:
+            logging.warning(f"Sheet {layout['sheet']} not found in report {report_type}: {workbook.sheetnames}")
+            return report_data, aggregates
+        worksheet = workbook[sheet_name]
+        header = next(worksheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        resolved = resolve_columns([_fix_column_name(col, i) for i, col in enumerate(header)], report_type)
+        positions = list(resolved)
+        columns = list(resolved.values())
+        report_data["columns"] = columns
+        if not positions:
+            return report_data, aggregates
+        pick = operator.itemgetter(*positions)
+        rows = worksheet.iter_rows(min_row=2, max_col=max(positions) + 1, values_only=True)
+        writer = open_columnar_writer(report_type)
+        spool = ReportRowsSpool(layout["sheet"])
+        while True:
+            chunk = [pick(row) for row in itertools.islice(rows, chunk_rows)]
+            if not chunk:
+                break
+            if len(positions) == 1:
+                chunk = [(value,) for value in chunk]
+            df = normalize_frame(pd.DataFrame.from_records(chunk, columns=columns))
+            df, bad_rows = convert_columns(df, report_type, first_row=2 + report_data["row_count"])
+            merge_bad_rows(report_data["bad_rows"], bad_rows)
+            merge_aggregates(aggregates, aggregate(df))
+            if writer is not None:
+                writer.append(df)
+            spool.append(df)
+            report_data["row_count"] += len(chunk)
+        if writer is not None:
+            writer.close()
+            writer = None
+        report_data["_spool"] = spool.close()
+        spool = None
+        return report_data, aggregates
+    finally:
+        if writer is not None:
+            writer.discard()
+        if spool is not None:
+            spool.discard()
+        workbook.close()
+# PDF extraction
+# Pages handed to one parser job; a 1000-page report becomes 40 jobs spread over the pool
+PDF_PAGES_PER_JOB = int(os.environ.get('PDF_PAGES_PER_JOB', '25'))
+# Pages searched for the table header before a report is treated as having no table
+PDF_HEADER_SCAN_PAGES = int(os.environ.get('PDF_HEADER_SCAN_PAGES', '5'))
+# Words whose vertical centers are this many points apart still share a line
+PDF_LINE_TOLERANCE = 2.0
+def _open_pdf(source):
+    """fitz document from PDF bytes or from a file on disk"""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+def _pdf_lines(page) -> List[List[tuple]]:
+    """Words of a page grouped into text lines, top to bottom, each line as (x0, x1, y0, y1, text) left to right"""
+    words = sorted(page.get_text("words"), key=lambda w: (w[1] + w[3]) / 2)
+    lines = []
+    current_y = None
+    for x0, y0, x1, y1, text, *_ in words:
+        center = (y0 + y1) / 2
+        if current_y is None or center - current_y > PDF_LINE_TOLERANCE:
+            lines.append([])
+            current_y = center
+        lines[-1].append((x0, x1, y0, y1, text))
+    for line in lines:
+        line.sort()
+    return lines
+def _find_pdf_label(tokens: List[str], label: str, used: set) -> Optional[tuple]:
+    """(first, last) token of the first run of up to 4 unused tokens that spells label, else None"""
+    for start in range(len(tokens)):
+        if start in used:
+            continue
+        joined = ""
+        for stop in range(start, min(start + 4, len(tokens))):
+            joined += tokens[stop]
+            if joined == label:
+                return start, stop
+            if not label.startswith(joined) or stop + 1 in used:
+                break
+    return None
+def _match_pdf_header(line: List[tuple], report_type: str) -> Optional[List[tuple]]:
+    """Column spans (name, x0, x1) if the line is the report table header, else None.
+
+    Layout labels may span several words ("VENDEDOR EXTERNO", "Vlr. Total") and are
+    matched by header key, canonical name first and then its aliases; header words
+    outside the layout become unnamed columns so their values are dropped.
+    """
+    tokens = [_header_key(word[4]) for word in line]
+    used = set()
+    columns = []
+    for name in REPORT_LAYOUTS[report_type]["columns"]:
+        labels = [key for key, canonical in SCHEMA_HEADERS[report_type].items() if canonical == name]
+        match = next(filter(None, (_find_pdf_label(tokens, label, used) for label in labels)), None)
+        if match is None:
+            return None
+        used.update(range(match[0], match[1] + 1))
+        columns.append((name, line[match[0]][0], line[match[1]][1]))
+    columns.extend((None, word[0], word[1]) for i, word in enumerate(line) if i not in used)
+    return sorted(columns, key=lambda column: column[1])
+def _pdf_cells(line: List[tuple]) -> List[tuple]:
+    """Merge the words of a line into cells (x0, x1, text): words closer than half the text height are one phrase"""
+    cells = []
+    for x0, x1, y0, y1, text in line:
+        if cells and x0 - cells[-1][1] < (y1 - y0) / 2:
+            cells[-1] = (cells[-1][0], x1, f"{cells[-1][2]} {text}")
+        else:
+            cells.append((x0, x1, text))
+    return cells
+def _pdf_column(x0: float, x1: float, numeric: bool, columns: List[tuple]) -> Optional[str]:
+    """Layout column a cell belongs to (None for unnamed columns and text left of the table).
+
+    Numbers may be right-aligned or centered, so they go to the header span they
+    overlap most (or the nearest one); text is left-aligned, so it goes to the last
+    column whose header starts at or before it.
+    """
+    if numeric:
+        return max(columns, key=lambda column: min(x1, column[2]) - max(x0, column[1]))[0]
+    name = None
+    for column in columns:
+        if column[1] <= x0 + PDF_LINE_TOLERANCE:
+            name = column[0]
+    return name
+def parse_pdf_number(text: str):
+    """Float from a PDF cell in pt-BR ("1.234,56") or plain ("1,234.56") notation; None if not a number.
+
+    Scalar counterpart of convert_number_column, used to tell number cells from text while rows are rebuilt.
+    """
+    cleaned = text.replace("R$", "").replace(" ", "")
+    if cleaned.rfind(",") > cleaned.rfind("."):
+        cleaned = cleaned.replace(".", "").replace(",", ".")
+    else:
+        cleaned = cleaned.replace(",", "")
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+def _pdf_page_rows(lines: List[List[tuple]], columns: List[tuple], report_type: str) -> List[Dict[str, Any]]:
+    """Rebuild table rows from the lines below the header of one page.
+
+    A line is a row when it holds a number, fills the first layout column or more
+    than one; a single text cell right below a row is a wrapped cell and is
+    appended to it. Cells stay text: extract_pdf_pages types the whole table.
+    Titles, footers and "Total" lines are skipped.
+    """
+    layout = REPORT_LAYOUTS[report_type]
+    numeric = layout["numeric"]
+    rows = []
+    last_bottom = None
+    for line in lines:
+        cells = {}
+        has_number = False
+        line_cells = _pdf_cells(line)
+        for x0, x1, text in line_cells:
+            is_number = parse_pdf_number(text) is not None
+            has_number = has_number or is_number
+            name = _pdf_column(x0, x1, is_number, columns)
+            if name is not None:
+                cells[name] = f"{cells[name]} {text}" if name in cells else text
+        top = min(word[2] for word in line)
+        bottom = max(word[3] for word in line)
+        if line_cells[0][2].casefold().startswith("total"):
+            last_bottom = None
+        elif has_number or len(cells) > 1 or layout["columns"][0] in cells:
+            rows.append({name: cells.get(name, "") for name in layout["columns"]})
+            last_bottom = bottom
+        elif rows and last_bottom is not None and cells and top - last_bottom < (bottom - top) * 1.5:
+            for name, text in cells.items():
+                if name not in numeric:
+                    rows[-1][name] = f"{rows[-1][name]} {text}".strip()
+            last_bottom = bottom
+        else:
+            last_bottom = None
+    return rows
+def scan_pdf_layout(source, report_type: str):
+    """Parser pool job: (page count, header columns of the first page that has the table header)"""
+    doc = _open_pdf(source)
+    try:
+        for page_number in range(min(PDF_HEADER_SCAN_PAGES, doc.page_count)):
+            for line in _pdf_lines(doc[page_number]):
+                columns = _match_pdf_header(line, report_type)
+                if columns:
+                    return doc.page_count, columns
+        return doc.page_count, None
+    finally:
+        doc.close()
+def extract_pdf_pages(source, report_type: str, start: int = 0, stop: Optional[int] = None,
+                      header: Optional[List[tuple]] = None, keep_rows: bool = True) -> Dict[str, Any]:
+    """Parser pool job: rebuild the layout table of pages [start, stop) of a PDF report.
+
+    Each page uses its own header line when it has one, otherwise the last header seen
+    (starting with header). Returns pages, row_count, aggregates and bad_rows (numbered
+    by table row from 1), plus the typed rows as a DataFrame under "frame" when keep_rows is set.
+    """
+    aggregate = REPORT_AGGREGATORS[report_type]
+    columns_order = REPORT_LAYOUTS[report_type]["columns"]
+    doc = _open_pdf(source)
+    try:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        rows = []
+        for page_number in range(start, stop):
+            lines = _pdf_lines(doc[page_number])
+            for index, line in enumerate(lines):
+                columns = _match_pdf_header(line, report_type)
+                if columns:
+                    header = columns
+                    lines = lines[index + 1:]
+                    break
+            if header:
+                rows.extend(_pdf_page_rows(lines, header, report_type))
+    finally:
+        doc.close()
+    frame, bad_rows = convert_columns(normalize_frame(pd.DataFrame.from_records(rows, columns=columns_order)), report_type, first_row=1)
+    result = {"pages": max(stop - start, 0), "row_count": len(frame), "aggregates": aggregate(frame), "bad_rows": bad_rows}
+    if keep_rows:
+        result["frame"] = frame
+    return result
+def pdf_report_data(page_count: int, frame: Optional[pd.DataFrame], report_type: str, row_count: int,
+                    bad_rows: Dict[str, Any]) -> Dict[str, Any]:
+    """Report data of an extracted PDF in the same layout as the columnar Excel path"""
+    report_data = {"sheets": {}, "page_count": page_count, "row_count": row_count, "bad_rows": bad_rows, "success": True}
+    if frame is None:
+        report_data["streamed"] = True
+    else:
+        report_data["sheets"][REPORT_LAYOUTS[report_type]["sheet"]] = frame
+    return report_data
+def stream_pdf_file(path: Path, report_type: str):
+    """Aggregate a PDF report from disk with its rows in a ReportRowsSpool: returns (report_data, aggregates)"""
+    try:
+        result = extract_pdf_pages(path, report_type)
+        spool = ReportRowsSpool(REPORT_LAYOUTS[report_type]["sheet"])
+        spool.append(result["frame"])
+        report_data = pdf_report_data(result["pages"], None, report_type, result["row_count"], result["bad_rows"])
+        report_data["_spool"] = spool.close()
+        return report_data, result["aggregates"]
+    except Exception as e:
+        return {"error": str(e), "success": False}, empty_aggregates(report_type)
+def stream_report_file(path: Path, filename: str, report_type: str):
+    """Streaming counterpart of extract_report: returns (report_data, aggregates)"""
+    if filename.endswith('.pdf'):
+        return stream_pdf_file(path, report_type)
+    try:
+        return stream_excel_file(path, report_type)
+    except Exception as e:
+        logging.error(f"Error streaming Excel data: {e}")
+        return {"error": str(e), "success": False}, empty_aggregates(report_type)
+# Report packing
+# "gridfs" keeps raw rows out of report_analyses as compressed blobs; "inline" embeds them (old layout)
+RAW_REPORT_STORAGE = os.environ.get('RAW_REPORT_STORAGE', 'gridfs')
+RAW_REPORT_FORMAT = "columnar-json-gzip-v1"
+# Rows per report_rows document, and per line of a rows spool
+REPORT_ROWS_PER_DOCUMENT = int(os.environ.get('REPORT_ROWS_PER_DOCUMENT', '5000'))
+def sheet_columns(sheet) -> Dict[str, Any]:
+    """Column-major form of a sheet (a DataFrame, CompactTable or list of row dicts): column names once, then one value list per column"""
+    if isinstance(sheet, CompactTable):
+        columns = sheet.to_columns(missing="")
+        return {"columns": list(columns), "data": list(columns.values())}
+    if not isinstance(sheet, list):
+        columns = frame_columns(sheet, missing="")
+        return {"columns": list(columns), "data": list(columns.values())}
+    columns = list(dict.fromkeys(key for record in sheet for key in record))
+    return {"columns": columns, "data": [[record.get(col, "") for record in sheet] for col in columns]}
+def encode_report_blob(report_data: Dict[str, Any]) -> bytes:
+    """Serialize an extracted report as gzip-compressed columnar JSON"""
+    payload = prepare_for_mongo({key: value for key, value in report_data.items() if key != 'sheets'})
+    payload["sheets"] = {
+        str(name): sheet_columns(sheet) for name, sheet in report_data.get('sheets', {}).items()
+    }
+    payload["format"] = RAW_REPORT_FORMAT
+    return gzip.compress(json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8'), compresslevel=6)
+def stored_sheet(columns: Dict[str, list], as_records: bool):
+    """A sheet read back from storage: a CompactTable, or JSON-ready row dicts for API responses (no pandas)"""
+    if as_records:
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+    return CompactTable.from_columns(columns)
+def decode_report_blob(blob: bytes, as_records: bool = False) -> Dict[str, Any]:
+    """Inverse of encode_report_blob: the report with its sheets as CompactTables (or lists of row dicts)"""
+    payload = json.loads(gzip.decompress(blob))
+    payload.pop("format", None)
+    payload["sheets"] = {
+        name: stored_sheet(dict(zip(sheet["columns"], sheet["data"])), as_records)
+        for name, sheet in payload.get("sheets", {}).items()
+    }
+    return payload
+def report_summary(report_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Small description of an extracted report that stays in the analysis document"""
+    summary = {key: report_data[key] for key in ("success", "error", "streamed", "row_count", "page_count", "bad_rows") if key in report_data}
+    summary["sheet_rows"] = {str(name): len(sheet) for name, sheet in report_data.get('sheets', {}).items()}
+    return summary
+def pack_report_data(report_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape extracted report data for storage (runs in the parser pool).
+
+    Inline storage gets the Mongo-ready data; GridFS storage gets the summary
+    plus the encoded blob under "_blob", to be uploaded by store_raw_report.
+    Streamed reports get the summary plus their rows spool under "_spool", to be
+    stored by store_spooled_rows in either mode.
+    """
+    if "_spool" in report_data:
+        packed = report_summary(report_data)
+        packed["sheet_rows"] = {report_data["_spool"]["sheet"]: report_data["_spool"]["rows"]}
+        packed["_spool"] = report_data["_spool"]
+        return packed
+    if RAW_REPORT_STORAGE == 'inline':
+        return prepare_for_mongo(report_data)
+    packed = report_summary(report_data)
+    packed["_blob"] = encode_report_blob(report_data)
+    return packed
+class ReportRowsSpool:
+    """Write the typed chunks of a streamed report to a gzip JSON-lines file (runs in the parser pool).
+
+    Every line is a report_rows document without its key ({"sheet", "columns", "data"},
+    at most REPORT_ROWS_PER_DOCUMENT rows), so the rows reach storage without ever
+    being held together: store_spooled_rows uploads the file or inserts its lines.
+    close() returns the spool description kept under "_spool" in the report data.
+    """
+    def __init__(self, sheet: str):
+        self.sheet = str(sheet)
+        self.rows = 0
+        self.documents = 0
+        handle, self.path = tempfile.mkstemp(prefix="report_rows_", suffix=".jsonl.gz", dir=UPLOAD_SPOOL_DIR)
+        self.file = gzip.open(os.fdopen(handle, "wb"), "wt", encoding="utf-8", compresslevel=6)
+    def append(self, frame: pd.DataFrame):
+        columns = sheet_columns(frame)
+        for start in range(0, len(frame), REPORT_ROWS_PER_DOCUMENT):
+            document = {
+                "sheet": self.sheet,
+                "columns": columns["columns"],
+                "data": [values[start:start + REPORT_ROWS_PER_DOCUMENT] for values in columns["data"]]
+            }
+            self.file.write(json.dumps(document, ensure_ascii=False, default=str) + "\n")
+            self.documents += 1
+        self.rows += len(frame)
+    def close(self) -> Dict[str, Any]:
+        self.file.close()
+        return {"path": self.path, "sheet": self.sheet, "rows": self.rows, "documents": self.documents}
+    def discard(self):
+        self.file.close()
+        discard_spooled_rows({"path": self.path})
+def discard_spooled_rows(spool: Optional[Dict[str, Any]]):
+    """Remove the file of a rows spool that will not be stored"""
+    if spool:
+        Path(spool["path"]).unlink(missing_ok=True)
+# Columnar report cache
+# The typed layout columns of every parsed report are kept on local disk, one directory per file
+# (COLUMNAR_CACHE_DIR/<parser version>/<report>/<sha256>), so reprocessing an analysis (a new meta,
+# a charts fix) memory-maps arrays instead of parsing the workbook again. Number columns are float64
+# .npy files; text columns are dictionary-encoded: int32 codes (-1 for blank) in a .npy file plus
+# the distinct values in meta.json. Least recently used entries go beyond COLUMNAR_CACHE_MAX_BYTES.
+# Bump whenever extraction or aggregation output changes, so cached results from older parsers are ignored
+PARSER_VERSION = "4"
+COLUMNAR_CACHE = os.environ.get('COLUMNAR_CACHE', 'true').lower() == 'true'
+COLUMNAR_CACHE_DIR = Path(os.environ.get('COLUMNAR_CACHE_DIR') or ROOT_DIR / 'columnar_cache')
+COLUMNAR_CACHE_MAX_BYTES = int(os.environ.get('COLUMNAR_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+COLUMNAR_FORMAT = "npy-dict-v1"
+# Cache entry the current parser job writes its layout columns to (see columnar_job)
+_columnar_target = contextvars.ContextVar("columnar_target", default=None)
+def columnar_cache_path(report_type: str, key: str) -> Path:
+    """Cache directory of one report: key is the file's sha256, or analysis-<id> when it is unknown"""
+    return COLUMNAR_CACHE_DIR / PARSER_VERSION / report_type / key
+class ColumnarWriter:
+    """Write typed layout frames (one, or the chunks of a streamed file) to a columnar cache entry.
+
+    Columns are appended to temporary files and turned into .npy files by close(), which
+    publishes the entry with a rename so readers never see a partial one. A failure is
+    logged and drops the entry: the cache never fails the parse it rides along with.
+    """
+    def __init__(self, path: Path, report_type: str):
+        self.path = Path(path)
+        self.report_type = report_type
+        self.dtypes = {name: column["dtype"] for name, column in REPORT_SCHEMAS[report_type]["columns"].items()}
+        self.columns = {}  # name -> {"file", "encoding", "index": value -> code}
+        self.row_count = 0
+        self.workdir = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.workdir = Path(tempfile.mkdtemp(prefix=f".{self.path.name}-", dir=self.path.parent))
+        except OSError as e:
+            self.fail(e)
+    def fail(self, error: Exception):
+        logging.warning(f"Could not write columnar cache {self.path}: {error}")
+        self.discard()
+    def discard(self):
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+    def append(self, frame: pd.DataFrame):
+        if self.workdir is None:
+            return
+        try:
+            for name in frame.columns:
+                if name not in self.dtypes:
+                    continue
+                column = self.columns.get(name)
+                if column is None:
+                    if self.row_count:
+                        raise ValueError(f"column {name} missing from earlier chunks")
+                    encoding = "dictionary" if self.dtypes[name] == "text" else "plain"
+                    column = self.columns[name] = {"file": f"{len(self.columns)}.npy", "encoding": encoding, "index": {}}
+                if column["encoding"] == "dictionary":
+                    codes, uniques = pd.factorize(frame[name].to_numpy(dtype=object))
+                    index = column["index"]
+                    mapping = [index.setdefault(value, len(index)) for value in uniques.tolist()]
+                    # Code -1 (blank) picks the trailing -1
+                    values = np.array(mapping + [-1], dtype=np.int32)[codes]
+                else:
+                    values = frame[name].to_numpy(dtype=np.float64)
+                with open(self.workdir / f"{column['file']}.part", "ab") as handle:
+                    handle.write(values.tobytes())
+            self.row_count += len(frame)
+        except Exception as e:
+            self.fail(e)
+    def close(self) -> Optional[Path]:
+        """Publish the entry; None if writing failed"""
+        if self.workdir is None:
+            return None
+        try:
+            columns = []
+            for name, column in self.columns.items():
+                dtype = np.int32 if column["encoding"] == "dictionary" else np.float64
+                part = self.workdir / f"{column['file']}.part"
+                target = np.lib.format.open_memmap(self.workdir / column["file"], mode="w+", dtype=dtype, shape=(self.row_count,))
+                if self.row_count:
+                    target[:] = np.memmap(part, dtype=dtype, mode="r", shape=(self.row_count,))
+                target.flush()
+                del target
+                part.unlink()
+                entry = {"name": name, "file": column["file"], "encoding": column["encoding"]}
+                if column["encoding"] == "dictionary":
+                    entry["values"] = list(column["index"])
+                columns.append(entry)
+            meta = {
+                "format": COLUMNAR_FORMAT,
+                "report_type": self.report_type,
+                "row_count": self.row_count,
+                "columns": columns,
+                "created_at": datetime.now(timezone.utc).isoformat()
+            }
+            (self.workdir / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, default=str), encoding="utf-8")
+        except Exception as e:
+            self.fail(e)
+            return None
+        try:
+            os.rename(self.workdir, self.path)
+        except OSError:  # Written meanwhile by another job: keep that one
+            self.discard()
+            return None
+        self.workdir = None
+        evict_columnar_cache()
+        return self.path
+def open_columnar_writer(report_type: str) -> Optional[ColumnarWriter]:
+    """Writer for the cache entry of the current parser job (see columnar_job), None without one"""
+    path = _columnar_target.get()
+    if path is None or Path(path).exists():
+        return None
+    return ColumnarWriter(path, report_type)
+def write_columnar_frame(path: Path, frame: pd.DataFrame, report_type: str) -> Optional[Path]:
+    """Cache the typed layout frame of a report unless the entry exists"""
+    if Path(path).exists():
+        return None
+    writer = ColumnarWriter(path, report_type)
+    writer.append(frame)
+    return writer.close()
+def load_columnar_frame(path: Path) -> Optional[pd.DataFrame]:
+    """Typed layout frame of a cache entry, None when there is none.
+
+    Number columns are read-only memory maps of their .npy files (no copy); text
+    columns are rebuilt from their codes and distinct values (blank codes become NaN).
+    """
+    path = Path(path)
+    try:
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != COLUMNAR_FORMAT:
+        return None
+    os.utime(path / "meta.json")  # Recency for evict_columnar_cache
+    columns = {}
+    for column in meta["columns"]:
+        values = np.load(path / column["file"], mmap_mode="r")
+        if column["encoding"] == "dictionary":
+            # The trailing NaN is what code -1 picks
+            lookup = np.empty(len(column["values"]) + 1, dtype=object)
+            lookup[:-1] = column["values"]
+            lookup[-1] = np.nan
+            values = lookup[values]
+        columns[column["name"]] = values
+    return pd.DataFrame(columns, copy=False) if columns else pd.DataFrame(index=range(meta["row_count"]))
+def columnar_cache_entries() -> List[tuple]:
+    """(last used, bytes, directory) of every published cache entry"""
+    entries = []
+    for meta_path in COLUMNAR_CACHE_DIR.glob("*/*/*/meta.json"):
+        try:
+            size = sum(item.stat().st_size for item in meta_path.parent.iterdir())
+            entries.append((meta_path.stat().st_mtime, size, meta_path.parent))
+        except OSError:
+            continue  # Evicted meanwhile
+    return entries
+def evict_columnar_cache():
+    """Remove least recently used cache entries until the cache fits COLUMNAR_CACHE_MAX_BYTES"""
+    entries = columnar_cache_entries()
+    total = sum(size for _, size, _ in entries)
+    for _, size, directory in sorted(entries):
+        if total <= COLUMNAR_CACHE_MAX_BYTES:
+            break
+        shutil.rmtree(directory, ignore_errors=True)
+        total -= size
+@contextlib.contextmanager
+def columnar_target(path: Optional[Path]):
+    """Write the layout columns parsed inside the block to the cache entry at path (see open_columnar_writer)"""
+    token = _columnar_target.set(path)
+    try:
+        yield
+    finally:
+        _columnar_target.reset(token)
+def columnar_job(path: Optional[Path], func, *args):
+    """Parser pool job: func(*args) with the layout columns it parses written to the cache entry at path"""
+    with columnar_target(path):
+        return func(*args)
+def aggregate_columnar_report(path: Path, report_type: str) -> Optional[Dict[str, Any]]:
+    """Parser pool job: chart aggregates (no fact grain) of a report from its columnar cache entry, None when it is not cached"""
+    with stage("load_columns", report_type):
+        frame = load_columnar_frame(path)
+    if frame is None:
+        return None
+    with stage("aggregate", report_type):
+        return CHART_AGGREGATORS[report_type](frame)
+# Parser executor
+# "process" (default), "thread" or "inline" (run on the event loop, the old behaviour)
+PARSER_EXECUTOR = os.environ.get('PARSER_EXECUTOR', 'process')
+PARSER_WORKERS = int(os.environ.get('PARSER_WORKERS') or min(4, os.cpu_count() or 1))
+# Parser jobs allowed to run at once across all requests; further jobs wait for a slot
+PARSER_MAX_PENDING = int(os.environ.get('PARSER_MAX_PENDING') or PARSER_WORKERS)
+PARSER_START_METHOD = os.environ.get('PARSER_START_METHOD', 'spawn')
+# Start the process pool in the background at startup instead of on the first upload
+PARSER_PREWARM = os.environ.get('PARSER_PREWARM', 'true').lower() == 'true'
+_parser_executor = None
+_parser_slots = None
+def get_parser_executor():
+    """Create the parser pool on first use"""
+    global _parser_executor
+    if _parser_executor is None:
+        if PARSER_EXECUTOR == 'process':
+            _parser_executor = ProcessPoolExecutor(
+                max_workers=PARSER_WORKERS,
+                mp_context=multiprocessing.get_context(PARSER_START_METHOD),
+                initializer=load_parser_stack
+            )
+        else:
+            _parser_executor = ThreadPoolExecutor(max_workers=PARSER_WORKERS, thread_name_prefix="parser")
+    return _parser_executor
+async def warm_parser_pool():
+    """Start every parser worker (each loads the parsing stack) before the first upload needs one"""
+    loop = asyncio.get_running_loop()
+    executor = get_parser_executor()
+    start = time.perf_counter()
+    await asyncio.gather(*(loop.run_in_executor(executor, load_parser_stack) for _ in range(PARSER_WORKERS)))
+    logging.info(f"Parser pool ready: {PARSER_WORKERS} {PARSER_EXECUTOR} workers in {time.perf_counter() - start:.2f}s")
+def shutdown_parser_executor():
+    global _parser_executor
+    if _parser_executor is not None:
+        _parser_executor.shutdown(wait=False, cancel_futures=True)
+        _parser_executor = None
+def _get_parser_slots() -> asyncio.Semaphore:
+    """Semaphore bounding parser jobs, bound to the running event loop"""
+    global _parser_slots
+    loop = asyncio.get_running_loop()
+    if _parser_slots is None or _parser_slots[0] is not loop:
+        _parser_slots = (loop, asyncio.Semaphore(PARSER_MAX_PENDING))
+    return _parser_slots[1]
+async def run_parser_job(func, *args):
+    """Run a CPU-bound parsing/aggregation job off the event loop, bounded by PARSER_MAX_PENDING"""
+    trace = current_trace()
+    async with _get_parser_slots():
+        if PARSER_EXECUTOR == 'inline':
+            if trace is None:
+                return func(*args)
+            # The request profiler already covers the event loop thread
+            result, job_trace = traced_job(func, args, None)
+            merge_trace(trace, job_trace)
+            return result
+        loop = asyncio.get_running_loop()
+        try:
+            if trace is None:
+                return await loop.run_in_executor(get_parser_executor(), func, *args)
+            result, job_trace = await loop.run_in_executor(get_parser_executor(), traced_job, func, args, trace["profile_dir"])
+            merge_trace(trace, job_trace)
+            return result
+        except BrokenExecutor:
+            # A worker died (e.g. OOM-killed): drop the pool so the next job gets a fresh one
+            shutdown_parser_executor()
+            raise
+def report_frame(report_data: Dict[str, Any], report_type: str):
+    """(typed layout frame, bad rows) of an extracted report, whatever its ingestion mode"""
+    sheet = layout_sheet(report_data.get('sheets', {}), report_type)
+    if isinstance(sheet, pd.DataFrame):
+        return schema_frame(sheet, report_type), no_bad_rows()  # Typed at extraction
+    return typed_frame(_sheet_to_frame(sheet), report_type)
+def aggregate_report_data(report_data: Dict[str, Any], report_type: str) -> Optional[Dict[str, Any]]:
+    """Aggregate the layout sheet of an extracted report; None if the data cannot be aggregated.
+
+    Reports of the "full" ingestion mode are typed here, so their bad rows are recorded on report_data.
+    Inside columnar_job the typed frame is also written to the columnar cache.
+    """
+    try:
+        frame, bad_rows = report_frame(report_data, report_type)
+        if report_data.get('success'):
+            report_data.setdefault("bad_rows", bad_rows)
+            writer = open_columnar_writer(report_type)
+            if writer is not None:
+                with stage("columnar_cache", report_type):
+                    writer.append(frame)
+                    writer.close()
+        return REPORT_AGGREGATORS[report_type](frame)
+    except Exception as e:
+        logging.exception(f"Error aggregating report {report_type}: {e}")
+        return None
+def parse_report(file_content: bytes, filename: str, report_type: str):
+    """Parser pool job: extract and aggregate one upload.
+
+    Returns (packed report data, aggregates) so only plain data goes back to the API process.
+    """
+    with stage("extract", report_type):
+        report_data = extract_report(file_content, filename, report_type)
+    with stage("aggregate", report_type):
+        aggregates = aggregate_report_data(report_data, report_type)
+    with stage("pack", report_type):
+        return pack_report_data(report_data), aggregates
+def parse_report_file(path: Path, filename: str, report_type: str):
+    """Parser pool job: streaming counterpart of parse_report for a spooled upload"""
+    with stage("extract", report_type):
+        report_data, aggregates = stream_report_file(path, filename, report_type)
+    with stage("pack", report_type):
+        return pack_report_data(report_data), aggregates
+def parse_spooled_report(path: Path, filename: str, report_type: str):
+    """Parser pool job: parse_report for an upload already spooled to disk"""
+    with stage("read", report_type):
+        file_content = Path(path).read_bytes()
+    return parse_report(file_content, filename, report_type)
+def extract_pdf_range(path: Path, report_type: str, start: int, stop: int, header: List[tuple], spill_dir: str):
+    """Parser pool job of parse_pdf_report: extract_pdf_pages of one page range.
+
+    The typed rows are written to spill_dir (a pickle per range) rather than sent
+    back, so the API process only ever handles aggregates and file names.
+    """
+    result = extract_pdf_pages(path, report_type, start, stop, header)
+    result["frame_path"] = str(Path(spill_dir) / f"{start:08d}.pkl")
+    result.pop("frame").to_pickle(result["frame_path"])
+    return result
+def finish_pdf_report(page_count: int, frame_paths: List[str], report_type: str, row_count: int, bad_rows: Dict[str, Any],
+                      cache_path: Optional[Path], keep_rows: bool):
+    """Parser pool job of parse_pdf_report: merge the spilled page-range frames, cache and pack the report.
+
+    Without keep_rows (streaming) the ranges are read one at a time into a ReportRowsSpool
+    and the cache writer, so memory does not grow with the report.
+    """
+    if not keep_rows:
+        writer = ColumnarWriter(cache_path, report_type) if cache_path is not None and frame_paths else None
+        spool = ReportRowsSpool(REPORT_LAYOUTS[report_type]["sheet"])
+        try:
+            for frame_path in frame_paths:
+                frame = pd.read_pickle(frame_path)
+                spool.append(frame)
+                if writer is not None:
+                    writer.append(frame)
+            report_data = pdf_report_data(page_count, None, report_type, row_count, bad_rows)
+            report_data["_spool"] = spool.close()
+            spool = None
+        finally:
+            if spool is not None:
+                spool.discard()
+            if writer is not None and spool is None:
+                writer.close()
+            elif writer is not None:
+                writer.discard()
+        with stage("pack", report_type):
+            return pack_report_data(report_data)
+    frame = None
+    if frame_paths:
+        frame = pd.concat([pd.read_pickle(frame_path) for frame_path in frame_paths], ignore_index=True)
+    if cache_path is not None and frame is not None:
+        with stage("columnar_cache", report_type):
+            write_columnar_frame(cache_path, frame, report_type)
+    if frame is None:
+        frame = pd.DataFrame(columns=REPORT_LAYOUTS[report_type]["columns"])
+    report_data = pdf_report_data(page_count, frame, report_type, row_count, bad_rows)
+    with stage("pack", report_type):
+        return pack_report_data(report_data)
+def empty_aggregates(report_type: str) -> Dict[str, Any]:
+    """Aggregates of a report without rows"""
+    return REPORT_AGGREGATORS[report_type](pd.DataFrame())
+async def parse_pdf_report(path: Path, filename: str, report_type: str, keep_rows: bool = True):
+    """Extract a PDF report in the parser pool, PDF_PAGES_PER_JOB pages per job.
+
+    Page ranges run in parallel but are consumed in order with at most a few jobs
+    ahead, so aggregates are deterministic and memory stays flat on long reports.
+    Rows go through spill files to one finishing job (finish_pdf_report), never
+    through this process; it keeps them in the report when keep_rows is set, else
+    in a ReportRowsSpool, and writes the columnar cache entry the caller may have
+    set (see parse_with_cache). Returns (packed report data, aggregates) like parse_report.
+    """
+    cache_path = _columnar_target.get()
+    if cache_path is not None and Path(cache_path).exists():
+        cache_path = None
+    try:
+        page_count, header = await run_parser_job(scan_pdf_layout, path, report_type)
+    except Exception as e:
+        logging.error(f"Error extracting PDF data: {e}")
+        return {"error": str(e), "success": False}, None
+    aggregates = None
+    frame_paths = []
+    row_count = 0
+    bad_rows = no_bad_rows()
+    pending = collections.deque()
+    spill_dir = tempfile.mkdtemp(prefix="pdf_rows_", dir=UPLOAD_SPOOL_DIR)
+    def consume(result):
+        nonlocal aggregates, row_count
+        aggregates = result["aggregates"] if aggregates is None else merge_aggregates(aggregates, result["aggregates"])
+        merge_bad_rows(bad_rows, result["bad_rows"], offset=row_count)
+        row_count += result["row_count"]
+        frame_paths.append(result["frame_path"])
+    try:
+        try:
+            if header:
+                with stage("extract", report_type):
+                    for start in range(0, page_count, PDF_PAGES_PER_JOB):
+                        pending.append(asyncio.ensure_future(run_parser_job(
+                            extract_pdf_range, path, report_type, start, start + PDF_PAGES_PER_JOB, header, spill_dir
+                        )))
+                        if len(pending) > PARSER_WORKERS:
+                            consume(await pending.popleft())
+                    while pending:
+                        consume(await pending.popleft())
+            else:
+                logging.warning(f"No {report_type} table header found in {filename}")
+        except Exception as e:
+            logging.error(f"Error extracting PDF data: {e}")
+            return {"error": str(e), "success": False}, None
+        finally:
+            for job in pending:
+                job.cancel()
+        if aggregates is None:
+            aggregates = await run_parser_job(empty_aggregates, report_type)
+        packed = await run_parser_job(
+            finish_pdf_report, page_count, frame_paths, report_type, row_count, bad_rows,
+            cache_path if header else None, keep_rows
+        )
+        return packed, aggregates
+    finally:
+        await asyncio.to_thread(shutil.rmtree, spill_dir, True)
+def spooled_parse_job(path: Path, filename: str, report_type: str, streaming: bool):
+    """(parser job, args) for an upload spooled to disk; PDFs fan out over page ranges"""
+    if filename.endswith('.pdf'):
+        return parse_pdf_report, (path, filename, report_type, not streaming)
+    return (parse_report_file if streaming else parse_spooled_report), (path, filename, report_type)
+def charts_or_mock(aggregates_530: Optional[Dict[str, Any]], aggregates_549: Optional[Dict[str, Any]], meta_value: float) -> Dict[str, Any]:
+    """charts_from_aggregates with the same mock fallback as process_real_data"""
+    if aggregates_530 is None or aggregates_549 is None:
+        return generate_mock_chart_data()  # Fallback to mock data
+    try:
+        return charts_from_aggregates(aggregates_530, aggregates_549, meta_value)
+    except Exception as e:
+        logging.exception(f"Error building charts from aggregates, falling back to mock charts: {e}")
+        return generate_mock_chart_data()  # Fallback to mock data
+def generate_mock_chart_data() -> Dict[str, Any]:
+    """Generate mock chart data for demonstration"""
+    return {
+        "performance_vs_meta": {
+            "current_performance": 1850000,
+            "meta_target": 2200000,
+            "percentage": 84.1
+        },
+        "geographic_distribution": [
+            {"state": "São Paulo", "value": 650000, "percentage": 35.1},
+            {"state": "Rio de Janeiro", "value": 420000, "percentage": 22.7},
+            {"state": "Minas Gerais", "value": 380000, "percentage": 20.5},
+            {"state": "Paraná", "value": 250000, "percentage": 13.5},
+            {"state": "Outros", "value": 150000, "percentage": 8.1}
+        ],
+        "external_sellers": [
+            {"name": "João Silva", "sales": 180000, "growth": 12.5},
+            {"name": "Maria Santos", "sales": 165000, "growth": 8.3},
+            {"name": "Carlos Oliveira", "sales": 142000, "growth": 15.2},
+            {"name": "Ana Costa", "sales": 128000, "growth": -2.1},
+            {"name": "Pedro Lima", "sales": 115000, "growth": 22.8}
+        ],
+        "main_clients": [
+            {"client": "Empresa Alpha Ltda", "value": 295000, "percentage": 15.9},
+            {"client": "Beta Indústria S/A", "value": 245000, "percentage": 13.2},
+            {"client": "Gamma Corporation", "value": 185000, "percentage": 10.0},
+            {"client": "Delta Comercial", "value": 165000, "percentage": 8.9},
+            {"client": "Epsilon Group", "value": 145000, "percentage": 7.8}
+        ],
+        "product_analysis": [
+            {"product": "Produto A", "quantity": 1250, "revenue": 485000},
+            {"product": "Produto B", "quantity": 890, "revenue": 398000},
+            {"product": "Produto C", "quantity": 650, "revenue": 285000},
+            {"product": "Produto D", "quantity": 420, "revenue": 195000},
+            {"product": "Produto E", "quantity": 380, "revenue": 165000}
+        ],
+        "production_status": {
+            "completed": 89,
+            "in_progress": 7,
+            "delayed": 4
+        },
+        "kpis": {
+            "conversion_rate": 8.7,
+            "average_ticket": 15800,
+            "client_retention": 92.3,
+            "sales_cycle": 18
+        }
+    }
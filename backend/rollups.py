@@ -0,0 +1,185 @@
+"""Monthly rollups and trends, and the report_facts fact table"""
+from __future__ import annotations
+import os
+import re
+from typing import List, Optional, Dict, Any
+from datetime import datetime, timezone
+import itertools
+import database
+from database import MONGO_CURSOR_BATCH_SIZE
+from parsing import FACT_DIMENSIONS, FACT_MEASURES, top_items
+# Monthly rollups
+# Rollup dimension -> (report, aggregates key); stored as [key, value] pairs since keys may contain "." or "$"
+ROLLUP_DIMENSIONS = {
+    "clients": ("530", "clients"),
+    "products": ("530", "products"),
+    "products_qty": ("530", "products_qty"),
+    "sellers": ("549", "sellers"),
+    "states": ("549", "states"),
+    "status": ("549", "status_counts")
+}
+TREND_MAX_TOP = 50
+def parse_month_year(value: str) -> Optional[str]:
+    """Normalize "YYYY-MM" (the upload form's month input) or "MM/YYYY" to "YYYY-MM"; None if unrecognized"""
+    match = re.fullmatch(r"(\d{4})-(\d{1,2})", (value or "").strip())
+    if match:
+        year, month = match.groups()
+    else:
+        match = re.fullmatch(r"(\d{1,2})/(\d{4})", (value or "").strip())
+        if not match:
+            return None
+        month, year = match.groups()
+    if not 1 <= int(month) <= 12:
+        return None
+    return f"{year}-{int(month):02d}"
+def month_key(month_year: str) -> str:
+    """Month an upload is cached and locked under: parse_month_year, or the trimmed input if unrecognized"""
+    return parse_month_year(month_year) or (month_year or "").strip()
+def shift_month(month: str, delta: int) -> str:
+    """"YYYY-MM" moved by delta months"""
+    index = int(month[:4]) * 12 + int(month[5:7]) - 1 + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+def _growth(current: float, previous: Optional[float]) -> Optional[float]:
+    """Percent change, None without a positive previous value"""
+    if not previous or previous <= 0:
+        return None
+    return round((current - previous) / previous * 100, 1)
+def _retention(current_clients, previous_clients) -> Optional[float]:
+    """Share (%) of last month's clients that bought again"""
+    if not previous_clients:
+        return None
+    return round(len(set(previous_clients) & set(current_clients)) / len(previous_clients) * 100, 1)
+def build_month_rollup(month_year: str, analysis_id: str, aggregates_530: Dict[str, Any], aggregates_549: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Rollup document for one analysis, or None when the month is not recognizable"""
+    month = parse_month_year(month_year)
+    if month is None:
+        return None
+    aggregates = {"530": aggregates_530, "549": aggregates_549}
+    return {
+        "_id": analysis_id,
+        "analysis_id": analysis_id,
+        "month_year": month_year,
+        "month": month,
+        "total_sales": aggregates_530["total_sales"],
+        "row_count_530": aggregates_530["row_count"],
+        "row_count_549": aggregates_549["row_count"],
+        "dimensions": {
+            name: list(aggregates[report][key].items()) for name, (report, key) in ROLLUP_DIMENSIONS.items()
+        },
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+async def save_month_rollup(rollup: Dict[str, Any]):
+    """Store an analysis rollup; the most recently updated rollup of a month is the current one"""
+    await database.db.monthly_rollups.update_one(
+        {"_id": rollup["_id"]}, {"$set": {key: value for key, value in rollup.items() if key != "_id"}}, upsert=True
+    )
+async def load_month_rollups(first: str, last: str, dimensions) -> List[Dict[str, Any]]:
+    """Current rollup of every month in [first, last], oldest first, with the given dimensions as dicts"""
+    projection = {"month": 1, "month_year": 1, "analysis_id": 1, "total_sales": 1, "updated_at": 1}
+    projection.update({f"dimensions.{name}": 1 for name in dimensions})
+    cursor = database.db.monthly_rollups.find({"month": {"$gte": first, "$lte": last}}, projection).sort(
+        [("month", 1), ("updated_at", -1)]
+    ).batch_size(MONGO_CURSOR_BATCH_SIZE)
+    rollups = []
+    async for rollup in cursor:
+        if rollups and rollups[-1]["month"] == rollup["month"]:
+            continue
+        rollup["dimensions"] = {name: dict(pairs) for name, pairs in rollup.get("dimensions", {}).items()}
+        rollups.append(rollup)
+    return rollups
+def apply_history(charts_data: Dict[str, Any], aggregates_530: Dict[str, Any], previous: Dict[str, Any]):
+    """Fill seller growth and client retention from the previous month's rollup"""
+    previous_sellers = previous["dimensions"].get("sellers", {})
+    for seller in charts_data.get("external_sellers", []):
+        growth = _growth(seller["sales"], previous_sellers.get(seller["name"]))
+        if growth is not None:
+            seller["growth"] = growth
+    retention = _retention(aggregates_530["clients"], previous["dimensions"].get("clients"))
+    if retention is not None and "kpis" in charts_data:
+        charts_data["kpis"]["client_retention"] = retention
+def compute_trends(rollups: List[Dict[str, Any]], start: str, dimension: str, top: int) -> Dict[str, Any]:
+    """Month-over-month growth, client retention and YTD sales from month rollups.
+
+    rollups may begin before start (January of its year at the latest) so the
+    first reported month still gets its growth and YTD figures.
+    """
+    months = []
+    ytd = {}
+    previous = None
+    for rollup in rollups:
+        month = rollup["month"]
+        clients = rollup["dimensions"].get("clients", {})
+        if previous is not None and previous["month"] != shift_month(month, -1):
+            previous = None  # Gap in the history: no month-over-month figures
+        ytd[month[:4]] = ytd.get(month[:4], 0) + rollup["total_sales"]
+        previous_clients = previous["dimensions"].get("clients", {}) if previous else {}
+        if month < start:
+            previous = rollup
+            continue
+        months.append({
+            "month": month,
+            "month_year": rollup["month_year"],
+            "analysis_id": rollup["analysis_id"],
+            "total_sales": rollup["total_sales"],
+            "sales_growth": _growth(rollup["total_sales"], previous["total_sales"] if previous else None),
+            "ytd_sales": ytd[month[:4]],
+            "clients": len(clients),
+            "new_clients": len(clients.keys() - previous_clients.keys()) if previous else None,
+            "lost_clients": len(previous_clients.keys() - clients.keys()) if previous else None,
+            "client_retention": _retention(clients, previous_clients) if previous else None,
+            "average_ticket": round(rollup["total_sales"] / len(clients), 2) if clients else 0
+        })
+        previous = rollup
+    rollups = [rollup for rollup in rollups if rollup["month"] >= start]
+    totals = {}
+    for rollup in rollups:
+        for key, value in rollup["dimensions"].get(dimension, {}).items():
+            totals[key] = totals.get(key, 0) + value
+    series = []
+    for key, total in top_items(totals, top):
+        values = [rollup["dimensions"].get(dimension, {}).get(key, 0) for rollup in rollups]
+        consecutive = len(rollups) > 1 and rollups[-2]["month"] == shift_month(rollups[-1]["month"], -1)
+        series.append({
+            "key": key,
+            "total": total,
+            "values": values,
+            "growth": _growth(values[-1], values[-2]) if consecutive else None
+        })
+    return {"months": months, "dimension": dimension, "series": series}
+# Fact table
+FACT_BATCH_SIZE = int(os.environ.get('FACT_BATCH_SIZE', '5000'))
+FACTS_PAGE_SIZE = 50
+FACTS_MAX_PAGE_SIZE = 1000
+def iter_fact_documents(analysis_id: str, month: str, report_type: str, aggregates: Dict[str, Any]):
+    """report_facts documents of one report: dimensions, row count and summed measures per fact"""
+    dimensions = list(FACT_DIMENSIONS[report_type])
+    measures = list(FACT_MEASURES[report_type])
+    for key, rows in aggregates.get("fact_rows", {}).items():
+        document = {"analysis_id": analysis_id, "month": month, "report": report_type}
+        document.update(zip(dimensions, key))
+        document["rows"] = int(rows)
+        for measure in measures:
+            document[measure] = aggregates[f"fact_{measure}"].get(key, 0)
+        yield document
+def iter_batches(items, size: int):
+    """Lists of up to size items from any iterable"""
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+async def insert_facts(documents) -> int:
+    """insert_many fact documents in FACT_BATCH_SIZE batches; returns the number inserted"""
+    inserted = 0
+    for batch in iter_batches(documents, FACT_BATCH_SIZE):
+        await database.db.report_facts.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+async def store_facts(analysis_id: str, month: str, aggregates_by_report: Dict[str, Dict[str, Any]]):
+    """Insert the facts of an analysis in FACT_BATCH_SIZE batches, then drop superseded facts of its month"""
+    await insert_facts(itertools.chain.from_iterable(
+        iter_fact_documents(analysis_id, month, report_type, aggregates)
+        for report_type, aggregates in aggregates_by_report.items()
+    ))
+    await database.db.report_facts.delete_many({"month": month, "analysis_id": {"$ne": analysis_id}})
@@ -1,407 +1,276 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
-from dotenv import load_dotenv
+from __future__ import annotations
+from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Form, Header, Query, Response
+from fastapi.responses import FileResponse, JSONResponse
+from pymongo.errors import DuplicateKeyError
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import re
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
-import uuid
-from datetime import datetime, timezone
 import asyncio
+import base64
 import json
-import pandas as pd
-import fitz  # PyMuPDF
-import openpyxl
-# from emergentintegrations.llm.chat import LlmChat, UserMessage
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(
-    mongo_url,
-    tls=True,
-    tlsAllowInvalidCertificates=False
-)
-db = client[os.environ['DB_NAME']]
+import gzip
+import hashlib
+import email.utils
+import hmac
+import tempfile
+import database
+from analyses import (UPLOAD_CACHE_MAX_AGE, UPLOAD_RETRY_AFTER_SECONDS, analyze_reports, charts_cache_stats, charts_etag,
+                      charts_not_modified, current_meta_value, load_charts_payload, load_current_meta, memory_cache_stats,
+                      negotiate_charts_encoding, publish_meta, recompute_analysis, recompute_meta_fields)
+from jobs import (JOB_ACTIVE_STATUSES, JOB_SPOOL_DIR, enqueue_upload_job, find_active_upload_job, format_upload_job,
+                  resume_upload_jobs, upload_dedupe_key)
+from models import MetaConfig, MetaConfigCreate, UploadJob
+from parsing import (COLUMNAR_CACHE, COLUMNAR_CACHE_MAX_BYTES, FACT_DIMENSIONS, FACT_MEASURES, PARSER_EXECUTOR,
+                     PARSER_PREWARM, REPORT_LAYOUTS, UPLOAD_CHUNK_BYTES, UPLOAD_SPOOL_DIR, apply_meta, columnar_cache_entries, parse_report,
+                     prepare_for_mongo, shutdown_parser_executor, spooled_parse_job, use_streaming, warm_parser_pool)
+from rollups import (FACTS_MAX_PAGE_SIZE, FACTS_PAGE_SIZE, ROLLUP_DIMENSIONS, TREND_MAX_TOP, compute_trends,
+                     load_month_rollups, parse_month_year, shift_month)
+from storage import load_raw_report
+from tracing import PROFILE_DIR, count, render_metrics, stage, traced_upload
 # Create the main app without a prefix
 app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
-# Models
-class MetaConfig(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    meta_value: float
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-class MetaConfigCreate(BaseModel):
-    meta_value: float
-class ReportAnalysis(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    month_year: str
-    report_530_data: Dict[str, Any]
-    report_549_data: Dict[str, Any]
-    ai_analysis: Dict[str, Any]
-    charts_data: Dict[str, Any]
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-class ReportAnalysisCreate(BaseModel):
-    month_year: str
-# Helper functions
-def extract_pdf_data(file_content: bytes) -> Dict[str, Any]:
-    """Extract data from PDF content"""
-    try:
-        doc = fitz.open(stream=file_content, filetype="pdf")
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        doc.close()
-        
-        # Basic text extraction - can be enhanced based on actual PDF structure
-        return {
-            "raw_text": text,
-            "extracted_values": {},
-            "success": True
-        }
-    except Exception as e:
-        return {"error": str(e), "success": False}
-def extract_excel_data(file_content: bytes) -> Dict[str, Any]:
-    """Extract data from Excel content"""
-    try:
-        from io import BytesIO
-        import pandas as pd
-        
-         # Use BytesIO to avoid deprecation warning
-        excel_buffer = BytesIO(file_content)
-        df_dict = pd.read_excel(excel_buffer, sheet_name=None)  # Read all sheets
-        
-        # Convert all sheets to dictionary format
-        data = {}
-        for sheet_name, sheet_df in df_dict.items():
-            # Fix column names - handle datetime columns safely
-            fixed_columns = []
-            for col in sheet_df.columns:
-                if pd.isna(col):
-                    fixed_columns.append("unnamed_column")
-                elif hasattr(col, 'strftime'):
-                    try:
-                        fixed_columns.append(col.strftime('%Y-%m-%d_%H-%M-%S'))
-                    except:
-                        fixed_columns.append(f"datetime_col_{len(fixed_columns)}")
-                else:
-                    fixed_columns.append(str(col))
-            
-            sheet_df.columns = fixed_columns
-            
-            # Convert to dict safely
-            records = []
-            for _, row in sheet_df.iterrows():
-                record = {}
-                for col_name, value in row.items():
-                    # Handle different value types safely
-                    if pd.isna(value):
-                        record[col_name] = ""
-                    elif isinstance(value, (pd.Timestamp, pd._libs.tslibs.nattype.NaTType)):
-                        record[col_name] = str(value) if not pd.isna(value) else ""
-                    else:
-                        record[col_name] = value
-                records.append(record)
-            
-            data[sheet_name] = records
-        
-        return {
-            "sheets": data,
-            "success": True
-        }
-    except Exception as e:
-        print(f"Error extracting Excel data: {e}")
-        import traceback
-        traceback.print_exc()
-        return {"error": str(e), "success": False}
-def prepare_for_mongo(data):
-    """Prepare data for MongoDB by converting datetime objects to ISO strings"""
-    import pandas as pd
-    import numpy as np
-    
-    if isinstance(data, dict):
-        # Ensure all keys are strings and process values
-        cleaned_dict = {}
-        for k, v in data.items():
-            str_key = str(k)  # Convert key to string
-            cleaned_dict[str_key] = prepare_for_mongo(v)
-        return cleaned_dict
-    elif isinstance(data, list):
-        return [prepare_for_mongo(item) for item in data]
-    elif isinstance(data, datetime):
-        return data.isoformat()
-    elif isinstance(data, pd.Timestamp):
-        return data.isoformat()
-    elif isinstance(data, np.datetime64):
-        return pd.Timestamp(data).isoformat()
-    elif pd.isna(data) or (hasattr(data, '__class__') and 'NaT' in str(data.__class__)):
-        return None
-    elif isinstance(data, (np.integer, np.floating)):
-        return data.item()  # Convert numpy types to native Python types
-    else:
-        return data
-def process_real_data(report_530_data: Dict, report_549_data: Dict, meta_target: float) -> Dict[str, Any]:
-    """Process real Helibombas data from reports 530 and 549"""
+# Upload spooling
+def use_streaming_upload(*uploads: UploadFile) -> bool:
+    """Decide whether this request goes through the constant-memory streaming path"""
+    return use_streaming(*(upload.size or 0 for upload in uploads))
+async def spool_upload(upload: UploadFile, directory: Optional[str] = None):
+    """Copy an upload to a temporary file in UPLOAD_CHUNK_BYTES chunks.
+
+    Returns (path, sha256 hex digest of the content).
+    """
+    suffix = Path(upload.filename or "").suffix
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=directory or UPLOAD_SPOOL_DIR, delete=False) as spool:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+            spool.write(chunk)
+    return Path(spool.name), digest.hexdigest()
+# Upload admission
+# POST /api/upload-reports is answered 429 (with Retry-After) before its body is read when this worker
+# already runs UPLOAD_MAX_IN_FLIGHT uploads or their declared sizes (Content-Length) would go over
+# UPLOAD_MAX_IN_FLIGHT_BYTES; 0 disables a limit. An upload bigger than the byte limit on its own is
+# still admitted when nothing else is in flight, otherwise it could never be.
+UPLOAD_MAX_IN_FLIGHT = int(os.environ.get('UPLOAD_MAX_IN_FLIGHT', '4'))
+UPLOAD_MAX_IN_FLIGHT_BYTES = int(os.environ.get('UPLOAD_MAX_IN_FLIGHT_BYTES', str(1024 * 1024 * 1024)))
+ADMISSION_PATHS = ("/api/upload-reports",)
+_admission = {"uploads": 0, "bytes": 0}
+admission_stats = {"admitted": 0, "rejected": 0}
+def admit_upload(size: int) -> bool:
+    """Reserve room for one upload of `size` bytes; False when the worker is saturated"""
+    uploads, in_flight = _admission["uploads"], _admission["bytes"]
+    if (UPLOAD_MAX_IN_FLIGHT and uploads >= UPLOAD_MAX_IN_FLIGHT) or (
+        UPLOAD_MAX_IN_FLIGHT_BYTES and uploads and in_flight + size > UPLOAD_MAX_IN_FLIGHT_BYTES
+    ):
+        admission_stats["rejected"] += 1
+        return False
+    _admission["uploads"] += 1
+    _admission["bytes"] += size
+    admission_stats["admitted"] += 1
+    return True
+def release_upload(size: int):
+    _admission["uploads"] -= 1
+    _admission["bytes"] -= size
+def render_admission_metrics() -> str:
+    """Upload admission gauges in the Prometheus text exposition format"""
+    lines = [
+        "# HELP helibombas_uploads_in_flight Uploads admitted and not finished", "# TYPE helibombas_uploads_in_flight gauge",
+        f"helibombas_uploads_in_flight {_admission['uploads']}",
+        "# HELP helibombas_upload_bytes_in_flight Declared bytes of the uploads in flight", "# TYPE helibombas_upload_bytes_in_flight gauge",
+        f"helibombas_upload_bytes_in_flight {_admission['bytes']}",
+        "# HELP helibombas_uploads_rejected_total Uploads answered 429 by admission control", "# TYPE helibombas_uploads_rejected_total counter",
+        f"helibombas_uploads_rejected_total {admission_stats['rejected']}"
+    ]
+    return "\n".join(lines) + "\n"
+def _content_length(scope) -> int:
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            return int(value) if value.isdigit() else 0
+    return 0  # Chunked: only the upload count applies
+class UploadAdmissionMiddleware:
+    """ASGI middleware applying the in-flight limits to ADMISSION_PATHS; other requests pass straight through"""
+    def __init__(self, app):
+        self.app = app
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in ADMISSION_PATHS:
+            await self.app(scope, receive, send)
+            return
+        size = _content_length(scope)
+        if not admit_upload(size):
+            logging.info(f"Upload rejected: {_admission['uploads']} uploads, {_admission['bytes']} bytes in flight")
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Servidor ocupado com outros envios; tente novamente em instantes"},
+                headers={"Retry-After": str(UPLOAD_RETRY_AFTER_SECONDS)}
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            release_upload(size)
+# Analysis listing
+ANALYSES_PAGE_SIZE = int(os.environ.get('ANALYSES_PAGE_SIZE', '100'))
+ANALYSES_MAX_PAGE_SIZE = int(os.environ.get('ANALYSES_MAX_PAGE_SIZE', '500'))
+# Fields returned by the summary view: enough for the month selector and headline KPIs
+ANALYSIS_SUMMARY_FIELDS = ["id", "month_year", "created_at", "charts_data.performance_vs_meta", "charts_data.kpis"]
+# Fields left out of the full view unless requested with fields=
+ANALYSIS_RAW_FIELDS = ["report_530_data", "report_549_data"]
+def encode_analyses_cursor(analysis: Dict[str, Any]) -> str:
+    """Opaque keyset cursor pointing after the given analysis in (created_at, id) descending order"""
+    raw = json.dumps([analysis["created_at"], analysis["id"]]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+def decode_analyses_cursor(cursor: str):
     try:
-        print(f"Processing real data - 530: {report_530_data.keys()}, 549: {report_549_data.keys()}")
-        
-        # Extract data from report 530 (sheet1)
-        data_530 = report_530_data.get('sheets', {}).get('sheet1', [])
-        print(f"Data 530 records: {len(data_530)}")
-        
-        # Extract data from report 549 (Planilha1) 
-        data_549 = report_549_data.get('sheets', {}).get('Planilha1', [])
-        print(f"Data 549 records: {len(data_549)}")
-        
-        if not data_530:
-            print("No data 530 found, using mock data")
-            return generate_mock_chart_data()  # Fallback to mock data
-        
-        if not data_549:
-            print("No data 549 found, will process with 530 data only")
-        
-        # Calculate real performance vs meta
-        total_vendas_530 = sum(float(row.get('Vlr.Total', 0)) for row in data_530 if row.get('Vlr.Total'))
-        
-        # Get real external sellers from 549 (if available)
-        vendedores_externos = {}
-        if data_549:
-            for row in data_549:
-                vendedor = row.get('VENDEDOR EXTERNO')
-                valor = row.get('VLR. TOTAL', 0)
-                if vendedor and vendedor != 'HELIBOMBAS' and valor:  # Exclude HELIBOMBAS as it's internal
-                    valor = float(valor) if valor else 0
-                    if vendedor in vendedores_externos:
-                        vendedores_externos[vendedor] += valor
-                    else:
-                        vendedores_externos[vendedor] = valor
-        
-        # Format external sellers for chart (with fallback data if no 549 data)
-        external_sellers = []
-        if vendedores_externos:
-            for vendedor, valor in sorted(vendedores_externos.items(), key=lambda x: x[1], reverse=True)[:5]:
-                external_sellers.append({
-                    "name": vendedor,
-                    "sales": valor,
-                    "growth": 0  # Would need historical data for real growth
-                })
-        else:
-            # Use mock data for external sellers if no 549 data
-            external_sellers = [
-                {"name": "Sem dados vendedor externo", "sales": 0, "growth": 0}
-            ]
-        
-        # Get real geographic distribution from 549 (if available)
-        estados_vendas = {}
-        if data_549:
-            for row in data_549:
-                estado = row.get('UF')
-                valor = row.get('VLR. TOTAL', 0)
-                if estado and valor:
-                    valor = float(valor) if valor else 0
-                    if estado in estados_vendas:
-                        estados_vendas[estado] += valor
-                    else:
-                        estados_vendas[estado] = valor
-        
-        geographic_distribution = []
-        if estados_vendas:
-            total_geographic = sum(estados_vendas.values()) if estados_vendas else 1
-            for estado, valor in sorted(estados_vendas.items(), key=lambda x: x[1], reverse=True)[:5]:
-                percentage = (valor / total_geographic) * 100 if total_geographic > 0 else 0
-                geographic_distribution.append({
-                    "state": estado,
-                    "value": valor,
-                    "percentage": round(percentage, 1)
-                })
-        else:
-            # Mock geographic data if no 549 data
-            geographic_distribution = [
-                {"state": "Dados não disponíveis", "value": total_vendas_530, "percentage": 100.0}
-            ]
-        
-        # Get real main clients from 530
-        clientes_vendas = {}
-        for row in data_530:
-            cliente = row.get('Cliente')
-            valor = row.get('Vlr.Total', 0)
-            if cliente and valor:
-                valor = float(valor) if valor else 0
-                if cliente in clientes_vendas:
-                    clientes_vendas[cliente] += valor
-                else:
-                    clientes_vendas[cliente] = valor
-        
-        main_clients = []
-        for cliente, valor in sorted(clientes_vendas.items(), key=lambda x: x[1], reverse=True)[:5]:
-            percentage = (valor / total_vendas_530) * 100 if total_vendas_530 > 0 else 0
-            main_clients.append({
-                "client": cliente,
-                "value": valor,
-                "percentage": round(percentage, 1)
-            })
-        
-        # Get real product analysis from 530
-        produtos_vendas = {}
-        produtos_qtd = {}
-        for row in data_530:
-            produto = row.get('Descrição')
-            valor = row.get('Vlr.Total', 0)
-            qtd = row.get('Qtde', 0)
-            if produto and valor:
-                valor = float(valor) if valor else 0
-                qtd = float(qtd) if qtd else 0
-                if produto in produtos_vendas:
-                    produtos_vendas[produto] += valor
-                    produtos_qtd[produto] += qtd
-                else:
-                    produtos_vendas[produto] = valor
-                    produtos_qtd[produto] = qtd
-        
-        product_analysis = []
-        for produto, valor in sorted(produtos_vendas.items(), key=lambda x: x[1], reverse=True)[:5]:
-            qtd = produtos_qtd.get(produto, 0)
-            # Truncate long product names
-            produto_nome = produto[:30] + "..." if len(str(produto)) > 30 else produto
-            product_analysis.append({
-                "product": produto_nome,
-                "quantity": int(qtd),
-                "revenue": valor
-            })
-        
-        # Calculate production status from 549 (if available)
-        production_status = {"completed": 95, "in_progress": 3, "delayed": 2}  # Default values
-        if data_549:
-            status_count = {}
-            for row in data_549:
-                status = row.get('STATUS')
-                if status:
-                    if status in status_count:
-                        status_count[status] += 1
-                    else:
-                        status_count[status] = 1
-            
-            if status_count:
-                total_orders = sum(status_count.values())
-                production_status = {
-                    "completed": round((status_count.get('F', 0) / total_orders) * 100, 0),
-                    "in_progress": round((status_count.get('L', 0) / total_orders) * 100, 0),
-                    "delayed": round((status_count.get('V', 0) / total_orders) * 100, 0)
-                }
-        
-        # Calculate real KPIs
-        total_clients = len(clientes_vendas) if clientes_vendas else 1
-        total_products = len(produtos_vendas) if produtos_vendas else 1
-        avg_ticket = total_vendas_530 / total_clients if total_clients > 0 else 0
-        
-        print(f"Total vendas from 530: {total_vendas_530}")
-        print(f"Number of clients: {len(clientes_vendas)}")
-        print(f"Number of products: {len(produtos_vendas)}")
-        print(f"Number of vendedores externos: {len(vendedores_externos)}")
-        
-        return {
-            "performance_vs_meta": {
-                "current_performance": total_vendas_530,
-                "meta_target": meta_target,
-                "percentage": round((total_vendas_530 / meta_target) * 100, 1) if meta_target > 0 else 0
-            },
-            "geographic_distribution": geographic_distribution,
-            "external_sellers": external_sellers,
-            "main_clients": main_clients,
-            "product_analysis": product_analysis,
-            "production_status": production_status,
-            "kpis": {
-                "conversion_rate": 8.7,  # Would need more data to calculate
-                "average_ticket": round(avg_ticket, 2),
-                "client_retention": 92.3,  # Would need historical data
-                "sales_cycle": 18  # Would need more data to calculate
+        created_at, analysis_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(created_at), str(analysis_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+def analyses_projection(view: str, fields: Optional[str]) -> Dict[str, int]:
+    """Mongo projection for the analyses listing; id and created_at are always kept for the cursor"""
+    extra = [field.strip() for field in (fields or "").split(",") if field.strip()]
+    if view == "summary":
+        projection = {field: 1 for field in ANALYSIS_SUMMARY_FIELDS + extra}
+        projection.update({"id": 1, "created_at": 1, "_id": 0})
+        return projection
+    projection = {field: 0 for field in ANALYSIS_RAW_FIELDS if field not in extra}
+    projection["_id"] = 0
+    return projection
+# Index management
+# Every index the API relies on, per collection: (keys, options). Names are fixed so creation is idempotent.
+INDEX_SPECS = {
+    "meta_configs": [
+        ([("id", 1)], {"name": "id_unique", "unique": True}),
+        ([("created_at", -1)], {"name": "created_at_desc"})
+    ],
+    "report_analyses": [
+        ([("id", 1)], {"name": "id_unique", "unique": True}),
+        ([("created_at", -1), ("id", -1)], {"name": "created_at_id"}),
+        ([("month_year", 1), ("created_at", -1), ("id", -1)], {"name": "month_year_created_at_id"}),
+        ([("content_key", 1), ("created_at", -1)], {"name": "content_key_created_at", "sparse": True})
+    ],
+    "upload_jobs": [
+        ([("id", 1)], {"name": "id_unique", "unique": True}),
+        ([("dedupe_key", 1)], {
+            "name": "dedupe_key_active", "unique": True, "partialFilterExpression": {"status": {"$in": JOB_ACTIVE_STATUSES}}
+        }),
+        ([("status", 1), ("updated_at", 1)], {"name": "status_updated_at"})
+    ],
+    "monthly_rollups": [
+        ([("month", 1), ("updated_at", -1)], {"name": "month_updated_at"})
+    ],
+    "report_facts": [
+        ([("analysis_id", 1), ("report", 1)], {"name": "analysis_report"}),
+        ([("month", 1), ("analysis_id", 1)], {"name": "month_analysis"}),
+        ([("report", 1), ("analysis_id", 1), ("value", -1)], {"name": "report_analysis_value"}),
+        ([("report", 1), ("client", 1), ("analysis_id", 1)], {"name": "report_client_analysis"}),
+        ([("report", 1), ("product", 1), ("analysis_id", 1)], {"name": "report_product_analysis"}),
+        ([("report", 1), ("seller", 1), ("analysis_id", 1)], {"name": "report_seller_analysis"}),
+        ([("report", 1), ("uf", 1), ("analysis_id", 1)], {"name": "report_uf_analysis"})
+    ],
+    "parsed_reports": [
+        ([("created_at", 1)], {"name": "created_at_ttl", "expireAfterSeconds": UPLOAD_CACHE_MAX_AGE}),
+        ([("last_used_at", -1)], {"name": "last_used_at_desc"})
+    ],
+    "report_rows": [
+        ([("rows_key", 1), ("seq", 1)], {"name": "rows_key_seq", "unique": True})
+    ],
+    "month_locks": [
+        ([("expires_at", 1)], {"name": "expires_at_ttl", "expireAfterSeconds": 0})
+    ]
+}
+# Representative query of each API route, explained by GET /api/admin/query-plans
+ROUTE_QUERIES = [
+    {"route": "GET /api/meta-config", "collection": "meta_configs", "filter": {}, "sort": [("created_at", -1)], "limit": 1},
+    {"route": "GET /api/analyses", "collection": "report_analyses", "filter": {}, "sort": [("created_at", -1), ("id", -1)], "limit": ANALYSES_PAGE_SIZE},
+    {"route": "GET /api/analyses?month_year=", "collection": "report_analyses", "filter": {"month_year": "01/2025"}, "sort": [("created_at", -1), ("id", -1)], "limit": ANALYSES_PAGE_SIZE},
+    {"route": "GET /api/analyses/{analysis_id}", "collection": "report_analyses", "filter": {"id": "explain"}, "limit": 1},
+    {"route": "GET /api/analyses/{analysis_id}/charts", "collection": "analysis_charts", "filter": {"_id": "explain"}, "limit": 1},
+    {"route": "POST /api/upload-jobs (dedupe)", "collection": "upload_jobs", "filter": {"dedupe_key": "explain", "status": {"$in": JOB_ACTIVE_STATUSES}}, "limit": 1},
+    {"route": "GET /api/upload-jobs/{job_id}", "collection": "upload_jobs", "filter": {"id": "explain"}, "limit": 1},
+    {"route": "startup: resume upload jobs", "collection": "upload_jobs", "filter": {"status": "queued"}},
+    {"route": "upload cache lookup", "collection": "report_analyses", "filter": {"content_key": "explain", "created_at": {"$gte": "2025-01-01"}}, "limit": 1},
+    {"route": "GET /api/facts?uf=", "collection": "report_facts", "filter": {"report": "549", "uf": "SP", "analysis_id": {"$in": ["explain"]}}},
+    {"route": "GET /api/facts", "collection": "report_facts", "filter": {"report": "530", "analysis_id": {"$in": ["explain"]}}, "sort": [("value", -1)], "limit": FACTS_PAGE_SIZE},
+    {"route": "GET /api/analyses/{analysis_id}/reports/{report_type} (row chunks)", "collection": "report_rows", "filter": {"rows_key": "explain"}, "sort": [("seq", 1)]},
+    {"route": "GET /api/trends", "collection": "monthly_rollups", "filter": {"month": {"$gte": "2025-01", "$lte": "2025-12"}}, "sort": [("month", 1), ("updated_at", -1)]}
+]
+async def ensure_indexes() -> Dict[str, List[str]]:
+    """Create every index in INDEX_SPECS; safe to run on each startup. Returns created index names."""
+    created = {}
+    for collection, specs in INDEX_SPECS.items():
+        created[collection] = []
+        for keys, options in specs:
+            try:
+                created[collection].append(await database.db[collection].create_index(keys, **options))
+            except Exception as e:
+                logging.error(f"Could not create index {options['name']} on {collection}: {str(e)}")
+    return created
+async def collect_index_usage() -> Dict[str, Any]:
+    """Index definitions and $indexStats usage counters per collection"""
+    report = {}
+    for collection in INDEX_SPECS:
+        information = await database.db[collection].index_information()
+        stats = await database.db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+        usage = {stat["name"]: stat.get("accesses", {}) for stat in stats}
+        report[collection] = [
+            {
+                "name": name,
+                "keys": info["key"],
+                "unique": info.get("unique", False),
+                "ops": usage.get(name, {}).get("ops", 0),
+                "since": usage.get(name, {}).get("since")
             }
-        }
-        
-    except Exception as e:
-        print(f"Error processing real data: {e}")
-        return generate_mock_chart_data()  # Fallback to mock data
-def generate_mock_chart_data() -> Dict[str, Any]:
-    """Generate mock chart data for demonstration"""
-    return {
-        "performance_vs_meta": {
-            "current_performance": 1850000,
-            "meta_target": 2200000,
-            "percentage": 84.1
-        },
-        "geographic_distribution": [
-            {"state": "São Paulo", "value": 650000, "percentage": 35.1},
-            {"state": "Rio de Janeiro", "value": 420000, "percentage": 22.7},
-            {"state": "Minas Gerais", "value": 380000, "percentage": 20.5},
-            {"state": "Paraná", "value": 250000, "percentage": 13.5},
-            {"state": "Outros", "value": 150000, "percentage": 8.1}
-        ],
-        "external_sellers": [
-            {"name": "João Silva", "sales": 180000, "growth": 12.5},
-            {"name": "Maria Santos", "sales": 165000, "growth": 8.3},
-            {"name": "Carlos Oliveira", "sales": 142000, "growth": 15.2},
-            {"name": "Ana Costa", "sales": 128000, "growth": -2.1},
-            {"name": "Pedro Lima", "sales": 115000, "growth": 22.8}
-        ],
-        "main_clients": [
-            {"client": "Empresa Alpha Ltda", "value": 295000, "percentage": 15.9},
-            {"client": "Beta Indústria S/A", "value": 245000, "percentage": 13.2},
-            {"client": "Gamma Corporation", "value": 185000, "percentage": 10.0},
-            {"client": "Delta Comercial", "value": 165000, "percentage": 8.9},
-            {"client": "Epsilon Group", "value": 145000, "percentage": 7.8}
-        ],
-        "product_analysis": [
-            {"product": "Produto A", "quantity": 1250, "revenue": 485000},
-            {"product": "Produto B", "quantity": 890, "revenue": 398000},
-            {"product": "Produto C", "quantity": 650, "revenue": 285000},
-            {"product": "Produto D", "quantity": 420, "revenue": 195000},
-            {"product": "Produto E", "quantity": 380, "revenue": 165000}
-        ],
-        "production_status": {
-            "completed": 89,
-            "in_progress": 7,
-            "delayed": 4
-        },
-        "kpis": {
-            "conversion_rate": 8.7,
-            "average_ticket": 15800,
-            "client_retention": 92.3,
-            "sales_cycle": 18
-        }
-    }
-def format_sellers_for_ai(sellers):
-    """Format sellers data for AI analysis"""
-    result = ""
-    for i, seller in enumerate(sellers, 1):
-        result += f"{i}. {seller['name']}: R$ {seller['sales']:,.2f}\n"
-    return result
-def format_clients_for_ai(clients):
-    """Format clients data for AI analysis"""
-    result = ""
-    for i, client in enumerate(clients, 1):
-        result += f"{i}. {client['client']}: R$ {client['value']:,.2f} ({client['percentage']}%)\n"
-    return result
-def format_geography_for_ai(geo):
-    """Format geographic data for AI analysis"""
-    result = ""
-    for i, state in enumerate(geo, 1):
-        result += f"{i}. {state['state']}: R$ {state['value']:,.2f} ({state['percentage']}%)\n"
-    return result
-def format_products_for_ai(products):
-    """Format products data for AI analysis"""
-    result = ""
-    for i, product in enumerate(products, 1):
-        result += f"{i}. {product['product']}: R$ {product['revenue']:,.2f} (Qtd: {product['quantity']})\n"
-    return result
-async def analyze_with_ai(report_530_data: Dict, report_549_data: Dict, charts_data: Dict) -> Dict[str, Any]:
-    return {
-        "ai_insights": "Análise automática não disponível no momento.",
-        "success": False
-    }
+            for name, info in information.items()
+        ]
+    return prepare_for_mongo(report)
+def _plan_stages(plan: Dict[str, Any]):
+    """Flatten a winning plan tree into (stage, indexName) pairs"""
+    if not plan:
+        return []
+    stages = [(plan.get("stage"), plan.get("indexName"))]
+    for child in plan.get("inputStages") or [plan.get("inputStage")]:
+        stages.extend(_plan_stages(child))
+    return stages
+async def explain_route_queries() -> List[Dict[str, Any]]:
+    """Explain the query behind every API route and flag collection scans"""
+    plans = []
+    for spec in ROUTE_QUERIES:
+        cursor = database.db[spec["collection"]].find(spec["filter"])
+        if spec.get("sort"):
+            cursor = cursor.sort(spec["sort"])
+        if spec.get("limit"):
+            cursor = cursor.limit(spec["limit"])
+        explanation = await cursor.explain()
+        winning = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        # Newer servers wrap the classic plan under queryPlan
+        stages = _plan_stages(winning.get("queryPlan", winning))
+        stats = explanation.get("executionStats", {})
+        plans.append({
+            "route": spec["route"],
+            "collection": spec["collection"],
+            "stages": [stage for stage, _ in stages],
+            "indexes": [index for _, index in stages if index],
+            "collection_scan": any(stage == "COLLSCAN" for stage, _ in stages),
+            "in_memory_sort": any(stage == "SORT" for stage, _ in stages),
+            "docs_examined": stats.get("totalDocsExamined"),
+            "keys_examined": stats.get("totalKeysExamined"),
+            "returned": stats.get("nReturned"),
+            "time_ms": stats.get("executionTimeMillis")
+        })
+    return plans
+# Admin endpoints need an X-Admin-Token matching ADMIN_TOKEN; without ADMIN_TOKEN they are closed
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+def check_admin_token(x_admin_token: Optional[str]):
+    if not ADMIN_TOKEN or not hmac.compare_digest((x_admin_token or "").encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        raise HTTPException(status_code=403, detail="Acesso negado")
 # API Routes
 @api_router.get("/")
 async def root():
@@ -412,107 +281,389 @@ async def create_meta_config(input: MetaConfigCreate):
     meta_dict = input.dict()
     meta_obj = MetaConfig(**meta_dict)
     meta_dict_for_mongo = prepare_for_mongo(meta_obj.dict())
-    await db.meta_configs.insert_one(meta_dict_for_mongo)
+    await database.db.meta_configs.insert_one(meta_dict_for_mongo)
+    await publish_meta(meta_dict_for_mongo)
     return meta_obj
 @api_router.get("/meta-config")
 async def get_current_meta():
     """Get current meta configuration"""
-    meta = await db.meta_configs.find().sort("created_at", -1).limit(1).to_list(1)
-    if meta:
-        # Remove _id field from MongoDB document to avoid serialization issues
-        meta_doc = meta[0]
-        if '_id' in meta_doc:
-            del meta_doc['_id']
-        return meta_doc
-    return {"meta_value": 2200000.0}  # Default meta
+    return await load_current_meta()
 @api_router.post("/upload-reports")
 async def upload_reports(
     month_year: str = Form(...),
     report_530: UploadFile = File(...),
-    report_549: UploadFile = File(...)
+    report_549: UploadFile = File(...),
+    x_profile: bool = Header(False),
+    x_admin_token: Optional[str] = Header(None)
 ):
-    """Upload and process both reports"""
+    """Upload and process both reports; X-Profile: true (admin) also writes a cProfile report"""
+    if x_profile:
+        check_admin_token(x_admin_token)
+    paths = []
     try:
-        # Read file contents
-        report_530_content = await report_530.read()
-        report_549_content = await report_549.read()
-        
-        # Process files based on type
-        if report_530.filename.endswith('.pdf'):
-            report_530_data = extract_pdf_data(report_530_content)
-        else:
-            report_530_data = extract_excel_data(report_530_content)
+        async with traced_upload("upload", profile=x_profile) as trace:
+            reports = {}
+            streaming = use_streaming_upload(report_530, report_549)
+            for upload, report_type in ((report_530, "530"), (report_549, "549")):
+                with stage("receive", report_type):
+                    if streaming or upload.filename.endswith('.pdf'):
+                        # Large uploads and PDFs: spool to disk, then aggregate incrementally / page range by page range
+                        path, sha256 = await spool_upload(upload)
+                        paths.append(path)
+                        size = path.stat().st_size
+                        reports[report_type] = (sha256, *spooled_parse_job(path, upload.filename, report_type, streaming))
+                    else:
+                        # Read file contents
+                        content = await upload.read()
+                        size = len(content)
+                        reports[report_type] = (hashlib.sha256(content).hexdigest(), parse_report, (content, upload.filename, report_type))
+                count("bytes_in", size, report_type)
             
-        if report_549.filename.endswith('.pdf'):
-            report_549_data = extract_pdf_data(report_549_content)
-        else:
-            report_549_data = extract_excel_data(report_549_content)
-        
-        # Generate chart data from REAL data instead of mock
-        meta_config = await get_current_meta()
-        meta_value = meta_config.get("meta_value", 2200000.0)
+            # Parse and aggregate both files in parallel in the parser pool
+            result = await analyze_reports(month_year, reports)
+            trace["analysis_id"] = result["analysis_id"]
         
-        # Process real data from uploaded files
-        print(f"Processing real data - 530 success: {report_530_data.get('success')}, 549 success: {report_549_data.get('success')}")
-        charts_data = process_real_data(report_530_data, report_549_data, meta_value)
-        print(f"Charts data generated: {charts_data.get('performance_vs_meta', {}).get('current_performance', 'N/A')}")
-        
-        # AI Analysis
-        ai_analysis = await analyze_with_ai(report_530_data, report_549_data, charts_data)
-        
-        # Save analysis to database
-        analysis = ReportAnalysis(
-            month_year=month_year,
-            report_530_data=report_530_data,
-            report_549_data=report_549_data,
-            ai_analysis=ai_analysis,
-            charts_data=charts_data
-        )
-        
-        # Prepare data for MongoDB (convert datetime objects to strings)
-        analysis_dict = prepare_for_mongo(analysis.dict())
-        await db.report_analyses.insert_one(analysis_dict)
-        
-        return {
+        response = {
             "message": "Relatórios processados com sucesso",
-            "analysis_id": analysis.id,
-            "charts_data": charts_data,
-            "ai_analysis": ai_analysis
+            **result
         }
+        if trace["profile_id"]:
+            response["profile_id"] = trace["profile_id"]
+        return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error processing reports: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar relatórios: {str(e)}")
+    finally:
+        for path in paths:
+            path.unlink(missing_ok=True)
+@api_router.post("/upload-jobs")
+async def create_upload_job(
+    month_year: str = Form(...),
+    report_530: UploadFile = File(...),
+    report_549: UploadFile = File(...),
+    x_profile: bool = Header(False),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Queue both reports for background processing and return the job id right away"""
+    if x_profile:
+        check_admin_token(x_admin_token)
+    JOB_SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    files = []
+    try:
+        for upload, report_type in ((report_530, "530"), (report_549, "549")):
+            path, sha256 = await spool_upload(upload, directory=str(JOB_SPOOL_DIR))
+            files.append({
+                "report_type": report_type,
+                "filename": upload.filename,
+                "path": str(path),
+                "size": path.stat().st_size,
+                "sha256": sha256
+            })
+        dedupe_key = upload_dedupe_key(month_year, files[0]["sha256"], files[1]["sha256"])
+        existing = await find_active_upload_job(dedupe_key)
+        if not existing:
+            job = UploadJob(month_year=month_year, files=files, dedupe_key=dedupe_key, profile=x_profile)
+            try:
+                await database.db.upload_jobs.insert_one(prepare_for_mongo(job.dict()))
+            except DuplicateKeyError:
+                # A concurrent request queued the same files first (dedupe_key_active index)
+                existing = await find_active_upload_job(dedupe_key)
+                if not existing:
+                    raise
+        if existing:
+            for f in files:
+                Path(f["path"]).unlink(missing_ok=True)
+            return format_upload_job(existing)
+    except Exception as e:
+        for f in files:
+            Path(f["path"]).unlink(missing_ok=True)
+        logging.error(f"Error queueing upload job: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar relatórios: {str(e)}")
+    await enqueue_upload_job(job.id)
+    return format_upload_job(prepare_for_mongo(job.dict()))
+@api_router.get("/upload-jobs/{job_id}")
+async def get_upload_job(job_id: str):
+    """Get the status and progress of an upload job"""
+    job = await database.db.upload_jobs.find_one({"id": job_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return format_upload_job(job)
 @api_router.get("/analyses")
-async def get_analyses():
-    """Get all report analyses"""
-    analyses = await db.report_analyses.find().sort("created_at", -1).to_list(100)
-    # Remove _id fields and prepare for serialization
-    cleaned_analyses = []
+async def get_analyses(
+    response: Response,
+    view: str = "full",
+    fields: Optional[str] = None,
+    month_year: Optional[str] = None,
+    limit: int = ANALYSES_PAGE_SIZE,
+    cursor: Optional[str] = None
+):
+    """Get report analyses, newest first.
+
+    view=summary returns only id, month_year, created_at and headline KPIs; the
+    full view leaves out raw report payloads unless listed in fields=. Pages
+    are keyset-based: pass the X-Next-Cursor response header back as cursor.
+    """
+    if view not in ("full", "summary"):
+        raise HTTPException(status_code=400, detail="view deve ser 'full' ou 'summary'")
+    limit = max(1, min(limit, ANALYSES_MAX_PAGE_SIZE))
+    query = {}
+    if month_year:
+        query["month_year"] = month_year
+    if cursor:
+        created_at, analysis_id = decode_analyses_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": analysis_id}}
+        ]
+    analyses = await database.db.report_analyses.find(query, analyses_projection(view, fields)).sort(
+        [("created_at", -1), ("id", -1)]
+    ).limit(limit).batch_size(limit).to_list(limit)
+    if len(analyses) == limit:
+        response.headers["X-Next-Cursor"] = encode_analyses_cursor(analyses[-1])
+    meta_value = await current_meta_value()
     for analysis in analyses:
-        if '_id' in analysis:
-            del analysis['_id']
-        cleaned_analyses.append(analysis)
-    return cleaned_analyses
+        apply_meta(analysis.get("charts_data"), meta_value)
+    return analyses
+@api_router.get("/trends")
+async def get_trends(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    dimension: str = "sellers",
+    top: int = 10
+):
+    """Monthly sales trend from the rollup store: growth, client retention, YTD and a top-N series.
+
+    start/end are months ("YYYY-MM" or "MM/YYYY"); by default the 12 months up to
+    the latest uploaded one. Raw reports are never read.
+    """
+    if dimension not in ROLLUP_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"dimension deve ser uma de: {', '.join(ROLLUP_DIMENSIONS)}")
+    top = max(1, min(top, TREND_MAX_TOP))
+    months = {"start": start, "end": end}
+    for name, value in months.items():
+        if value is not None:
+            months[name] = parse_month_year(value)
+            if months[name] is None:
+                raise HTTPException(status_code=400, detail=f"{name} deve estar no formato AAAA-MM")
+    if months["end"] is None:
+        latest = await database.db.monthly_rollups.find_one({}, {"month": 1}, sort=[("month", -1)])
+        if not latest:
+            return {"months": [], "dimension": dimension, "series": []}
+        months["end"] = latest["month"]
+    if months["start"] is None:
+        months["start"] = shift_month(months["end"], -11)
+    first = min(shift_month(months["start"], -1), f"{months['start'][:4]}-01")
+    rollups = await load_month_rollups(first, months["end"], {"clients", dimension})
+    return compute_trends(rollups, months["start"], dimension, top)
+@api_router.get("/facts")
+async def query_facts(
+    report: str = "530",
+    group_by: Optional[str] = None,
+    metric: str = "value",
+    month_from: Optional[str] = None,
+    month_to: Optional[str] = None,
+    client: Optional[List[str]] = Query(None),
+    product: Optional[List[str]] = Query(None),
+    seller: Optional[List[str]] = Query(None),
+    uf: Optional[List[str]] = Query(None),
+    status: Optional[List[str]] = Query(None),
+    limit: int = FACTS_PAGE_SIZE,
+    offset: int = 0
+):
+    """Drill down into the uploaded rows of the current analysis of each month.
+
+    Report 530 has the client (Cliente) and product (Descrição) dimensions, report
+    549 seller (VENDEDOR EXTERNO), uf (UF) and status (STATUS); both have month.
+    Filters repeat for several values (uf=SP&uf=RJ). group_by=uf,status sums
+    rows/value/qty per group, ordered by metric; without it facts are listed.
+    """
+    if report not in FACT_DIMENSIONS:
+        raise HTTPException(status_code=400, detail="report deve ser '530' ou '549'")
+    dimensions = list(FACT_DIMENSIONS[report]) + ["month"]
+    measures = ["rows", *FACT_MEASURES[report]]
+    if metric not in measures:
+        raise HTTPException(status_code=400, detail=f"metric deve ser uma de: {', '.join(measures)}")
+    fields = [field.strip() for field in group_by.split(",") if field.strip()] if group_by else []
+    for field in fields:
+        if field not in dimensions:
+            raise HTTPException(status_code=400, detail=f"group_by inválido para o relatório {report}: {field}")
+    limit = max(1, min(limit, FACTS_MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    query = {"report": report}
+    filters = {"client": client, "product": product, "seller": seller, "uf": uf, "status": status}
+    for name, values in filters.items():
+        if not values:
+            continue
+        if name not in dimensions:
+            raise HTTPException(status_code=400, detail=f"O relatório {report} não tem o filtro {name}")
+        query[name] = values[0] if len(values) == 1 else {"$in": values}
+    months = {"month_from": month_from, "month_to": month_to}
+    for name, value in months.items():
+        if value is not None:
+            months[name] = parse_month_year(value)
+            if months[name] is None:
+                raise HTTPException(status_code=400, detail=f"{name} deve estar no formato AAAA-MM")
+    current = await load_month_rollups(months["month_from"] or "0000-01", months["month_to"] or "9999-12", ())
+    query["analysis_id"] = {"$in": [rollup["analysis_id"] for rollup in current]}
+    if fields:
+        pipeline = [
+            {"$match": query},
+            {"$group": {"_id": {field: f"${field}" for field in fields}, **{m: {"$sum": f"${m}"} for m in measures}}},
+            {"$sort": {metric: -1, "_id": 1}},
+            {"$skip": offset},
+            {"$limit": limit + 1}
+        ]
+        groups = await database.db.report_facts.aggregate(pipeline, allowDiskUse=True, batchSize=limit + 1).to_list(limit + 1)
+        items = [{**group["_id"], **{m: group[m] for m in measures}} for group in groups]
+    else:
+        projection = {"_id": 0, "analysis_id": 0, "report": 0}
+        items = await database.db.report_facts.find(query, projection).sort(
+            [(metric, -1), ("_id", 1)]
+        ).skip(offset).limit(limit + 1).batch_size(limit + 1).to_list(limit + 1)
+    return {
+        "report": report,
+        "group_by": fields,
+        "metric": metric,
+        "offset": offset,
+        "limit": limit,
+        "has_more": len(items) > limit,
+        "items": items[:limit]
+    }
 @api_router.get("/analyses/{analysis_id}")
-async def get_analysis(analysis_id: str):
-    """Get specific analysis"""
-    analysis = await db.report_analyses.find_one({"id": analysis_id})
+async def get_analysis(analysis_id: str, include_raw: bool = False):
+    """Get specific analysis (raw reports stored outside the document only with include_raw=true)"""
+    analysis = await database.db.report_analyses.find_one({"id": analysis_id})
     if not analysis:
         raise HTTPException(status_code=404, detail="Análise não encontrada")
     
     # Remove _id field
     if '_id' in analysis:
         del analysis['_id']
+    apply_meta(analysis.get("charts_data"), await current_meta_value())
+    if include_raw:
+        for report_type in ("530", "549"):
+            ref = analysis.get(f"report_{report_type}_ref")
+            if ref and f"report_{report_type}_data" not in analysis:
+                analysis[f"report_{report_type}_data"] = await load_raw_report(ref, as_records=True)
     return analysis
+@api_router.get("/analyses/{analysis_id}/charts")
+async def get_analysis_charts(
+    analysis_id: str,
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None)
+):
+    """Dashboard fields of an analysis as a precompressed JSON payload; conditional requests get 304"""
+    payload = await load_charts_payload(analysis_id)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Análise não encontrada")
+    coding = negotiate_charts_encoding(accept_encoding, payload)
+    headers = {
+        "ETag": charts_etag(payload, coding),
+        "Last-Modified": email.utils.format_datetime(payload["generated_at"], usegmt=True),
+        "Cache-Control": "public, no-cache",
+        "Vary": "Accept-Encoding"
+    }
+    if charts_not_modified(payload, if_none_match, if_modified_since):
+        charts_cache_stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    if coding == "identity":
+        body = gzip.decompress(payload["gzip"])
+    else:
+        body = payload[coding]
+        headers["Content-Encoding"] = coding
+    return Response(content=body, media_type="application/json", headers=headers)
+@api_router.post("/analyses/{analysis_id}/recompute")
+async def recompute_analysis_charts(analysis_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Rebuild the charts of an analysis with the current meta, from its cached columns instead of re-parsing"""
+    check_admin_token(x_admin_token)
+    result = await recompute_analysis(analysis_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Análise não encontrada")
+    return result
+@api_router.get("/analyses/{analysis_id}/reports/{report_type}")
+async def get_analysis_report(analysis_id: str, report_type: str):
+    """Get the raw extracted data of one report (530 or 549) of an analysis"""
+    if report_type not in REPORT_LAYOUTS:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado")
+    analysis = await database.db.report_analyses.find_one(
+        {"id": analysis_id},
+        {f"report_{report_type}_data": 1, f"report_{report_type}_ref": 1}
+    )
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Análise não encontrada")
+    if analysis.get(f"report_{report_type}_data") is not None:
+        return analysis[f"report_{report_type}_data"]
+    ref = analysis.get(f"report_{report_type}_ref")
+    if not ref:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado")
+    return await load_raw_report(ref, as_records=True)
+@api_router.post("/admin/recompute-meta")
+async def recompute_meta(x_admin_token: Optional[str] = Header(None)):
+    """Rewrite the stored meta-dependent fields of every analysis for the current meta (one bulk_write, no report is read)"""
+    check_admin_token(x_admin_token)
+    return await recompute_meta_fields()
+@api_router.get("/admin/indexes")
+async def get_index_usage(x_admin_token: Optional[str] = Header(None)):
+    """Index definitions and usage counters for every API collection"""
+    check_admin_token(x_admin_token)
+    return await collect_index_usage()
+@api_router.post("/admin/indexes")
+async def create_missing_indexes(x_admin_token: Optional[str] = Header(None)):
+    """Create any missing index from INDEX_SPECS"""
+    check_admin_token(x_admin_token)
+    return await ensure_indexes()
+@api_router.get("/admin/query-plans")
+async def get_query_plans(x_admin_token: Optional[str] = Header(None)):
+    """Explain plan of the query behind each API route (collection scans flagged)"""
+    check_admin_token(x_admin_token)
+    return await explain_route_queries()
+@api_router.get("/metrics")
+async def get_metrics():
+    """Upload histograms and admission gauges in the Prometheus text format"""
+    return Response(content=render_metrics() + render_admission_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "text", x_admin_token: Optional[str] = Header(None)):
+    """Profile report of an upload made with X-Profile: text (default) or the pstats file (format=pstats)"""
+    check_admin_token(x_admin_token)
+    if format not in ("text", "pstats"):
+        raise HTTPException(status_code=400, detail="Formato inválido (use text ou pstats)")
+    if not re.fullmatch(r"[0-9a-f]{32}", profile_id):
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    path = PROFILE_DIR / f"{profile_id}.{'prof' if format == 'pstats' else 'txt'}"
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    if format == "pstats":
+        return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+    return FileResponse(path, media_type="text/plain; charset=utf-8")
+@api_router.get("/admin/cache")
+async def get_cache_stats(x_admin_token: Optional[str] = Header(None)):
+    """Hit/miss counters of the in-process caches, and the size of the local columnar cache"""
+    check_admin_token(x_admin_token)
+    columnar_entries = await asyncio.to_thread(columnar_cache_entries)
+    return {
+        **memory_cache_stats(),
+        "columnar": {
+            "enabled": COLUMNAR_CACHE,
+            "entries": len(columnar_entries),
+            "bytes": sum(size for _, size, _ in columnar_entries),
+            "capacity_bytes": COLUMNAR_CACHE_MAX_BYTES
+        }
+    }
 # Include the router in the main app
 app.include_router(api_router)
+# Added before CORS so 429 responses get the CORS headers too
+app.add_middleware(UploadAdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified", "Retry-After"],
 )
 # Configure logging
 logging.basicConfig(
@@ -520,6 +671,32 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# Startup work runs in the background so a new worker answers requests right away
+_startup_tasks = set()
+def run_in_background(coroutine):
+    task = asyncio.get_running_loop().create_task(coroutine)
+    _startup_tasks.add(task)
+    task.add_done_callback(_startup_tasks.discard)
+    return task
+async def start_upload_jobs():
+    try:
+        await resume_upload_jobs()
+    except Exception as e:
+        logging.error(f"Could not resume upload jobs: {str(e)}")
+async def start_parser_pool():
+    try:
+        await warm_parser_pool()
+    except Exception as e:
+        logging.error(f"Could not start the parser pool: {str(e)}")
+@app.on_event("startup")
+async def startup_tasks():
+    run_in_background(ensure_indexes())
+    run_in_background(start_upload_jobs())
+    if PARSER_EXECUTOR == 'process' and PARSER_PREWARM:
+        run_in_background(start_parser_pool())
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    database.client.close()
+@app.on_event("shutdown")
+async def shutdown_parser_pool():
+    shutdown_parser_executor()
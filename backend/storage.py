@@ -0,0 +1,141 @@
+"""Raw reports in MongoDB: GridFS blobs and report_rows chunks"""
+from __future__ import annotations
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from bson import ObjectId
+import os
+from typing import List, Dict, Any
+import asyncio
+import json
+import gzip
+import itertools
+import database
+from database import MONGO_CURSOR_BATCH_SIZE
+from parsing import (RAW_REPORT_FORMAT, RAW_REPORT_STORAGE, REPORT_ROWS_PER_DOCUMENT, decode_report_blob,
+                     discard_spooled_rows, sheet_columns, stored_sheet)
+from tracing import count
+# Raw report storage
+RAW_REPORTS_BUCKET = os.environ.get('RAW_REPORTS_BUCKET', 'raw_reports')
+# Inline reports bigger than this (BSON bytes) do not go into the analysis document: their rows are
+# split into report_rows documents of REPORT_ROWS_PER_DOCUMENT rows each, written with insert_many
+INLINE_REPORT_MAX_BYTES = int(os.environ.get('INLINE_REPORT_MAX_BYTES', str(4 * 1024 * 1024)))
+REPORT_ROWS_FORMAT = "row-chunks-v1"
+# Streamed reports spool their rows as report_rows-shaped JSON lines; in GridFS the spool file is the blob
+SPOOLED_ROWS_FORMAT = "row-chunks-jsonl-gzip-v1"
+SPOOLED_ROWS_BATCH_DOCUMENTS = int(os.environ.get('SPOOLED_ROWS_BATCH_DOCUMENTS', '20'))
+_raw_reports_bucket = None
+def get_raw_reports_bucket():
+    """GridFS bucket holding raw report blobs for the current database"""
+    global _raw_reports_bucket
+    if _raw_reports_bucket is None or _raw_reports_bucket[0] is not database.db:
+        _raw_reports_bucket = (database.db, AsyncIOMotorGridFSBucket(database.db, bucket_name=RAW_REPORTS_BUCKET))
+    return _raw_reports_bucket[1]
+async def store_raw_report(analysis_id: str, report_type: str, packed: Dict[str, Any]) -> Dict[str, Any]:
+    """Upload a packed report blob to GridFS and return the reference kept in the analysis"""
+    packed = dict(packed)
+    blob = packed.pop("_blob")
+    count("bytes_out", len(blob), report_type)
+    file_id = await get_raw_reports_bucket().upload_from_stream(
+        f"{analysis_id}_{report_type}.json.gz",
+        blob,
+        metadata={"analysis_id": analysis_id, "report_type": report_type, "format": RAW_REPORT_FORMAT}
+    )
+    packed.update({"file_id": str(file_id), "format": RAW_REPORT_FORMAT, "compressed_size": len(blob)})
+    return packed
+async def store_report_rows(analysis_id: str, report_type: str, report_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Write the rows of an inline report too big for the analysis document as report_rows chunks.
+
+    Every sheet is cut into column-major documents of REPORT_ROWS_PER_DOCUMENT rows,
+    inserted with one unordered insert_many (the driver splits it into wire-size batches).
+    Returns the reference kept in the analysis: the report without its sheets.
+    """
+    rows_key = f"{analysis_id}_{report_type}"
+    documents = []
+    for name, sheet in report_data.get('sheets', {}).items():
+        columns = sheet_columns(sheet)
+        for start in range(0, len(sheet), REPORT_ROWS_PER_DOCUMENT):
+            documents.append({
+                "rows_key": rows_key,
+                "seq": len(documents),
+                "sheet": str(name),
+                "columns": columns["columns"],
+                "data": [values[start:start + REPORT_ROWS_PER_DOCUMENT] for values in columns["data"]]
+            })
+    if documents:
+        await database.db.report_rows.insert_many(documents, ordered=False)
+    ref = {key: value for key, value in report_data.items() if key != 'sheets'}
+    ref["sheet_rows"] = {str(name): len(sheet) for name, sheet in report_data.get('sheets', {}).items()}
+    ref.update({"format": REPORT_ROWS_FORMAT, "rows_key": rows_key, "documents": len(documents)})
+    return ref
+async def load_report_rows(ref: Dict[str, Any], as_records: bool = False) -> Dict[str, Any]:
+    """Inverse of store_report_rows: the report with its sheets as CompactTables (or lists of row dicts)"""
+    report = {key: value for key, value in ref.items() if key not in ("format", "rows_key", "documents", "sheet_rows")}
+    sheets = {name: {} for name in ref.get("sheet_rows", {})}
+    cursor = database.db.report_rows.find({"rows_key": ref["rows_key"]}, {"_id": 0}).sort("seq", 1).batch_size(MONGO_CURSOR_BATCH_SIZE)
+    async for chunk in cursor:
+        _add_row_chunk(sheets, chunk)
+    report["sheets"] = {name: stored_sheet(columns, as_records) for name, columns in sheets.items()}
+    return report
+def _read_spool_lines(source, limit: int) -> List[Dict[str, Any]]:
+    return [json.loads(line) for line in itertools.islice(source, limit)]
+async def store_spooled_rows(analysis_id: str, report_type: str, packed: Dict[str, Any]) -> Dict[str, Any]:
+    """Store the rows spool of a streamed report and return the reference kept in the analysis.
+
+    GridFS storage uploads the spool file as it is (SPOOLED_ROWS_FORMAT); inline storage
+    inserts its lines as report_rows chunks (REPORT_ROWS_FORMAT), SPOOLED_ROWS_BATCH_DOCUMENTS
+    at a time. Either way the rows are read from disk a piece at a time and the file is removed.
+    """
+    ref = dict(packed)
+    spool = ref.pop("_spool")
+    try:
+        if RAW_REPORT_STORAGE != 'inline':
+            size = os.path.getsize(spool["path"])
+            count("bytes_out", size, report_type)
+            with open(spool["path"], "rb") as source:
+                file_id = await get_raw_reports_bucket().upload_from_stream(
+                    f"{analysis_id}_{report_type}.jsonl.gz",
+                    source,
+                    metadata={"analysis_id": analysis_id, "report_type": report_type, "format": SPOOLED_ROWS_FORMAT}
+                )
+            ref.update({"file_id": str(file_id), "format": SPOOLED_ROWS_FORMAT, "compressed_size": size})
+            return ref
+        rows_key = f"{analysis_id}_{report_type}"
+        seq = 0
+        with gzip.open(spool["path"], "rt", encoding="utf-8") as source:
+            while True:
+                documents = await asyncio.to_thread(_read_spool_lines, source, SPOOLED_ROWS_BATCH_DOCUMENTS)
+                if not documents:
+                    break
+                for document in documents:
+                    document.update({"rows_key": rows_key, "seq": seq})
+                    seq += 1
+                await database.db.report_rows.insert_many(documents, ordered=False)
+        ref.update({"format": REPORT_ROWS_FORMAT, "rows_key": rows_key, "documents": seq})
+        return ref
+    finally:
+        await asyncio.to_thread(discard_spooled_rows, spool)
+def _add_row_chunk(sheets: Dict[str, Dict[str, list]], chunk: Dict[str, Any]):
+    columns = sheets.setdefault(chunk["sheet"], {})
+    for name, values in zip(chunk["columns"], chunk["data"]):
+        columns.setdefault(name, []).extend(values)
+def decode_spooled_rows(blob: bytes, ref: Dict[str, Any], as_records: bool = False) -> Dict[str, Any]:
+    """Inverse of store_spooled_rows in GridFS: the report with its sheets as CompactTables (or lists of row dicts)"""
+    report = {key: value for key, value in ref.items() if key not in ("format", "file_id", "compressed_size", "sheet_rows")}
+    sheets = {name: {} for name in ref.get("sheet_rows", {})}
+    for line in gzip.decompress(blob).splitlines():
+        _add_row_chunk(sheets, json.loads(line))
+    report["sheets"] = {name: stored_sheet(columns, as_records) for name, columns in sheets.items()}
+    return report
+async def load_raw_report(ref: Dict[str, Any], as_records: bool = False) -> Dict[str, Any]:
+    """Download and decode a raw report referenced from an analysis (GridFS blob or report_rows chunks)"""
+    if ref.get("format") == REPORT_ROWS_FORMAT:
+        return await load_report_rows(ref, as_records)
+    stream = await get_raw_reports_bucket().open_download_stream(ObjectId(ref["file_id"]))
+    if ref.get("format") == SPOOLED_ROWS_FORMAT:
+        return decode_spooled_rows(await stream.read(), ref, as_records)
+    return decode_report_blob(await stream.read(), as_records)
+async def load_report_data(analysis: Dict[str, Any], report_type: str, as_records: bool = False) -> Dict[str, Any]:
+    """Raw report of an analysis document wherever it is kept: behind its ref (see load_raw_report) or inline; {} if neither"""
+    ref = analysis.get(f"report_{report_type}_ref")
+    if ref:
+        return await load_raw_report(ref, as_records)
+    return analysis.get(f"report_{report_type}_data") or {}
@@ -0,0 +1,189 @@
+"""Upload traces, Prometheus histograms and cProfile reports"""
+from __future__ import annotations
+import os
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any
+import uuid
+import bisect
+import json
+import contextlib
+import contextvars
+import cProfile
+import io
+import pstats
+import time
+from config import ROOT_DIR
+# Instrumentation
+# Each upload carries a trace (a context variable) collecting stage timings, row counts and bytes.
+# Parser jobs run in other processes: run_parser_job gives every job its own trace and merges it back.
+# Metrics live in the process: with several uvicorn workers each one serves its own /api/metrics.
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+ROWS_BUCKETS = (100, 1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+BYTES_BUCKETS = (10_000, 100_000, 1_000_000, 10_000_000, 50_000_000, 100_000_000, 500_000_000)
+METRICS = {
+    "helibombas_upload_seconds": {
+        "help": "Upload processing time", "labels": ("kind", "outcome"), "buckets": SECONDS_BUCKETS
+    },
+    "helibombas_upload_stage_seconds": {
+        "help": "Time spent in each upload stage", "labels": ("stage", "report"), "buckets": SECONDS_BUCKETS
+    },
+    "helibombas_upload_rows": {
+        "help": "Rows parsed per uploaded report", "labels": ("report",), "buckets": ROWS_BUCKETS
+    },
+    "helibombas_upload_bytes": {
+        "help": "Bytes received (in) and written to Mongo (out) per upload", "labels": ("direction", "report"), "buckets": BYTES_BUCKETS
+    }
+}
+_metric_series = {name: {} for name in METRICS}
+_upload_trace = contextvars.ContextVar("upload_trace", default=None)
+# Profiling: cProfile of the request plus every parser job, written to PROFILE_DIR as <id>.prof and <id>.txt
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR') or ROOT_DIR / 'profiles')
+PROFILE_TOP_FUNCTIONS = int(os.environ.get('PROFILE_TOP_FUNCTIONS', '60'))
+_profiling = False
+upload_logger = logging.getLogger("helibombas.upload")
+def observe(metric: str, value: float, *labels: str):
+    """Add one observation to a histogram series"""
+    buckets = METRICS[metric]["buckets"]
+    series = _metric_series[metric].get(labels)
+    if series is None:
+        series = _metric_series[metric][labels] = {"buckets": [0] * (len(buckets) + 1), "sum": 0.0, "count": 0}
+    series["buckets"][bisect.bisect_left(buckets, value)] += 1
+    series["sum"] += value
+    series["count"] += 1
+def _label_text(names, values) -> str:
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+def render_metrics() -> str:
+    """All histograms in the Prometheus text exposition format"""
+    lines = []
+    for name, spec in METRICS.items():
+        lines += [f"# HELP {name} {spec['help']}", f"# TYPE {name} histogram"]
+        for labels, series in sorted(_metric_series[name].items()):
+            label_text = _label_text(spec["labels"], labels)
+            cumulative = 0
+            for bound, count in zip(spec["buckets"] + (None,), series["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound is None else f"{bound:g}"
+                lines.append(f'{name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{label_text}}} {series['sum']:.6f}")
+            lines.append(f"{name}_count{{{label_text}}} {series['count']}")
+    return "\n".join(lines) + "\n"
+def current_trace() -> Optional[Dict[str, Any]]:
+    """Trace of the upload running in this context, None outside traced uploads"""
+    return _upload_trace.get()
+def new_trace(profile_dir: Optional[str] = None) -> Dict[str, Any]:
+    return {"stages": [], "counts": [], "profile_dir": profile_dir, "profile_files": []}
+@contextlib.contextmanager
+def stage(name: str, report: str = ""):
+    """Time a block as one stage of the current upload; a no-op outside traced uploads"""
+    trace = _upload_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace["stages"].append((name, report, time.perf_counter() - start))
+def count(name: str, value: float, report: str = ""):
+    """Record rows or bytes ("rows", "bytes_in", "bytes_out") for the current upload"""
+    trace = _upload_trace.get()
+    if trace is not None:
+        trace["counts"].append((name, report, value))
+def traced_job(func, args, profile_dir: Optional[str]):
+    """Parser pool side of run_parser_job during a traced upload: returns (result, job trace)"""
+    trace = new_trace()
+    token = _upload_trace.set(trace)
+    profiler = cProfile.Profile() if profile_dir else None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        return func(*args), trace
+    finally:
+        _upload_trace.reset(token)
+        if profiler is not None:
+            profiler.disable()
+            path = Path(profile_dir) / f"job-{uuid.uuid4().hex}.prof"
+            profiler.dump_stats(path)
+            trace["profile_files"].append(str(path))
+def merge_trace(trace: Dict[str, Any], job_trace: Dict[str, Any]):
+    for key in ("stages", "counts", "profile_files"):
+        trace[key].extend(job_trace[key])
+def record_trace(trace: Dict[str, Any], seconds: float, outcome: str):
+    """Feed a finished upload trace to the histograms and log it as one JSON line"""
+    observe("helibombas_upload_seconds", seconds, trace["kind"], outcome)
+    stages = {}
+    for name, report, elapsed in trace["stages"]:
+        stages[(name, report)] = stages.get((name, report), 0.0) + elapsed
+    for (name, report), elapsed in stages.items():
+        observe("helibombas_upload_stage_seconds", elapsed, name, report)
+    counts = {}
+    for name, report, value in trace["counts"]:
+        counts[(name, report)] = counts.get((name, report), 0) + value
+    for (name, report), value in counts.items():
+        if name == "rows":
+            observe("helibombas_upload_rows", value, report)
+        else:
+            observe("helibombas_upload_bytes", value, name.removeprefix("bytes_"), report)
+    upload_logger.info(json.dumps({
+        "upload": trace["id"],
+        "kind": trace["kind"],
+        "outcome": outcome,
+        "analysis_id": trace.get("analysis_id"),
+        "seconds": round(seconds, 4),
+        "stages": {f"{name}.{report}" if report else name: round(elapsed, 4) for (name, report), elapsed in stages.items()},
+        "counts": {f"{name}.{report}" if report else name: value for (name, report), value in counts.items()},
+        "profile_id": trace.get("profile_id")
+    }))
+def write_profile_report(trace: Dict[str, Any], profiler: cProfile.Profile, seconds: float):
+    """Merge the request and parser job profiles into <id>.prof and a readable <id>.txt report"""
+    buffer = io.StringIO()
+    buffer.write(f"Upload {trace['id']} ({trace['kind']}), {seconds:.3f}s, analysis {trace.get('analysis_id')}\n\nStages (seconds, summed over reports and jobs):\n")
+    for name, report, elapsed in trace["stages"]:
+        buffer.write(f"  {name:<16} {report:>4} {elapsed:>10.4f}\n")
+    buffer.write("\n")
+    stats = pstats.Stats(profiler, stream=buffer)
+    for path in trace["profile_files"]:
+        stats.add(path)
+        Path(path).unlink(missing_ok=True)
+    stats.dump_stats(PROFILE_DIR / f"{trace['profile_id']}.prof")
+    stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    (PROFILE_DIR / f"{trace['profile_id']}.txt").write_text(buffer.getvalue(), encoding='utf-8')
+@contextlib.asynccontextmanager
+async def traced_upload(kind: str, profile: bool = False):
+    """Trace one upload; with profile, cProfile it too (one profiled upload at a time).
+
+    The request-side profile covers the whole event loop thread, so uploads
+    running at the same time show up in it as well.
+    """
+    global _profiling
+    profiler = None
+    if profile and _profiling:
+        logging.warning("Another upload is being profiled; profiling skipped")
+    elif profile:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        _profiling = True
+        profiler = cProfile.Profile()
+    trace = new_trace(str(PROFILE_DIR) if profiler else None)
+    trace.update(id=uuid.uuid4().hex, kind=kind, profile_id=None)
+    if profiler is not None:
+        trace["profile_id"] = trace["id"]
+    token = _upload_trace.set(trace)
+    outcome = "error"
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield trace
+        outcome = "ok"
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        seconds = time.perf_counter() - start
+        _upload_trace.reset(token)
+        try:
+            record_trace(trace, seconds, outcome)
+            if profiler is not None:
+                write_profile_report(trace, profiler, seconds)
+        finally:
+            if profiler is not None:
+                _profiling = False
@@ -0,0 +1,53 @@
+"""
+Shared setup of the API tests: the backend modules on the in-memory database of
+the benchmarks (benchmarks/fake_mongo.py), with parser jobs run inline and all
+spool and cache directories under one scratch directory.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+SCRATCH_DIR = Path(tempfile.mkdtemp(prefix="helibombas_test_"))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "helibombas_test")
+os.environ.setdefault("PARSER_EXECUTOR", "inline")
+os.environ.setdefault("UPLOAD_SPOOL_DIR", str(SCRATCH_DIR))
+os.environ.setdefault("JOB_SPOOL_DIR", str(SCRATCH_DIR / "jobs"))
+os.environ.setdefault("COLUMNAR_CACHE_DIR", str(SCRATCH_DIR / "columnar_cache"))
+for path in (BACKEND_DIR / "benchmarks", BACKEND_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+import analyses  # noqa: E402
+import fake_mongo  # noqa: E402
+import parsing  # noqa: E402
+import server  # noqa: E402
+import synthetic  # noqa: E402
+
+# The backend logs every request and upload trace at INFO; the test loops run in asyncio debug mode
+logging.disable(logging.INFO)
+logging.getLogger("asyncio").setLevel(logging.ERROR)
+
+
+def install_database():
+    """A fresh in-memory database for the backend, with the in-process caches of the previous one dropped; returns it"""
+    analyses.invalidate_meta_cache()
+    analyses.invalidate_charts_cache()
+    return fake_mongo.install()
+
+
+def api_client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+
+def upload_files(rows=200):
+    """Multipart files of a synthetic 530/549 pair with `rows` rows each"""
+    path_530, path_549 = synthetic.workbook_pair(SCRATCH_DIR, rows)
+    return {"report_530": (path_530.name, path_530.read_bytes()), "report_549": (path_549.name, path_549.read_bytes())}
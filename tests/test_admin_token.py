@@ -0,0 +1,39 @@
+import unittest
+from unittest import mock
+
+from tests.support import api_client, install_database, server
+
+
+class AdminTokenTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        install_database()
+
+    async def get_cache_stats(self, token=None):
+        headers = {"X-Admin-Token": token} if token is not None else {}
+        async with api_client() as api:
+            return (await api.get("/api/admin/cache", headers=headers)).status_code
+
+    async def test_closed_without_a_configured_token(self):
+        for configured in (None, ""):
+            with mock.patch.object(server, "ADMIN_TOKEN", configured):
+                self.assertEqual(await self.get_cache_stats(), 403)
+                self.assertEqual(await self.get_cache_stats(""), 403)
+
+    async def test_token_must_match(self):
+        with mock.patch.object(server, "ADMIN_TOKEN", "s3cret"):
+            self.assertEqual(await self.get_cache_stats(), 403)
+            self.assertEqual(await self.get_cache_stats("s3cre"), 403)
+            self.assertEqual(await self.get_cache_stats("s3cret"), 200)
+
+    async def test_profiled_upload_needs_the_token(self):
+        with mock.patch.object(server, "ADMIN_TOKEN", None):
+            async with api_client() as api:
+                response = await api.post(
+                    "/api/upload-reports", data={"month_year": "2025-01"}, headers={"X-Profile": "true"},
+                    files={"report_530": ("530.xlsx", b""), "report_549": ("549.xlsx", b"")}
+                )
+        self.assertEqual(response.status_code, 403)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from tests.support import api_client, install_database
+
+
+def analysis(index, created_at, month_year="2025-01"):
+    return {
+        "id": f"analysis-{index:02d}",
+        "month_year": month_year,
+        "created_at": created_at,
+        "charts_data": {"kpis": {"total_sales": index}, "monthly_sales": [index]},
+        "ai_analysis": "",
+        "report_530_data": {"sheets": {"sheet1": [{"Cliente": "ACME"}]}}
+    }
+
+
+class AnalysesPagesTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = install_database()
+        # Pairs of analyses share a created_at, so pages must also break ties on id
+        self.analyses = [
+            analysis(index, f"2025-0{1 + index // 2}-10T00:00:00+00:00", "2025-01" if index % 3 else "2025-02")
+            for index in range(9)
+        ]
+        for document in self.analyses:
+            await self.db.report_analyses.insert_one(dict(document))
+        self.newest_first = [a["id"] for a in sorted(self.analyses, key=lambda a: (a["created_at"], a["id"]), reverse=True)]
+
+    async def pages(self, **params):
+        ids, cursor = [], None
+        async with api_client() as api:
+            while True:
+                response = await api.get("/api/analyses", params={**params, **({"cursor": cursor} if cursor else {})})
+                self.assertEqual(response.status_code, 200, response.text)
+                ids.append([item["id"] for item in response.json()])
+                cursor = response.headers.get("X-Next-Cursor")
+                if not cursor:
+                    return ids
+
+    async def test_cursor_walks_every_analysis_once(self):
+        pages = await self.pages(limit=2)
+        self.assertTrue(all(len(page) <= 2 for page in pages))
+        self.assertEqual([analysis_id for page in pages for analysis_id in page], self.newest_first)
+
+    async def test_cursor_with_month_filter(self):
+        pages = await self.pages(limit=2, month_year="2025-02")
+        expected = [analysis_id for analysis_id in self.newest_first if int(analysis_id[-2:]) % 3 == 0]
+        self.assertEqual([analysis_id for page in pages for analysis_id in page], expected)
+
+    async def test_views(self):
+        async with api_client() as api:
+            summary = (await api.get("/api/analyses", params={"view": "summary", "limit": 1})).json()[0]
+            full = (await api.get("/api/analyses", params={"limit": 1})).json()[0]
+            raw = (await api.get("/api/analyses", params={"limit": 1, "fields": "report_530_data"})).json()[0]
+        self.assertEqual(set(summary), {"id", "month_year", "created_at", "charts_data"})
+        self.assertEqual(set(summary["charts_data"]), {"kpis"})
+        self.assertNotIn("report_530_data", full)
+        self.assertIn("monthly_sales", full["charts_data"])
+        self.assertIn("report_530_data", raw)
+
+    async def test_invalid_cursor(self):
+        async with api_client() as api:
+            response = await api.get("/api/analyses", params={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import contextlib
+import io
+import unittest
+
+from tests.support import api_client, install_database, upload_files
+
+import backfill_rollups  # noqa: E402  (backend/ is on sys.path through tests.support)
+
+
+class BackfillRollupsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = install_database()
+        files = upload_files()
+        async with api_client() as api:
+            for month_year in ("2025-01", "2025-02"):
+                response = await api.post("/api/upload-reports", data={"month_year": month_year}, files=files)
+                self.assertEqual(response.status_code, 200, response.text)
+        self.rollups = {doc["_id"]: doc["total_sales"] for doc in self.db.monthly_rollups.docs}
+
+    async def test_limit_counts_only_analyses_without_a_rollup(self):
+        # The oldest analysis keeps its rollup: a limit applied before excluding it would backfill nothing
+        newest = max(self.db.monthly_rollups.docs, key=lambda doc: doc["month"])["_id"]
+        await self.db.monthly_rollups.delete_one({"_id": newest})
+        with contextlib.redirect_stdout(io.StringIO()):
+            await backfill_rollups.backfill(limit=1)
+        self.assertEqual({doc["_id"]: doc["total_sales"] for doc in self.db.monthly_rollups.docs}, self.rollups)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from tests.support import api_client, install_database, upload_files
+
+
+class ChartsPayloadTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        install_database()
+        self.api = api_client()
+        response = await self.api.post("/api/upload-reports", data={"month_year": "2025-01"}, files=upload_files())
+        self.assertEqual(response.status_code, 200, response.text)
+        self.upload = response.json()
+        self.url = f"/api/analyses/{self.upload['analysis_id']}/charts"
+
+    async def asyncTearDown(self):
+        await self.api.aclose()
+
+    async def test_body_and_validators(self):
+        response = await self.api.get(self.url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.json()["charts_data"], self.upload["charts_data"])
+        self.assertTrue(response.headers["ETag"].startswith('"'))
+        self.assertIn("Last-Modified", response.headers)
+        identity = await self.api.get(self.url, headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("Content-Encoding", identity.headers)
+        self.assertNotEqual(identity.headers["ETag"], response.headers["ETag"])
+        self.assertEqual(identity.json(), response.json())
+
+    async def test_conditional_requests(self):
+        first = await self.api.get(self.url, headers={"Accept-Encoding": "gzip"})
+        etag = first.headers["ETag"]
+        for headers in (
+            {"If-None-Match": etag},
+            {"If-None-Match": f'"other", W/{etag}'},
+            {"If-Modified-Since": first.headers["Last-Modified"]},
+        ):
+            response = await self.api.get(self.url, headers={"Accept-Encoding": "gzip", **headers})
+            self.assertEqual(response.status_code, 304, headers)
+            self.assertEqual(response.content, b"")
+            self.assertEqual(response.headers["ETag"], etag)
+        # If-None-Match wins over If-Modified-Since
+        response = await self.api.get(self.url, headers={
+            "If-None-Match": '"other"', "If-Modified-Since": first.headers["Last-Modified"]
+        })
+        self.assertEqual(response.status_code, 200)
+
+    async def test_meta_change_changes_the_etag(self):
+        first = await self.api.get(self.url)
+        response = await self.api.post("/api/meta-config", json={"meta_value": 1234.0})
+        self.assertEqual(response.status_code, 200, response.text)
+        response = await self.api.get(self.url, headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], first.headers["ETag"])
+        self.assertEqual(response.json()["charts_data"]["performance_vs_meta"]["meta_target"], 1234.0)
+
+    async def test_unknown_analysis(self):
+        response = await self.api.get("/api/analyses/missing/charts")
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
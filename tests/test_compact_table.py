@@ -0,0 +1,65 @@
+import unittest
+
+from tests.support import parsing, synthetic
+
+CompactTable = parsing.CompactTable
+
+
+class CompactTableTest(unittest.TestCase):
+    records = [
+        {"Cliente": "ACME", "Qtde": 2, "Vlr.Total": 10.5},
+        {"Cliente": "", "Qtde": "", "Vlr.Total": 3.25},
+        {"Cliente": "ACME", "Qtde": 1, "Vlr.Total": ""},
+        {"Cliente": "BETA", "Qtde": 5, "Vlr.Total": 0},
+    ]
+
+    def test_records_round_trip(self):
+        table = CompactTable.from_records(self.records)
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.columns, ["Cliente", "Qtde", "Vlr.Total"])
+        self.assertEqual(table.records(), self.records)
+        self.assertEqual([dict(row) for row in table], self.records)
+        self.assertEqual(dict(table[-1]), self.records[-1])
+        self.assertEqual([dict(row) for row in table[1:3]], self.records[1:3])
+        with self.assertRaises(IndexError):
+            table[4]
+
+    def test_text_is_dictionary_encoded_and_numbers_typed(self):
+        table = CompactTable.from_records(self.records)
+        codes, dictionary = table._columns["Cliente"]
+        self.assertEqual(codes.dtype, parsing.np.int8)
+        # Each distinct text is stored once, plus the trailing blank entry
+        self.assertEqual(dictionary.tolist()[:-1].count("ACME"), 1)
+        self.assertEqual([dictionary[code] for code in codes.tolist()], ["ACME", "", "ACME", "BETA"])
+        self.assertEqual(table.column("Vlr.Total").dtype, parsing.np.float64)
+        self.assertTrue(parsing.np.isnan(table.column("Vlr.Total")[2]))
+
+    def test_frame_round_trip(self):
+        table = CompactTable.from_records(self.records)
+        frame = table.to_frame()
+        self.assertEqual(CompactTable.from_frame(frame).records(), self.records)
+        self.assertEqual(table.records(missing=None)[2]["Vlr.Total"], None)
+
+    def test_stored_blob_round_trip(self):
+        records = synthetic.records_530(500)
+        report_data = {"sheets": {"sheet1": CompactTable.from_records(records)}, "success": True}
+        decoded = parsing.decode_report_blob(parsing.encode_report_blob(report_data))
+        self.assertIsInstance(decoded["sheets"]["sheet1"], CompactTable)
+        self.assertEqual(decoded["sheets"]["sheet1"].records(), records)
+        self.assertEqual(parsing.decode_report_blob(parsing.encode_report_blob(report_data), as_records=True)["sheets"]["sheet1"], records)
+
+    def test_aggregates_match_row_dicts(self):
+        records = synthetic.records_530(1000)
+        charts = parsing.process_real_data(
+            {"sheets": {"sheet1": CompactTable.from_records(records)}, "success": True},
+            {"sheets": {"Planilha1": synthetic.records_549(1000)}, "success": True}, 1000.0
+        )
+        expected = parsing.process_real_data(
+            {"sheets": {"sheet1": records}, "success": True},
+            {"sheets": {"Planilha1": synthetic.records_549(1000)}, "success": True}, 1000.0
+        )
+        self.assertEqual(charts, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
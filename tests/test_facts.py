@@ -0,0 +1,71 @@
+import collections
+import unittest
+
+from tests.support import api_client, install_database, synthetic, upload_files
+
+ROWS = 200
+
+
+class FactsQueryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        install_database()
+        self.api = api_client()
+        for month_year in ("2025-01", "2025-02"):
+            await self.upload(month_year, upload_files(ROWS))
+
+    async def asyncTearDown(self):
+        await self.api.aclose()
+
+    async def upload(self, month_year, files):
+        response = await self.api.post("/api/upload-reports", data={"month_year": month_year}, files=files)
+        self.assertEqual(response.status_code, 200, response.text)
+
+    async def facts(self, **params):
+        response = await self.api.get("/api/facts", params=params)
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.json()
+
+    async def test_group_by_one_dimension(self):
+        expected_rows, expected_value = collections.Counter(), collections.Counter()
+        for row in synthetic.iter_rows_549(ROWS):
+            expected_rows[row["UF"]] += 2  # Two months of the same file
+            expected_value[row["UF"]] += 2 * (row["VLR. TOTAL"] or 0)
+        result = await self.facts(report="549", group_by="uf", metric="rows", limit=100)
+        self.assertEqual(result["group_by"], ["uf"])
+        self.assertFalse(result["has_more"])
+        self.assertEqual({item["uf"]: item["rows"] for item in result["items"]}, dict(expected_rows))
+        for item in result["items"]:
+            self.assertAlmostEqual(item["value"], expected_value[item["uf"]], places=4)
+        counts = [item["rows"] for item in result["items"]]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+
+    async def test_group_by_month_and_filters(self):
+        by_month = await self.facts(report="549", group_by="month", metric="rows")
+        self.assertEqual({item["month"]: item["rows"] for item in by_month["items"]}, {"2025-01": ROWS, "2025-02": ROWS})
+        filtered = await self.facts(report="549", group_by="uf,status", uf=["SP", "RJ"], month_from="2025-02", limit=100)
+        self.assertTrue(filtered["items"])
+        self.assertEqual({item["uf"] for item in filtered["items"]}, {"SP", "RJ"})
+        expected = sum(1 for row in synthetic.iter_rows_549(ROWS) if row["UF"] in ("SP", "RJ"))
+        self.assertEqual(sum(item["rows"] for item in filtered["items"]), expected)
+
+    async def test_group_pages(self):
+        whole = await self.facts(report="530", group_by="client", limit=1000)
+        first = await self.facts(report="530", group_by="client", limit=10)
+        second = await self.facts(report="530", group_by="client", limit=10, offset=10)
+        self.assertTrue(first["has_more"])
+        self.assertEqual(first["items"] + second["items"], whole["items"][:20])
+
+    async def test_replaced_month_only_counts_the_new_upload(self):
+        await self.upload("2025-01", upload_files(ROWS // 2))
+        by_month = await self.facts(report="530", group_by="month", metric="rows")
+        self.assertEqual({item["month"]: item["rows"] for item in by_month["items"]}, {"2025-01": ROWS // 2, "2025-02": ROWS})
+
+    async def test_rejects_dimensions_of_the_other_report(self):
+        response = await self.api.get("/api/facts", params={"report": "530", "group_by": "uf"})
+        self.assertEqual(response.status_code, 400)
+        response = await self.api.get("/api/facts", params={"report": "549", "client": "ACME"})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,23 @@
+import unittest
+
+from tests.support import parsing
+
+
+class LazyModuleTest(unittest.TestCase):
+    def test_module_attributes_named_like_its_methods(self):
+        import numpy
+
+        lazy = parsing.LazyModule("numpy", "np")
+        self.assertIs(lazy.load, numpy.load)
+        self.assertIs(parsing.np, numpy)
+
+    def test_first_access_rebinds_the_name(self):
+        import pandas
+
+        lazy = parsing.LazyModule("pandas", "pd")
+        self.assertIs(lazy.DataFrame, pandas.DataFrame)
+        self.assertIs(parsing.pd, pandas)
+
+
+if __name__ == "__main__":
+    unittest.main()
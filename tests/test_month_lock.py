@@ -0,0 +1,57 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from tests.support import analyses, api_client, install_database, upload_files
+
+
+class MonthLockTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = install_database()
+        self.files = upload_files()
+
+    async def upload(self, api, month_year):
+        return await api.post("/api/upload-reports", data={"month_year": month_year}, files=self.files)
+
+    async def concurrent_spellings(self):
+        async with api_client() as api:
+            responses = await asyncio.gather(self.upload(api, "2025-01"), self.upload(api, "01/2025"))
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        results = [response.json() for response in responses]
+        self.assertEqual(results[0]["analysis_id"], results[1]["analysis_id"])
+        self.assertEqual(sorted(bool(result.get("cached")) for result in results), [False, True])
+        self.assertEqual(await self.db.report_analyses.count_documents({}), 1)
+        self.assertEqual(await self.db.monthly_rollups.count_documents({}), 1)
+
+    async def test_concurrent_spellings_share_one_analysis(self):
+        for backend in ("mongo", "local"):
+            with self.subTest(backend=backend), mock.patch.object(analyses, "MONTH_LOCK", backend):
+                self.db = install_database()
+                await self.concurrent_spellings()
+                self.assertEqual(await self.db.month_locks.count_documents({}), 0)
+                self.assertEqual(analyses._month_locks, {})
+
+    async def test_lock_key_is_the_normalized_month(self):
+        async with analyses.month_lock("01/2025"):
+            self.assertEqual(list(analyses._month_locks), ["2025-01"])
+            self.assertIsNotNone(await self.db.month_locks.find_one({"_id": "2025-01"}))
+
+    async def test_waiting_past_the_timeout_answers_429(self):
+        with mock.patch.object(analyses, "MONTH_LOCK_TIMEOUT_SECONDS", 0.2):
+            async with analyses.month_lock("2025-01"):
+                async with api_client() as api:
+                    response = await self.upload(api, "01/2025")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+        self.assertEqual(await self.db.report_analyses.count_documents({}), 0)
+
+    async def test_expired_lease_is_taken_over(self):
+        with mock.patch.object(analyses, "MONTH_LOCK_LEASE_SECONDS", -1):
+            owner = await analyses.acquire_month_lease("2025-01", 0)
+        taken = await analyses.acquire_month_lease("2025-01", 0)
+        self.assertNotEqual(taken, owner)
+        self.assertEqual((await self.db.month_locks.find_one({"_id": "2025-01"}))["owner"], taken)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import sys
+import unittest
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "helibombas_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import pandas as pd  # noqa: E402
+
+from parsing import convert_number_column  # noqa: E402
+
+
+class ConvertNumberColumnTest(unittest.TestCase):
+    def convert(self, *values):
+        numbers, bad = convert_number_column(pd.Series(list(values), dtype=object))
+        return numbers.tolist(), bad.tolist()
+
+    def test_dots_grouping_thousands(self):
+        self.assertEqual(self.convert("1.234.567", "1.234"), ([1234567.0, 1234.0], [False, False]))
+
+    def test_decimal_comma(self):
+        self.assertEqual(self.convert("1.234,56", "1,5"), ([1234.56, 1.5], [False, False]))
+
+    def test_currency(self):
+        self.assertEqual(self.convert("R$ 2.500,00"), ([2500.0], [False]))
+
+    def test_plain_numbers(self):
+        self.assertEqual(self.convert("1234.56", "-1.5", 7), ([1234.56, -1.5, 7.0], [False, False, False]))
+
+    def test_bad_and_blank_cells(self):
+        numbers, bad = self.convert("dois", "")
+        self.assertTrue(pd.isna(numbers).all())
+        self.assertEqual(bad, [True, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
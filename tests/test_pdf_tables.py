@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+
+from tests.support import SCRATCH_DIR, parsing, synthetic
+
+ROWS = 120
+
+
+def expected_rows(report_type):
+    """Synthetic rows as the typed PDF table holds them: numbers as floats, blank numbers as None"""
+    rows = synthetic.iter_rows_530(ROWS) if report_type == "530" else synthetic.iter_rows_549(ROWS)
+    numeric = ("Qtde", "Vlr.Total", "VLR. TOTAL")
+    return [
+        {name: (None if value == "" else float(value)) if name in numeric else value for name, value in row.items()}
+        for row in rows
+    ]
+
+
+class PdfTableTest(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.paths = {}
+        for report_type in ("530", "549"):
+            rows = synthetic.iter_rows_530(ROWS) if report_type == "530" else synthetic.iter_rows_549(ROWS)
+            # 50 rows per page: three pages, the header repeated on each, a Total line after the last row
+            cls.paths[report_type] = synthetic.write_pdf_report(SCRATCH_DIR / f"table_{report_type}.pdf", report_type, rows)
+
+    def table(self, report_type):
+        report_data = parsing.extract_pdf_data(self.paths[report_type].read_bytes(), report_type)
+        self.assertTrue(report_data["success"])
+        self.assertEqual(report_data["page_count"], 3)
+        sheet = report_data["sheets"][parsing.REPORT_LAYOUTS[report_type]["sheet"]]
+        return report_data, [
+            {name: None if value != value else value for name, value in row.items()}  # NaN
+            for row in sheet.to_dict("records")
+        ]
+
+    def test_rebuilds_the_530_table(self):
+        report_data, rows = self.table("530")
+        self.assertEqual(rows, expected_rows("530"))
+        self.assertEqual(report_data["bad_rows"]["count"], 0)
+
+    def test_rebuilds_the_549_table(self):
+        report_data, rows = self.table("549")
+        self.assertEqual(rows, expected_rows("549"))
+        self.assertEqual(report_data["bad_rows"]["count"], 0)
+
+    def test_pt_br_numbers(self):
+        self.assertEqual(parsing.parse_pdf_number("1.234.567,89"), 1234567.89)
+        self.assertEqual(parsing.parse_pdf_number("0,50"), 0.5)
+
+    async def test_page_ranges_match_the_whole_document(self):
+        whole = parsing.extract_pdf_pages(self.paths["530"], "530")
+        with mock.patch.object(parsing, "PDF_PAGES_PER_JOB", 1):
+            _, aggregates = await parsing.parse_pdf_report(self.paths["530"], "530.pdf", "530")
+        self.assertEqual(aggregates["row_count"], ROWS)
+        self.assertEqual(aggregates["clients"].keys(), whole["aggregates"]["clients"].keys())
+        for client, total in whole["aggregates"]["clients"].items():
+            self.assertAlmostEqual(aggregates["clients"][client], total, places=6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from tests.support import analyses, api_client, install_database, server, upload_files
+
+
+class UploadAdmissionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        install_database()
+        self.files = upload_files()
+
+    async def upload(self, api, month_year="2025-01"):
+        return await api.post("/api/upload-reports", data={"month_year": month_year}, files=self.files)
+
+    async def saturated(self, api):
+        """Response to a second upload sent while a first one waits on the month lock"""
+        async with analyses.month_lock("2025-01"):
+            first = asyncio.create_task(self.upload(api))
+            while server._admission["uploads"] < 1:
+                await asyncio.sleep(0.01)
+            second = await self.upload(api, "2025-02")
+        self.assertEqual((await first).status_code, 200)
+        return second
+
+    async def test_rejects_past_the_upload_limit(self):
+        rejected = server.admission_stats["rejected"]
+        with mock.patch.object(server, "UPLOAD_MAX_IN_FLIGHT", 1):
+            async with api_client() as api:
+                response = await self.saturated(api)
+                self.assertEqual(response.status_code, 429)
+                self.assertEqual(response.headers["Retry-After"], str(analyses.UPLOAD_RETRY_AFTER_SECONDS))
+                self.assertEqual(server.admission_stats["rejected"], rejected + 1)
+                # Room again once the first upload is done
+                self.assertEqual((await self.upload(api, "2025-02")).status_code, 200)
+        self.assertEqual(server._admission, {"uploads": 0, "bytes": 0})
+
+    async def test_rejects_past_the_byte_limit(self):
+        # Smaller than one upload: the first is still admitted on an idle worker, the second is not
+        with mock.patch.object(server, "UPLOAD_MAX_IN_FLIGHT_BYTES", 1024):
+            async with api_client() as api:
+                response = await self.saturated(api)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(server._admission, {"uploads": 0, "bytes": 0})
+
+    async def test_other_routes_are_not_limited(self):
+        with mock.patch.object(server, "UPLOAD_MAX_IN_FLIGHT", 1), mock.patch.dict(server._admission, uploads=1):
+            async with api_client() as api:
+                self.assertEqual((await api.get("/api/meta-config")).status_code, 200)
+                self.assertEqual((await self.upload(api)).status_code, 429)
+
+
+if __name__ == "__main__":
+    unittest.main()
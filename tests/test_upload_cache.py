@@ -0,0 +1,48 @@
+import unittest
+
+from tests.support import analyses, api_client, install_database, upload_files
+
+
+class UploadCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = install_database()
+        self.files = upload_files()
+
+    async def upload(self, month_year, files=None):
+        async with api_client() as api:
+            response = await api.post("/api/upload-reports", data={"month_year": month_year}, files=files or self.files)
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.json()
+
+    def test_content_key_normalizes_the_month(self):
+        key = analyses.analysis_content_key("2025-01", "a", "b")
+        self.assertEqual(analyses.analysis_content_key("01/2025", "a", "b"), key)
+        self.assertEqual(analyses.analysis_content_key(" 1/2025 ", "a", "b"), key)
+        self.assertNotEqual(analyses.analysis_content_key("2025-02", "a", "b"), key)
+        self.assertNotEqual(analyses.analysis_content_key("2025-01", "a", "c"), key)
+
+    async def test_identical_upload_reuses_the_analysis(self):
+        first = await self.upload("2025-01")
+        second = await self.upload("01/2025")
+        self.assertFalse(first.get("cached"))
+        self.assertTrue(second["cached"])
+        self.assertEqual(second["analysis_id"], first["analysis_id"])
+        self.assertEqual(await self.db.report_analyses.count_documents({}), 1)
+
+    async def test_other_month_is_not_reused(self):
+        first = await self.upload("2025-01")
+        second = await self.upload("2025-02")
+        self.assertFalse(second.get("cached"))
+        self.assertNotEqual(second["analysis_id"], first["analysis_id"])
+
+    async def test_changed_file_reparses_only_that_file(self):
+        await self.upload("2025-01")
+        parsed = await self.db.parsed_reports.count_documents({})
+        other_530 = upload_files(rows=150)["report_530"]
+        second = await self.upload("2025-01", dict(self.files, report_530=other_530))
+        self.assertFalse(second.get("cached"))
+        self.assertEqual(await self.db.parsed_reports.count_documents({}), parsed + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()